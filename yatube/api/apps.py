@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    """
+    Настройка конфигурации приложения.
+    """
+    name = 'api'
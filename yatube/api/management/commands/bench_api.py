@@ -0,0 +1,73 @@
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from api import views as api_views
+from posts import feed
+from posts import views as html_views
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает страницы ленты в HTML и в JSON API: время
+    представления без кэша страниц и размер ответа.
+
+    Данные создаются внутри транзакции и откатываются в конце.
+    """
+    help = 'Бенчмарк ленты: HTML-страница против JSON API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with override_settings(LAST_POSTS=options['page_size']):
+            with transaction.atomic():
+                self.run(**options)
+                transaction.set_rollback(True)
+
+    def run(self, posts, repeat, **options):
+        author = User.objects.create(
+            username='bench_api_author', first_name='Автор')
+        group = Group.objects.create(
+            title='Бенчмарк', slug='bench-api', description='')
+        Post.objects.bulk_create(
+            (Post(author=author, group=group, text=f'Пост номер {i}. ' * 5)
+             for i in range(posts)),
+            batch_size=feed.BATCH_SIZE,
+        )
+        factory = RequestFactory()
+        cases = (
+            ('HTML, главная', html_views.index, '/', {}),
+            ('JSON, все посты', api_views.index, '/api/v1/posts/', {}),
+            ('JSON, ?fields=id,text', api_views.index, '/api/v1/posts/',
+             {'fields': 'id,text'}),
+            ('HTML, группа', html_views.group_posts, '/group/bench-api/',
+             {}),
+            ('JSON, группа', api_views.group_posts,
+             '/api/v1/groups/bench-api/posts/', {}),
+        )
+        self.stdout.write(f'Постов: {posts}, повторов: {repeat}')
+        for name, view, path, params in cases:
+            kwargs = {'slug': group.slug} if 'bench-api' in path else {}
+            started = perf_counter()
+            for _ in range(repeat):
+                cache.clear()
+                request = factory.get(path, params)
+                request.user = AnonymousUser()
+                response = view(request, **kwargs)
+            elapsed = (perf_counter() - started) / repeat
+            self.stdout.write(
+                f'{name}: {elapsed * 1000:.2f} мс, '
+                f'{len(response.content)} байт'
+            )
@@ -0,0 +1,77 @@
+from posts.storage import post_images
+
+# Поле ответа -> колонки values(), из которых оно собирается.
+POST_FIELDS = {
+    'id': ('id',),
+    'text': ('text',),
+    'pub_date': ('pub_date',),
+    'author': ('author__username',),
+    'group': ('group__slug',),
+    'comments_count': ('comments_count',),
+    'image': ('image',),
+    'thumbnail': (
+        'thumbnail_url',
+        'thumbnail_width',
+        'thumbnail_height',
+        'thumbnail_srcset',
+    ),
+}
+COMMENT_COLUMNS = ('id', 'text', 'created', 'author__username')
+
+
+class UnknownFields(ValueError):
+    """В ?fields= есть поля, которых нет у поста."""
+
+
+def post_fields(value):
+    """
+    Вернет поля поста из строки ?fields=, по умолчанию все.
+    Неизвестные поля вызывают UnknownFields.
+    """
+    if not value:
+        return list(POST_FIELDS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in POST_FIELDS]
+    if unknown:
+        raise UnknownFields(', '.join(unknown))
+    return fields
+
+
+def post_columns(fields):
+    """Вернет колонки values() для полей поста."""
+    return [column for name in fields for column in POST_FIELDS[name]]
+
+
+def _thumbnail(row):
+    if not row['thumbnail_url']:
+        return None
+    return {
+        'url': row['thumbnail_url'],
+        'width': row['thumbnail_width'],
+        'height': row['thumbnail_height'],
+        'srcset': row['thumbnail_srcset'],
+    }
+
+
+def post(row, fields):
+    """Соберет словарь поста из строки values() с полями fields."""
+    data = {}
+    for name in fields:
+        if name == 'thumbnail':
+            data[name] = _thumbnail(row)
+        elif name == 'image':
+            image = row['image']
+            data[name] = post_images.url(image) if image else None
+        else:
+            data[name] = row[POST_FIELDS[name][0]]
+    return data
+
+
+def comment(row):
+    """Соберет словарь комментария из строки values()."""
+    return {
+        'id': row['id'],
+        'text': row['text'],
+        'created': row['created'],
+        'author': row['author__username'],
+    }
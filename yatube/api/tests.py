@@ -0,0 +1,156 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.queries import record_queries
+from core.testing import assert_query_budget
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(LAST_POSTS=2, LAST_COMMENTS=2)
+class FeedApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        cls.post = cls.posts[-1]
+        for i in range(3):
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text=f'Коммент {i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_feeds(self):
+        """Ленты отдают новые посты первыми и ссылку на следующую страницу."""
+        urls = (
+            reverse('api:index'),
+            reverse('api:group_posts', kwargs={'slug': 'test_slug'}),
+            reverse('api:profile', kwargs={'username': 'author'}),
+            reverse('api:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.reader_client.get(url).json()
+                self.assertEqual(
+                    [post['id'] for post in data['results']],
+                    [self.posts[2].id, self.posts[1].id],
+                )
+                older = self.reader_client.get(data['next']).json()
+                self.assertEqual(
+                    [post['id'] for post in older['results']],
+                    [self.posts[0].id],
+                )
+                self.assertIsNone(older['next'])
+                newer = self.reader_client.get(older['previous']).json()
+                self.assertEqual(newer['results'], data['results'])
+
+    def test_post_fields(self):
+        """Пост отдается всеми полями, без картинки — с null."""
+        data = self.guest_client.get(reverse('api:index')).json()
+        self.assertEqual(data['results'][0], {
+            'id': self.post.id,
+            'text': 'Пост 2',
+            'pub_date': data['results'][0]['pub_date'],
+            'author': 'author',
+            'group': 'test_slug',
+            'comments_count': 3,
+            'image': None,
+            'thumbnail': None,
+        })
+
+    def test_sparse_fields(self):
+        """?fields= оставляет только перечисленные поля и в ссылках."""
+        response = self.guest_client.get(
+            reverse('api:index'), {'fields': 'text,author'})
+        data = response.json()
+        self.assertEqual(
+            data['results'][0], {'text': 'Пост 2', 'author': 'author'})
+        self.assertIn('fields=text%2Cauthor', data['next'])
+
+    def test_unknown_fields(self):
+        """Неизвестное поле в ?fields= — ошибка 400."""
+        response = self.guest_client.get(
+            reverse('api:index'), {'fields': 'text,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('password', response.json()['detail'])
+
+    def test_not_found(self):
+        """Несуществующие группа, автор и пост — ошибка 404 в JSON."""
+        urls = (
+            reverse('api:group_posts', kwargs={'slug': 'missing'}),
+            reverse('api:profile', kwargs={'username': 'missing'}),
+            reverse('api:post_detail', kwargs={'post_id': 0}),
+            reverse('api:post_comments', kwargs={'post_id': 0}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertEqual(response.status_code, 404)
+                self.assertIn('detail', response.json())
+
+    def test_follow_requires_login(self):
+        """Лента подписок гостю недоступна."""
+        response = self.guest_client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_post_detail_with_comments(self):
+        """Пост отдается с первой страницей комментариев."""
+        url = reverse('api:post_detail', kwargs={'post_id': self.post.id})
+        data = self.guest_client.get(url, {'fields': 'id'}).json()
+        self.assertEqual(data['id'], self.post.id)
+        self.assertNotIn('text', data)
+        comments = data['comments']
+        self.assertEqual(
+            [comment['text'] for comment in comments['results']],
+            ['Коммент 2', 'Коммент 1'],
+        )
+        older = self.guest_client.get(comments['next']).json()
+        self.assertEqual(
+            [comment['text'] for comment in older['results']], ['Коммент 0'])
+
+    def test_read_only(self):
+        """API принимает только GET."""
+        response = self.reader_client.post(reverse('api:index'))
+        self.assertEqual(response.status_code, 405)
+
+    def test_query_budget(self):
+        """Ответы укладываются в бюджет запросов без N+1."""
+        urls = (
+            reverse('api:index'),
+            reverse('api:group_posts', kwargs={'slug': 'test_slug'}),
+            reverse('api:profile', kwargs={'username': 'author'}),
+            reverse('api:follow_index'),
+            reverse('api:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                assert_query_budget(self.reader_client, url)
+
+    def test_anonymous_responses_cached(self):
+        """Повторный ответ гостю отдается из кэша без запросов."""
+        url = reverse('api:index')
+        first = self.guest_client.get(url)
+        with record_queries() as log:
+            second = self.guest_client.get(url)
+        self.assertEqual(len(log), 0)
+        self.assertEqual(first.content, second.content)
@@ -0,0 +1,36 @@
+from django.urls import path
+
+from core.queries import query_budget
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', query_budget(views.index, 1), name='index'),
+    path(
+        'groups/<slug:slug>/posts/',
+        query_budget(views.group_posts, 2),
+        name='group_posts'
+    ),
+    path(
+        'profiles/<str:username>/posts/',
+        query_budget(views.profile, 2),
+        name='profile'
+    ),
+    path(
+        'follow/posts/',
+        query_budget(views.follow_index, 4),
+        name='follow_index'
+    ),
+    path(
+        'posts/<int:post_id>/',
+        query_budget(views.post_detail, 2),
+        name='post_detail'
+    ),
+    path(
+        'posts/<int:post_id>/comments/',
+        query_budget(views.post_comments, 2),
+        name='post_comments'
+    ),
+]
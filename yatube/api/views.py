@@ -0,0 +1,168 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from posts import archive, caching, feed
+from posts.models import Comment, Group, Post
+from posts.paginator import CursorPaginator, decode_cursor
+
+from . import serializers
+
+User = get_user_model()
+
+JSON_PARAMS = {'ensure_ascii': False}
+
+
+def _response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def _error(detail, status):
+    return _response({'detail': detail}, status=status)
+
+
+def _link(request, name, cursor):
+    """
+    Вернет адрес соседней страницы с курсором в параметре name,
+    сохранив остальные параметры запроса.
+    """
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[name] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def _page(request, rows, per_page, field='pub_date'):
+    """Вернет страницу строк values() по курсору из запроса."""
+    paginator = CursorPaginator(
+        rows,
+        per_page,
+        after=decode_cursor(request.GET.get('after')),
+        before=decode_cursor(request.GET.get('before')),
+        field=field,
+    )
+    return paginator.page()
+
+
+def _posts(request, posts):
+    """
+    Вернет страницу постов в полях из ?fields=.
+
+    posts — запрос к постам или лента с методом values().
+    """
+    try:
+        fields = serializers.post_fields(request.GET.get('fields'))
+    except serializers.UnknownFields as error:
+        return _error(f'Неизвестные поля: {error}.', 400)
+    columns = serializers.post_columns(fields)
+    if isinstance(posts, feed.MergedFeed):
+        rows = posts.values(*columns)
+    else:
+        rows = posts.values(*columns, 'id', 'pub_date')
+    page = _page(request, rows, settings.LAST_POSTS)
+    return _response({
+        'results': [serializers.post(row, fields) for row in page],
+        'next': _link(request, 'after', page.next_cursor),
+        'previous': _link(request, 'before', page.previous_cursor),
+    })
+
+
+@require_GET
+def index(request):
+    """Вернет последние посты всех авторов."""
+    caching.cache_page_scopes(request, 'global')
+    return _posts(request, feed.scatter(Post.objects.all()))
+
+
+@require_GET
+def group_posts(request, slug):
+    """Вернет последние посты группы."""
+    group_id = Group.objects.filter(
+        slug=slug).values_list('id', flat=True).first()
+    if group_id is None:
+        return _error('Группа не найдена.', 404)
+    caching.cache_page_scopes(request, f'group:{group_id}')
+    return _posts(
+        request, feed.scatter(Post.objects.filter(group_id=group_id)))
+
+
+@require_GET
+def profile(request, username):
+    """Вернет последние посты автора."""
+    author_id = User.objects.filter(
+        username=username).values_list('id', flat=True).first()
+    if author_id is None:
+        return _error('Автор не найден.', 404)
+    caching.cache_page_scopes(request, f'author:{author_id}')
+    return _posts(request, feed.archived(
+        Post.objects.on_author(author_id).filter(author_id=author_id)))
+
+
+@require_GET
+def follow_index(request):
+    """Вернет ленту подписок текущего пользователя."""
+    if not request.user.is_authenticated:
+        return _error('Нужно войти на сайт.', 401)
+    return _posts(request, feed.follow_feed(request.user))
+
+
+def _comments(request, post_id, using):
+    """
+    Вернет страницу комментариев поста из базы using
+    со ссылкой на следующую.
+    """
+    page = _page(
+        request,
+        Comment.objects.using(using).filter(
+            post_id=post_id).values(*serializers.COMMENT_COLUMNS),
+        settings.LAST_COMMENTS,
+        field='created',
+    )
+    next_link = None
+    if page.next_cursor is not None:
+        path = reverse('api:post_comments', kwargs={'post_id': post_id})
+        next_link = f'{path}?after={page.next_cursor}'
+    return {
+        'results': [serializers.comment(row) for row in page],
+        'next': next_link,
+    }
+
+
+@require_GET
+def post_detail(request, post_id):
+    """Вернет пост в полях из ?fields= и первую страницу комментариев."""
+    try:
+        fields = serializers.post_fields(request.GET.get('fields'))
+    except serializers.UnknownFields as error:
+        return _error(f'Неизвестные поля: {error}.', 400)
+    row, using = archive.first(
+        Post.objects.on_post(post_id).filter(pk=post_id).values(
+            *serializers.post_columns(fields), 'author_id', 'group_id'))
+    if row is None:
+        return _error('Пост не найден.', 404)
+    caching.cache_page_scopes(
+        request,
+        f'post:{post_id}',
+        f'author:{row["author_id"]}',
+        f'group:{row["group_id"]}',
+    )
+    return _response({
+        **serializers.post(row, fields),
+        'comments': _comments(request, post_id, using),
+    })
+
+
+@require_GET
+def post_comments(request, post_id):
+    """Вернет страницу комментариев поста по курсору ?after=."""
+    found, using = archive.first(
+        Post.objects.on_post(post_id).filter(pk=post_id).values('id'))
+    if found is None:
+        return _error('Пост не найден.', 404)
+    caching.cache_page_scopes(request, f'post:{post_id}')
+    return _response(_comments(request, post_id, using))
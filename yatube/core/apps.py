@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
@@ -6,3 +7,8 @@ class CoreConfig(AppConfig):
     Настройка конфигурации приложения.
     """
     name = 'core'
+
+    def ready(self):
+        """Подключает настройку новых соединений SQLite."""
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite)
@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import django
+from django.db import connections
+
+
+def init_worker():
+    """Подготовит Django в процессе пула, если он не унаследован."""
+    django.setup()
+
+
+@contextmanager
+def worker_map(workers):
+    """
+    Вернет map для обработки пачек: imap пула из workers процессов,
+    а при workers=0 — встроенный map в текущем процессе.
+    """
+    if not workers:
+        yield map
+        return
+    # Процессы пула открывают свои соединения с базой.
+    connections.close_all()
+    with Pool(workers, initializer=init_worker) as pool:
+        yield pool.imap
+
+
+def keyset(querysets, batch_size, after=0):
+    """
+    Вернет строки querysets пачками по batch_size по возрастанию pk,
+    начиная с pk больше after.
+
+    querysets — копии одного values_list() в разных базах, например
+    из sharding.each_shard(); строка — pk или кортеж с pk первым.
+    Пачка собирается из всех баз, чтобы after продолжал работу
+    с того же места. Каждая пачка читается отдельным запросом:
+    открытый курсор в SQLite не дал бы записывать между пачками.
+    """
+    querysets = [queryset.order_by('pk') for queryset in querysets]
+    while True:
+        batch = sorted(
+            row
+            for queryset in querysets
+            for row in queryset.filter(pk__gt=after)[:batch_size]
+        )[:batch_size]
+        if not batch:
+            return
+        yield batch
+        after = batch[-1][0] if isinstance(batch[-1], tuple) else batch[-1]
@@ -0,0 +1,109 @@
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, OperationalError, connection, transaction,
+)
+
+logger = logging.getLogger(__name__)
+
+LOCKED_ERRORS = ('database is locked', 'database table is locked')
+
+# Действия вне базы, которые отменяются при откате транзакции
+# retry_on_lock. Вне ее список не заведен.
+_rollback = threading.local()
+
+
+def apply_pragmas(raw_connection, pragmas):
+    """Выполнит PRAGMA из словаря {имя: значение} на соединении sqlite3."""
+    for name, value in pragmas.items():
+        raw_connection.execute(f'PRAGMA {name} = {value}')
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Приемник connection_created: настроит новое соединение SQLite
+    по SQLITE_PRAGMAS.
+
+    PRAGMA выполняются на соединении sqlite3 напрямую, мимо
+    execute_wrapper: они не попадают в счет запросов страницы.
+    """
+    if connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS:
+        apply_pragmas(connection.connection, settings.SQLITE_PRAGMAS)
+
+
+def is_locked(error):
+    """Проверит, что ошибка SQLite — занятая другим писателем база."""
+    return any(message in str(error) for message in LOCKED_ERRORS)
+
+
+def atomic_everywhere():
+    """
+    Откроет транзакцию в основной базе и в каждом шарде постов.
+
+    Это не двухфазная фиксация: шарды фиксируются по очереди, но
+    при ошибке во view откатываются все.
+    """
+    stack = ExitStack()
+    for alias in dict.fromkeys((DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS)):
+        stack.enter_context(transaction.atomic(using=alias))
+    return stack
+
+
+def on_rollback(callback):
+    """
+    Выполнит callback, если транзакция retry_on_lock откатится.
+    Так отменяются действия вне базы, например записанные файлы:
+    повтор представления выполнит их заново.
+    """
+    callbacks = getattr(_rollback, 'callbacks', None)
+    if callbacks is not None:
+        callbacks.append(callback)
+
+
+def _attempt(view, args, kwargs):
+    """Выполнит view в транзакции, отменив при ошибке on_rollback."""
+    outer = getattr(_rollback, 'callbacks', None)
+    _rollback.callbacks = []
+    try:
+        with atomic_everywhere():
+            return view(*args, **kwargs)
+    except Exception:
+        for callback in _rollback.callbacks:
+            callback()
+        raise
+    finally:
+        _rollback.callbacks = outer
+
+
+def retry_on_lock(view):
+    """
+    Выполнит view в транзакции и повторит ее, если база занята.
+    При шардировании транзакция открывается и в шардах.
+
+    Пауза перед повтором начинается с DATABASE_WRITE_RETRY_DELAY
+    секунд и удваивается, попыток повтора — DATABASE_WRITE_RETRIES.
+    Внутри внешней транзакции повторять нечего, и ошибка
+    пробрасывается сразу.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        delay = settings.DATABASE_WRITE_RETRY_DELAY
+        for attempt in range(settings.DATABASE_WRITE_RETRIES):
+            try:
+                return _attempt(view, args, kwargs)
+            except OperationalError as error:
+                if connection.in_atomic_block or not is_locked(error):
+                    raise
+                pause = delay * random.uniform(0.5, 1.5)
+                logger.warning(
+                    'База занята, повтор %s через %.3f с', attempt + 1, pause)
+                time.sleep(pause)
+                delay *= 2
+        return _attempt(view, args, kwargs)
+    return wrapper
@@ -0,0 +1,195 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from multiprocessing import Process, Queue
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.db import apply_pragmas, is_locked
+
+# Таблицы повторяют posts_post и счетчики автора: ленту читают
+# по индексу (pub_date, id), пост пишется вместе со счетчиком.
+SCHEMA = (
+    'CREATE TABLE bench_post (id INTEGER PRIMARY KEY, text TEXT,'
+    ' pub_date REAL, author_id INTEGER)',
+    'CREATE INDEX bench_post_pub_date ON bench_post (pub_date)',
+    'CREATE INDEX bench_post_author ON bench_post (author_id, pub_date)',
+    'CREATE TABLE bench_stats (author_id INTEGER PRIMARY KEY,'
+    ' posts_count INTEGER)',
+)
+AUTHORS = 100
+PAGE_SIZE = 10
+# Ожидание занятой базы по умолчанию в модуле sqlite3, секунды.
+DEFAULT_TIMEOUT = 5.0
+
+
+def _create(path, posts):
+    """Создаст базу бенчмарка с posts постами."""
+    connection = sqlite3.connect(path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    now = time.time()
+    connection.executemany(
+        'INSERT INTO bench_post (text, pub_date, author_id) VALUES (?, ?, ?)',
+        ((f'Пост номер {i}. ' * 5, now - i, i % AUTHORS)
+         for i in range(posts)),
+    )
+    connection.executemany(
+        'INSERT INTO bench_stats VALUES (?, ?)',
+        ((author_id, 0) for author_id in range(AUTHORS)),
+    )
+    connection.commit()
+    connection.close()
+
+
+def _read(connection, rng):
+    """Страница ленты и страница автора."""
+    connection.execute(
+        'SELECT id, text, pub_date, author_id FROM bench_post'
+        ' ORDER BY pub_date DESC, id DESC LIMIT ?', (PAGE_SIZE,)
+    ).fetchall()
+    connection.execute(
+        'SELECT id, text, pub_date FROM bench_post WHERE author_id = ?'
+        ' ORDER BY pub_date DESC, id DESC LIMIT ?',
+        (rng.randrange(AUTHORS), PAGE_SIZE),
+    ).fetchall()
+
+
+def _write(connection, rng):
+    """Новый пост в транзакции: проверка, вставка и счетчик автора."""
+    author_id = rng.randrange(AUTHORS)
+    connection.execute('BEGIN')
+    try:
+        connection.execute(
+            'SELECT id FROM bench_post WHERE author_id = ?'
+            ' ORDER BY pub_date DESC LIMIT 1', (author_id,)
+        ).fetchall()
+        connection.execute(
+            'INSERT INTO bench_post (text, pub_date, author_id)'
+            ' VALUES (?, ?, ?)', ('Новый пост. ' * 5, time.time(), author_id)
+        )
+        connection.execute(
+            'UPDATE bench_stats SET posts_count = posts_count + 1'
+            ' WHERE author_id = ?', (author_id,)
+        )
+        connection.execute('COMMIT')
+    except sqlite3.OperationalError:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def _worker(path, pragmas, role, deadline, retries, delay, results):
+    """
+    Выполняет операции role до deadline, повторяя их при занятой
+    базе так же, как retry_on_lock. Кладет в results задержки
+    операций, число повторов и число неудач.
+    """
+    connection = sqlite3.connect(
+        path, timeout=DEFAULT_TIMEOUT, isolation_level=None)
+    apply_pragmas(connection, pragmas)
+    operation = _write if role == 'write' else _read
+    rng = random.Random()
+    latencies, locked, failed = [], 0, 0
+    while time.time() < deadline:
+        started = perf_counter()
+        pause = delay
+        for attempt in range(retries + 1):
+            try:
+                operation(connection, rng)
+                break
+            except sqlite3.OperationalError as error:
+                if not is_locked(error):
+                    raise
+                locked += 1
+                time.sleep(pause * rng.uniform(0.5, 1.5))
+                pause *= 2
+        else:
+            failed += 1
+            continue
+        latencies.append(perf_counter() - started)
+    connection.close()
+    results.put((role, latencies, locked, failed))
+
+
+def _percentile(values, share):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает SQLite по умолчанию и с SQLITE_PRODUCTION_PRAGMAS под
+    одновременными читателями и писателями в отдельных процессах,
+    как у воркеров gunicorn.
+
+    Каждый профиль получает свою временную базу.
+    """
+    help = 'Бенчмарк SQLite: журнал по умолчанию против WAL и PRAGMA.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'Постов: {options["posts"]}, читателей: {options["readers"]}, '
+            f'писателей: {options["writers"]}, '
+            f'секунд: {options["seconds"]}'
+        )
+        profiles = (
+            ('По умолчанию', {}),
+            ('WAL и PRAGMA', settings.SQLITE_PRODUCTION_PRAGMAS),
+        )
+        for name, pragmas in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                _create(path, options['posts'])
+                self.report(name, self.run(path, pragmas, **options))
+
+    def run(self, path, pragmas, readers, writers, seconds, **options):
+        results = Queue()
+        deadline = time.time() + seconds
+        processes = [
+            Process(target=_worker, args=(
+                path, pragmas, role, deadline,
+                settings.DATABASE_WRITE_RETRIES,
+                settings.DATABASE_WRITE_RETRY_DELAY,
+                results,
+            ))
+            for role in ['read'] * readers + ['write'] * writers
+        ]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        totals = {
+            role: {'latencies': [], 'locked': 0, 'failed': 0}
+            for role in ('read', 'write')
+        }
+        for role, latencies, locked, failed in collected:
+            totals[role]['latencies'].extend(latencies)
+            totals[role]['locked'] += locked
+            totals[role]['failed'] += failed
+        for total in totals.values():
+            total['rate'] = len(total['latencies']) / seconds
+        return totals
+
+    def report(self, name, totals):
+        self.stdout.write(name)
+        for role, title in (('read', 'Чтение'), ('write', 'Запись')):
+            total = totals[role]
+            p95 = _percentile(total['latencies'], 0.95) * 1000
+            self.stdout.write(
+                f'  {title}: {total["rate"]:.0f} оп/с, '
+                f'p95 {p95:.2f} мс, повторов {total["locked"]}, '
+                f'неудач {total["failed"]}'
+            )
@@ -0,0 +1,58 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+def sync(alias, source='default'):
+    """
+    Скопирует базу SQLite source в реплику alias через backup API:
+    копия — согласованный снимок, даже если в source пишут.
+    """
+    paths = []
+    for name in (source, alias):
+        settings_dict = connections[name].settings_dict
+        if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError(f'{name}: реплики поддерживаются для SQLite')
+        paths.append(settings_dict['NAME'])
+    primary = sqlite3.connect(paths[0])
+    replica = sqlite3.connect(paths[1])
+    try:
+        primary.backup(replica)
+    finally:
+        replica.close()
+        primary.close()
+
+
+class Command(BaseCommand):
+    """
+    Обновляет реплики из DATABASE_REPLICAS копией основной базы.
+
+    С --interval копирует их в цикле, пока команду не остановят.
+    """
+    help = 'Копирует основную базу SQLite в реплики для чтения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Повторять копирование каждые N секунд.',
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('DATABASE_REPLICAS пуст.')
+        while True:
+            started = time.monotonic()
+            for alias in settings.DATABASE_REPLICAS:
+                sync(alias)
+            self.stdout.write(
+                f'Реплики обновлены за '
+                f'{time.monotonic() - started:.2f} с: '
+                f'{", ".join(settings.DATABASE_REPLICAS)}'
+            )
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
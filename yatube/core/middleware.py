@@ -0,0 +1,81 @@
+import logging
+import time
+
+from django.conf import settings
+
+from . import routers
+from .queries import QueryBudgetExceeded, check_budget, record_queries
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+STICKY_KEY = 'primary_until'
+
+
+class QueryBudgetMiddleware:
+    """
+    Считает SQL-запросы каждого запроса к сайту.
+
+    Включается настройкой QUERY_BUDGET_ENABLED. Превышение бюджета,
+    объявленного через query_budget(), и повторяющиеся формы запросов
+    (N+1) пишутся в лог, а при QUERY_BUDGET_STRICT — вызывают ошибку.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+        with record_queries() as log:
+            response = self.get_response(request)
+        response['X-Query-Count'] = len(log)
+        match = request.resolver_match
+        if match is None:
+            return response
+        problems = check_budget(log, match.func, request.path)
+        if problems and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded('\n'.join(problems))
+        for problem in problems:
+            logger.warning(problem)
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтения GET-запросов к страницам из REPLICA_NAMESPACES
+    на реплики из DATABASE_REPLICAS.
+
+    После записи в небезопасном запросе сессия на
+    REPLICA_STICKY_SECONDS остается на основной базе, чтобы
+    пользователь сразу видел свой пост, комментарий или подписку,
+    даже если реплика еще не догнала основную базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.reset()
+        try:
+            response = self.get_response(request)
+            if (
+                settings.DATABASE_REPLICAS
+                and request.method not in SAFE_METHODS
+                and routers.wrote()
+            ):
+                request.session[STICKY_KEY] = (
+                    time.time() + settings.REPLICA_STICKY_SECONDS)
+        finally:
+            routers.reset()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and request.resolver_match.namespace
+            in settings.REPLICA_NAMESPACES
+            and request.session.get(STICKY_KEY, 0) <= time.time()
+        ):
+            routers.use_replica()
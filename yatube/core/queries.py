@@ -0,0 +1,121 @@
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connection, connections
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+# Управление транзакцией, в том числе BEGIN из atomic_everywhere,
+# не считается запросом страницы.
+TRANSACTION_STATEMENTS = (
+    'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT',
+)
+# Полный просмотр таблицы без индекса и сортировка во временном B-дереве.
+BAD_PLAN = re.compile(r'SCAN (?!.*\bUSING\b)|USE TEMP B-TREE')
+
+
+class QueryBudgetExceeded(Exception):
+    """Запрос к странице выполнил больше SQL, чем для нее заявлено."""
+
+
+def query_budget(view, max_queries):
+    """
+    Объявит для представления наибольшее число SQL-запросов.
+    """
+    view.query_budget = max_queries
+    return view
+
+
+def shape(sql):
+    """
+    Вернет форму запроса: SQL без параметров и с одинаковыми
+    списками IN, чтобы одинаковые запросы с разными значениями
+    совпадали.
+    """
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class QueryLog:
+    """Список выполненных SQL-запросов и баз, в которых они выполнены."""
+
+    def __init__(self):
+        self.queries = []
+        self.params = []
+        self.aliases = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS):
+            self.queries.append(sql)
+            self.params.append(params)
+            self.aliases.append(context['connection'].alias)
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        """
+        Вернет формы запросов, выполненных больше одного раза,
+        с числом повторов: так выглядят N+1.
+        """
+        counts = Counter(shape(sql) for sql in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+@contextmanager
+def record_queries(using=None):
+    """
+    Запишет SQL, выполненный внутри блока в базе using, а без нее —
+    во всех базах: основной, шардах, архиве и репликах.
+
+        with record_queries() as log:
+            client.get('/')
+        assert not log.duplicates()
+    """
+    log = QueryLog()
+    with ExitStack() as stack:
+        for wrapped in [using] if using else connections.all():
+            stack.enter_context(wrapped.execute_wrapper(log))
+        yield log
+
+
+def check_budget(log, view, path):
+    """
+    Вернет описание нарушений бюджета запросов или пустой список.
+    """
+    problems = []
+    limit = getattr(view, 'query_budget', None)
+    if limit is not None and len(log) > limit:
+        problems.append(
+            f'{path}: {len(log)} запросов при бюджете {limit}'
+        )
+    for sql, count in log.duplicates().items():
+        problems.append(f'{path}: N+1, {count} раз: {sql}')
+    return problems
+
+
+def query_plan(sql, params, using=connection):
+    """Вернет шаги плана SQLite для запроса: EXPLAIN QUERY PLAN."""
+    with using.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def check_plans(log, path, allow=()):
+    """
+    Вернет описание запросов на чтение, которые просматривают таблицу
+    целиком или сортируют во временном B-дереве.
+
+    Запросы, содержащие строку из allow, не проверяются: так
+    помечаются запросы, которым сортировка нужна по смыслу.
+    """
+    problems = []
+    for sql, params, alias in zip(log.queries, log.params, log.aliases):
+        if not sql.startswith('SELECT') or any(
+            part in sql for part in allow
+        ):
+            continue
+        for step in query_plan(sql, params, connections[alias]):
+            if BAD_PLAN.match(step):
+                problems.append(f'{path}: {step}: {sql}')
+    return problems
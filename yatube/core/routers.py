@@ -0,0 +1,66 @@
+import random
+import threading
+
+from django.conf import settings
+
+# Сессии всегда читаются с основной базы: по ним решается,
+# можно ли пользователю читать с реплики.
+PRIMARY_APPS = ('sessions',)
+
+_state = threading.local()
+
+
+def use_replica():
+    """
+    Направит чтения текущего потока на одну из реплик до reset().
+
+    Реплика выбирается одна на весь запрос, чтобы страница
+    читалась из одного снимка базы.
+    """
+    if settings.DATABASE_REPLICAS:
+        _state.replica = random.choice(settings.DATABASE_REPLICAS)
+
+
+def reading_replica():
+    """Проверит, что чтения текущего потока идут на реплику."""
+    return getattr(_state, 'replica', None) is not None
+
+
+def reset():
+    """Вернет чтения текущего потока на основную базу."""
+    _state.replica = None
+    _state.wrote = False
+
+
+def wrote():
+    """Проверит, что поток писал в базу после reset()."""
+    return getattr(_state, 'wrote', False)
+
+
+class ReplicaRouter:
+    """
+    Читает с реплики, если ее выбрал ReplicaMiddleware, и пишет
+    всегда в основную базу.
+
+    Реплики — копии default, поэтому связи между объектами из
+    разных баз разрешены, а миграции идут только на default.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if replica is None or model._meta.app_label in PRIMARY_APPS:
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return replica
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -0,0 +1,29 @@
+from .queries import check_budget, check_plans, record_queries
+
+
+def assert_query_budget(client, url, method='get', **kwargs):
+    """
+    Выполнит запрос тестовым клиентом и проверит, что он уложился
+    в бюджет запросов представления и не содержит N+1.
+
+    Подходит и для pytest, и для TestCase.
+    """
+    with record_queries() as log:
+        response = getattr(client, method)(url, **kwargs)
+    problems = check_budget(log, response.resolver_match.func, url)
+    assert not problems, '\n'.join(problems)
+    return response
+
+
+def assert_query_plans(client, url, method='get', allow=(), **kwargs):
+    """
+    Выполнит запрос тестовым клиентом и проверит планы его запросов
+    на чтение: без полного просмотра таблиц и временных сортировок.
+
+    allow — строки SQL запросов, которые не проверяются.
+    """
+    with record_queries() as log:
+        response = getattr(client, method)(url, **kwargs)
+    problems = check_plans(log, url, allow)
+    assert not problems, '\n'.join(problems)
+    return response
@@ -1,4 +1,25 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.db import OperationalError, connection, router, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import resolve, reverse
+
+from posts.models import Post
+
+from . import batching, routers
+from .db import on_rollback, retry_on_lock
+from .queries import record_queries
+from .middleware import STICKY_KEY, ReplicaMiddleware
 
 
 class ViewTestClass(TestCase):
@@ -7,3 +28,186 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class SqlitePragmaTests(TestCase):
+    def test_new_connection_configured(self):
+        """Новое соединение получает PRAGMA из SQLITE_PRAGMAS."""
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper({
+                **connection.settings_dict,
+                'NAME': os.path.join(directory, 'pragma.sqlite3'),
+            }, alias='pragma')
+            with override_settings(
+                SQLITE_PRAGMAS=settings.SQLITE_PRODUCTION_PRAGMAS
+            ):
+                wrapper.ensure_connection()
+            try:
+                raw = wrapper.connection
+                self.assertEqual(
+                    raw.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+                self.assertEqual(
+                    raw.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            finally:
+                wrapper.close()
+
+
+@override_settings(DATABASE_WRITE_RETRIES=2, DATABASE_WRITE_RETRY_DELAY=0)
+class RetryOnLockTests(TransactionTestCase):
+    def failing(self, *errors):
+        """Вернет представление, бросающее errors по одной за вызов."""
+        errors = list(errors)
+        calls = []
+
+        @retry_on_lock
+        def view():
+            calls.append(connection.in_atomic_block)
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+        return view, calls
+
+    def test_locked_write_retried(self):
+        """Занятая база дает повтор транзакции."""
+        view, calls = self.failing(
+            OperationalError('database is locked'),
+            OperationalError('database is locked'),
+        )
+        self.assertEqual(view(), 'ok')
+        self.assertEqual(calls, [True, True, True])
+
+    def test_retries_limited(self):
+        """После DATABASE_WRITE_RETRIES повторов ошибка пробрасывается."""
+        view, calls = self.failing(
+            *[OperationalError('database is locked')] * 3)
+        with self.assertRaises(OperationalError):
+            view()
+        self.assertEqual(len(calls), 3)
+
+    def test_other_errors_not_retried(self):
+        """Другие ошибки базы не повторяются."""
+        view, calls = self.failing(OperationalError('no such table: x'))
+        with self.assertRaises(OperationalError):
+            view()
+        self.assertEqual(len(calls), 1)
+
+    def test_rollback_callbacks(self):
+        """Действия on_rollback отменяются на каждый откат."""
+        undone = []
+
+        @retry_on_lock
+        def view(error=None):
+            on_rollback(lambda: undone.append(error))
+            if error is not None:
+                raise error
+            return 'ok'
+
+        self.assertEqual(view(), 'ok')
+        self.assertEqual(undone, [])
+        error = OperationalError('no such table: x')
+        with self.assertRaises(OperationalError):
+            view(error)
+        self.assertEqual(undone, [error])
+        on_rollback(lambda: undone.append('вне транзакции'))
+        self.assertEqual(undone, [error])
+
+    def test_transaction_statements_not_recorded(self):
+        """BEGIN транзакции представления не считается его запросом."""
+        @retry_on_lock
+        def view():
+            return Post.objects.count()
+
+        with record_queries() as log:
+            view()
+        self.assertEqual(len(log), 1)
+
+    def test_outer_transaction_not_retried(self):
+        """Внутри внешней транзакции повторять нечего."""
+        view, calls = self.failing(OperationalError('database is locked'))
+        with self.assertRaises(OperationalError):
+            with transaction.atomic():
+                view()
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_STICKY_SECONDS=30)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.session = SessionStore()
+
+    def route(self, path, method='get', write=False):
+        """
+        Пропустит запрос через ReplicaMiddleware и вернет базу,
+        с которой представление читало бы посты.
+        """
+        request = getattr(self.factory, method)(path)
+        request.session = self.session
+        request.resolver_match = resolve(path)
+        used = []
+
+        def view(request):
+            used.append(router.db_for_read(Post))
+            if write:
+                router.db_for_write(Post)
+            return HttpResponse()
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = ReplicaMiddleware(get_response)
+        middleware(request)
+        return used[0]
+
+    def test_posts_pages_read_from_replica(self):
+        """GET страниц постов и API читает с реплики."""
+        self.assertEqual(self.route(reverse('posts:index')), 'replica')
+        self.assertEqual(self.route(reverse('api:index')), 'replica')
+
+    def test_other_reads_use_primary(self):
+        """Другие страницы, POST и сессии читают с основной базы."""
+        self.assertEqual(self.route(reverse('about:author')), 'default')
+        self.assertEqual(
+            self.route(reverse('posts:post_create'), method='post'),
+            'default')
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.route(reverse('posts:index')), 'default')
+        routers.use_replica()
+        try:
+            self.assertEqual(router.db_for_read(Session), 'default')
+            self.assertEqual(router.db_for_write(Post), 'default')
+        finally:
+            routers.reset()
+
+    def test_replica_released_after_request(self):
+        """После ответа поток снова читает с основной базы."""
+        self.route(reverse('posts:index'))
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+    def test_session_sticks_to_primary_after_write(self):
+        """После записи сессия читает с основной базы до конца окна."""
+        self.route(reverse('posts:post_create'), method='post', write=True)
+        self.assertEqual(self.route(reverse('posts:index')), 'default')
+        self.session[STICKY_KEY] = time.time() - 1
+        self.assertEqual(self.route(reverse('posts:index')), 'replica')
+
+    def test_read_only_post_does_not_stick(self):
+        """POST без записи не привязывает сессию к основной базе."""
+        self.route(reverse('posts:post_create'), method='post')
+        self.assertNotIn(STICKY_KEY, self.session)
+
+
+class KeysetTests(TestCase):
+    def test_batches_merged_by_pk(self):
+        """Пачки собираются из всех запросов по возрастанию pk."""
+        User = get_user_model()
+        ids = [User.objects.create(username=f'user{i}').pk for i in range(5)]
+        users = User.objects.values_list('pk', 'username')
+        odd = users.filter(pk__in=ids[1::2])
+        even = users.filter(pk__in=ids[::2])
+        batches = list(batching.keyset([odd, even], 2, after=ids[0]))
+        self.assertEqual(
+            [[pk for pk, _ in batch] for batch in batches],
+            [ids[1:3], ids[3:5]],
+        )
@@ -1,5 +1,7 @@
 from django.contrib import admin
+from django.db.models.expressions import RawSQL
 
+from . import search
 from .models import Group, Post
 
 
@@ -20,6 +22,37 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        """Подгрузит авторов и группы тем же запросом, что и посты."""
+        return super().get_queryset(request).for_feed()
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Ищет по полнотекстовому индексу вместо LIKE '%...%'
+        по search_fields.
+        """
+        query = search.fts_query(search_term)
+        if not query:
+            return queryset, False
+        matching = RawSQL(*search.matching_ids(query))
+        return queryset.filter(pk__in=matching), False
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        """
+        Выберет группы для list_editable один раз на страницу,
+        а не отдельным запросом в каждой строке.
+        """
+        formfield = super().formfield_for_foreignkey(
+            db_field, request, **kwargs
+        )
+        if db_field.name == 'group':
+            choices = getattr(request, '_group_choices', None)
+            if choices is None:
+                choices = list(formfield.choices)
+                request._group_choices = choices
+            formfield.choices = choices
+        return formfield
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,140 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.http import Http404
+from django.utils import timezone
+
+from . import sharding
+from .models import (Comment, Group, Post, PostFingerprint, PostSignature,
+                     SimilarityBucket, Timeline)
+
+User = get_user_model()
+
+# Строки, которые строятся по посту в горячей базе. В архив они
+# не переносятся: архивные посты не попадают в ленты подписок,
+# похожие посты и поиск дубликатов.
+HOT_ONLY_MODELS = (Timeline, PostSignature, SimilarityBucket, PostFingerprint)
+
+
+def alias():
+    """Вернет псевдоним базы архива или None."""
+    return settings.ARCHIVE_DATABASE
+
+
+def is_enabled():
+    """Проверит, что архив настроен."""
+    return bool(settings.ARCHIVE_DATABASE)
+
+
+def cutoff():
+    """
+    Вернет границу архива: в архиве только посты старше нее.
+    Посты старше границы могут быть и в горячей базе, пока
+    archive_posts их не перенес.
+    """
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+
+
+def is_archived(instance):
+    """Проверит, что объект прочитан из архива."""
+    return is_enabled() and instance._state.db == alias()
+
+
+def each_database(queryset):
+    """Вернет копии queryset для каждого шарда и для архива."""
+    querysets = sharding.each_shard(queryset)
+    if is_enabled() and queryset.model._meta.label_lower in (
+        sharding.SHARDED_MODELS
+    ):
+        querysets.append(queryset.using(alias()))
+    return querysets
+
+
+def first(queryset):
+    """
+    Вернет первую запись queryset и базу, в которой она нашлась.
+    Если в горячей базе записи нет, она ищется в архиве.
+    """
+    found = queryset.first()
+    if found is not None or not is_enabled():
+        return found, queryset.db
+    queryset = queryset.using(alias())
+    return queryset.first(), queryset.db
+
+
+def get_object_or_404(queryset, **lookup):
+    """Как django.shortcuts.get_object_or_404, но ищет и в архиве."""
+    found, _ = first(queryset.filter(**lookup))
+    if found is None:
+        raise Http404(f'{queryset.model._meta.object_name} не найден.')
+    return found
+
+
+def copy_rows(model, rows, using, fields=None):
+    """
+    Вставит строки rows в базу using как есть, пропуская уже
+    существующие. bulk_create заново проставил бы даты auto_now_add.
+    fields — вставляемые поля, по умолчанию все.
+    """
+    fields = fields or model._meta.concrete_fields
+    objects = model._base_manager.using(using)
+    size = connections[using].ops.bulk_batch_size(fields, rows) or len(rows)
+    for start in range(0, len(rows), size):
+        objects._insert(
+            rows[start:start + size], fields=fields, raw=True,
+            using=using, ignore_conflicts=True,
+        )
+
+
+def move(using, post_ids):
+    """
+    Перенесет посты post_ids с комментариями из базы using в архив.
+
+    Строки удаляются без сигналов: пост не исчезает, а переезжает,
+    поэтому счетчики, ссылки на картинки и кэш страниц остаются
+    прежними. Архив фиксируется раньше горячей базы: после сбоя
+    между фиксациями посты окажутся в обеих базах, и повторный
+    перенос просто удалит горячие копии.
+    """
+    posts = list(Post._base_manager.using(using).filter(pk__in=post_ids))
+    comments = list(
+        Comment._base_manager.using(using).filter(post_id__in=post_ids))
+    # Справочники обычно уже скопированы сигналами, но посты могли
+    # появиться раньше архива.
+    references = {
+        User: {row.author_id for row in posts + comments},
+        Group: {
+            post.group_id for post in posts if post.group_id is not None},
+    }
+    with transaction.atomic(using=using):
+        with transaction.atomic(using=alias()):
+            for model, pks in references.items():
+                pks -= set(model._base_manager.using(alias()).filter(
+                    pk__in=pks).values_list('pk', flat=True))
+                for instance in model._base_manager.filter(pk__in=pks):
+                    sharding.mirror(instance, aliases=[alias()])
+            copy_rows(Post, posts, alias())
+            copy_rows(Comment, comments, alias())
+        for model in (*HOT_ONLY_MODELS, Comment):
+            model._base_manager.using(using).filter(
+                post_id__in=post_ids)._raw_delete(using)
+        Post._base_manager.using(using).filter(
+            pk__in=post_ids)._raw_delete(using)
+    return len(posts)
+
+
+def archive_batch(using, before, batch_size):
+    """
+    Перенесет в архив до batch_size самых старых постов базы using,
+    опубликованных раньше before. Вернет число перенесенных постов.
+    """
+    post_ids = list(
+        Post.objects.using(using).filter(pub_date__lt=before)
+        .order_by('pub_date', 'id').values_list('id', flat=True)
+        [:batch_size]
+    )
+    if not post_ids:
+        return 0
+    return move(using, post_ids)
@@ -0,0 +1,134 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core import routers
+
+GENERATION_KEY = 'posts:generation:{}'
+MODIFIED_KEY = 'posts:modified:{}'
+# Область, поколение которой сдвигается при любом изменении.
+ANY_SCOPE = '*'
+PAGE_PARAMS = ('page', 'after', 'before')
+# Параметры, от которых зависит кэшируемая страница целиком: прочие,
+# например метки рекламных кампаний, не плодят копий страницы.
+PAGE_CACHE_PARAMS = (*PAGE_PARAMS, 'q', 'fields')
+# Время жизни фрагментов {% cache %} со списками постов, секунды.
+FRAGMENT_TIMEOUT = 60 * 5
+
+
+def _initial_generation():
+    """
+    Начальное поколение берется от времени, чтобы после вытеснения
+    ключа из кэша не вернуться к уже использованному номеру.
+    """
+    return int(time.time())
+
+
+def _read(template, scopes, initial):
+    """
+    Вернет значения ключей областей одним запросом к кэшу,
+    записав initial() вместо отсутствующих.
+    """
+    keys = [template.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    result = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, initial(), timeout=None)
+            found[key] = cache.get(key)
+        result.append(found[key])
+    return result
+
+
+def generations(*scopes):
+    """
+    Вернет текущие поколения областей одним запросом к кэшу.
+
+    Область — это строка вида 'global', 'group:1' или 'author:1'.
+    """
+    return _read(GENERATION_KEY, scopes, _initial_generation)
+
+
+def modified(*scopes):
+    """
+    Вернет время последнего изменения областей, Unix-время.
+
+    Если время области вытеснено из кэша, им становится текущее:
+    страница может только показаться измененной.
+    """
+    return max(_read(MODIFIED_KEY, scopes, time.time))
+
+
+def _bump_now(scopes):
+    for scope in (*scopes, ANY_SCOPE):
+        key = GENERATION_KEY.format(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_generation(), timeout=None)
+    now = time.time()
+    cache.set_many(
+        {MODIFIED_KEY.format(scope): now for scope in scopes}, timeout=None)
+
+
+def bump(*scopes):
+    """
+    Сдвинет поколения областей, инвалидируя все ключи,
+    построенные на прежних значениях.
+
+    Поколения сдвигаются сразу и еще раз после коммита: иначе
+    параллельный запрос успел бы закэшировать старые данные
+    под новым поколением до того, как изменения станут видны.
+    """
+    _bump_now(scopes)
+    transaction.on_commit(lambda: _bump_now(scopes))
+
+
+def post_scopes(post, *group_ids):
+    """Вернет области, которые затрагивает изменение поста."""
+    scopes = {'global', f'author:{post.author_id}', f'post:{post.pk}'}
+    for group_id in (post.group_id, *group_ids):
+        if group_id is not None:
+            scopes.add(f'group:{group_id}')
+    return scopes
+
+
+def can_store():
+    """
+    Проверит, что прочитанное в запросе можно сохранить в кэш.
+
+    Прочитанное с реплики — нельзя: поколения сдвигаются при
+    коммите в основную базу, а реплика догоняет ее позже, и
+    устаревшая страница закэшировалась бы под новым поколением.
+    """
+    return not routers.reading_replica()
+
+
+def fragment_timeout():
+    """Вернет время жизни фрагмента, 0 — не сохранять его."""
+    return FRAGMENT_TIMEOUT if can_store() else 0
+
+
+def fragment_key(request, *scopes):
+    """
+    Вернет ключ для {% cache %}: поколения областей, курсор
+    или номер страницы и состояние зрителя.
+    """
+    parts = [
+        f'{scope}={generation}'
+        for scope, generation in zip(scopes, generations(*scopes))
+    ]
+    parts.extend(
+        f'{name}={request.GET.get(name, "")}' for name in PAGE_PARAMS
+    )
+    parts.append('auth' if request.user.is_authenticated else 'anon')
+    return '|'.join(parts)
+
+
+def cache_page_scopes(request, *scopes):
+    """
+    Разрешит кэшировать страницу целиком для анонимных посетителей
+    до изменения любой из областей.
+    """
+    request.page_cache_scopes = scopes
@@ -0,0 +1,174 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F
+
+from core import batching
+
+from . import archive
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+AUTHOR_COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'comments_count': (Comment, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+}
+
+
+def _count_by(model, field, ids):
+    """
+    Вернет словарь {id: число строк model с field из ids},
+    сложив числа из всех шардов и архива.
+    """
+    counted = Counter()
+    rows = model.objects.filter(**{f'{field}__in': ids})
+    for queryset in archive.each_database(rows):
+        counted.update(dict(
+            queryset.values_list(field).annotate(total=Count('pk'))
+            .order_by()
+        ))
+    return dict(counted)
+
+
+def _author_counters(author_ids):
+    """Посчитает счетчики авторов по таблицам постов и подписок."""
+    counted = {
+        name: _count_by(model, field, author_ids)
+        for name, (model, field) in AUTHOR_COUNTERS.items()
+    }
+    return {
+        author_id: {
+            name: totals.get(author_id, 0)
+            for name, totals in counted.items()
+        }
+        for author_id in author_ids
+    }
+
+
+def author_stats(author_id):
+    """
+    Вернет счетчики автора.
+
+    Страницы только читают счетчики и могут читать их с реплики,
+    поэтому отсутствующая строка не создается: счетчики считаются
+    по таблицам и не сохраняются. Строки создают регистрация,
+    create_author_stats() при записи и recount.
+    """
+    stats = AuthorStats.objects.filter(author_id=author_id).first()
+    if stats is not None:
+        return stats
+    return AuthorStats(
+        author_id=author_id, **_author_counters([author_id])[author_id])
+
+
+def create_author_stats(author_id):
+    """
+    Создаст счетчики автора пересчетом и вернет их.
+
+    После гонки счетчики перечитываются из базы для записи: реплика
+    может еще не знать о строке, которую создал соседний запрос.
+    """
+    counters = _author_counters([author_id])[author_id]
+    try:
+        with transaction.atomic():
+            return AuthorStats.objects.create(author_id=author_id, **counters)
+    except IntegrityError:
+        return AuthorStats.objects.db_manager(
+            router.db_for_write(AuthorStats)
+        ).get(author_id=author_id)
+
+
+def _bump(objects, pk, field, delta):
+    """
+    Атомарно изменит счетчик строки pk из objects на delta.
+
+    Уменьшение не опускает счетчик ниже нуля.
+    Вернет число обновленных строк.
+    """
+    rows = objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    return rows.update(**{field: F(field) + delta})
+
+
+def bump_author(author_id, field, delta):
+    """
+    Изменит счетчик автора.
+
+    При увеличении отсутствующие счетчики создаются пересчетом,
+    уменьшение отсутствующих счетчиков ничего не делает: их может
+    не быть у удаляемого пользователя.
+    """
+    if _bump(AuthorStats.objects, author_id, field, delta) or delta < 0:
+        return
+    create_author_stats(author_id)
+
+
+def bump_group(group_id, delta):
+    """Изменит число постов группы."""
+    if group_id is not None:
+        _bump(Group.objects, group_id, 'posts_count', delta)
+
+
+def bump_post(post_id, delta):
+    """Изменит число комментариев поста."""
+    _bump(Post.objects.on_post(post_id), post_id, 'comments_count', delta)
+
+
+def recount_authors(batch_size=BATCH_SIZE):
+    """Пересчитает счетчики всех авторов. Вернет число авторов."""
+    total = 0
+    users = User.objects.values_list('pk', flat=True)
+    for author_ids in batching.keyset([users], batch_size):
+        counters = _author_counters(author_ids)
+        existing = AuthorStats.objects.in_bulk(author_ids)
+        for author_id, stats in existing.items():
+            for name, value in counters[author_id].items():
+                setattr(stats, name, value)
+        with transaction.atomic():
+            AuthorStats.objects.bulk_update(
+                existing.values(), list(AUTHOR_COUNTERS)
+            )
+            AuthorStats.objects.bulk_create(
+                AuthorStats(author_id=author_id, **counters[author_id])
+                for author_id in author_ids
+                if author_id not in existing
+            )
+        total += len(author_ids)
+    return total
+
+
+def _recount(model, field, related_model, related_field, batch_size):
+    """
+    Пересчитает счетчик field модели model пачками в каждом шарде
+    и в архиве.
+    """
+    total = 0
+    for rows in archive.each_database(model.objects.all()):
+        pks = rows.values_list('pk', flat=True)
+        for ids in batching.keyset([pks], batch_size):
+            counted = _count_by(related_model, related_field, ids)
+            rows.bulk_update(
+                [model(pk=pk, **{field: counted.get(pk, 0)}) for pk in ids],
+                [field],
+            )
+            total += len(ids)
+    return total
+
+
+def recount_groups(batch_size=BATCH_SIZE):
+    """Пересчитает число постов групп. Вернет число групп."""
+    return _recount(Group, 'posts_count', Post, 'group_id', batch_size)
+
+
+def recount_posts(batch_size=BATCH_SIZE):
+    """Пересчитает число комментариев постов. Вернет число постов."""
+    return _recount(
+        Post, 'comments_count', Comment, 'post_id', batch_size
+    )
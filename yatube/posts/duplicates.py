@@ -0,0 +1,148 @@
+import hashlib
+from collections import Counter
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import search, sharding
+from .models import PostFingerprint
+
+BITS = 64
+MASK = (1 << BITS) - 1
+BANDS = 4
+BAND_BITS = BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+# Отпечатки, различающиеся меньше чем в BANDS битах, всегда делят
+# полосу; при DISTANCE = BANDS дубликат находится, если уцелела хотя
+# бы одна полоса, а из волны спама с многими копиями — почти наверняка.
+# При большем пороге похожими становятся просто тексты на одну тему.
+DISTANCE = 4
+# Ширина счетчика одного разряда в _lanes: хватит на 2 ** 32 триграмм.
+LANE = 32
+LANE_MASK = (1 << LANE) - 1
+# Сколько кандидатов из корзин сверять: при волне спама все они
+# и есть дубликаты, так что проверка не растет с числом постов.
+CANDIDATES = 20
+
+
+@lru_cache(maxsize=2 ** 16)
+def _lanes(feature):
+    """
+    Вернет биты хеша признака, разнесенные по счетчикам шириной
+    LANE бит одного большого целого: сумма таких чисел считает
+    единицы во всех BITS разрядах сразу.
+    """
+    digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+    value = int.from_bytes(digest, 'little')
+    return sum(
+        1 << (bit * LANE) for bit in range(BITS) if value >> bit & 1
+    )
+
+
+def features(text):
+    """Вернет триграммы букв текста с числом повторов."""
+    text = ' '.join(search.words(text))
+    return Counter(text[start:start + 3] for start in range(len(text) - 2))
+
+
+def fingerprint(text):
+    """
+    Вернет 64-битный SimHash текста: бит установлен, если у большей
+    части триграмм с учетом повторов он установлен в хеше.
+
+    Вернет None, если слов меньше DUPLICATE_POST_MIN_WORDS:
+    короткие тексты совпадают и без спама.
+    """
+    if len(search.words(text)) < settings.DUPLICATE_POST_MIN_WORDS:
+        return None
+    counts = features(text)
+    ones = sum(count * _lanes(feature) for feature, count in counts.items())
+    total = sum(counts.values())
+    return sum(
+        1 << bit for bit in range(BITS)
+        if (ones >> (bit * LANE) & LANE_MASK) * 2 > total
+    )
+
+
+def bands(simhash):
+    """Вернет полосы отпечатка, от младших битов к старшим."""
+    return [simhash >> (band * BAND_BITS) & BAND_MASK for band in range(BANDS)]
+
+
+def distance(first, second):
+    """Вернет расстояние Хэмминга между отпечатками."""
+    return bin(first ^ second).count('1')
+
+
+def _signed(simhash):
+    """Переведет отпечаток в диапазон BigIntegerField."""
+    return simhash - (1 << BITS) if simhash >> (BITS - 1) else simhash
+
+
+def _fields(simhash):
+    return {
+        'simhash': _signed(simhash),
+        **{f'band{band}': value for band, value in enumerate(bands(simhash))},
+    }
+
+
+def find(text, author_id, exclude=None):
+    """
+    Вернет id недавнего поста, почти совпадающего с текстом, или None.
+
+    Сверяются посты всех авторов за DUPLICATE_POST_WINDOW и посты
+    автора за DUPLICATE_POST_AUTHOR_WINDOW; пост exclude пропускается.
+    Кандидатов находит один запрос по индексам полос, без чтения
+    текстов.
+    """
+    simhash = fingerprint(text)
+    if simhash is None:
+        return None
+    now = timezone.now()
+    since = now - timedelta(seconds=settings.DUPLICATE_POST_WINDOW)
+    author_since = now - timedelta(
+        seconds=settings.DUPLICATE_POST_AUTHOR_WINDOW)
+    same_band = Q()
+    for band, value in enumerate(bands(simhash)):
+        same_band |= Q(**{f'band{band}': value})
+    candidates = PostFingerprint.objects.filter(
+        same_band,
+        Q(created__gte=since)
+        | Q(author_id=author_id, created__gte=author_since),
+    )
+    if exclude is not None:
+        candidates = candidates.exclude(post_id=exclude)
+    # Сверяются самые свежие кандидаты: волна спама идет сейчас.
+    candidates = candidates.order_by('-created').values_list(
+        'post_id', 'simhash')
+    for queryset in sharding.each_shard(candidates):
+        for post_id, other in queryset[:CANDIDATES]:
+            if distance(simhash, other & MASK) <= DISTANCE:
+                return post_id
+    return None
+
+
+def remember(post, created=False, saved_text=None):
+    """
+    Сохранит отпечаток нового текста поста.
+
+    По прежнему тексту saved_text видно, был ли у поста отпечаток:
+    тогда его не нужно искать ни для удаления, ни для замены.
+    """
+    stored = not created and (
+        saved_text is None or fingerprint(saved_text) is not None)
+    simhash = fingerprint(post.text)
+    if simhash is None:
+        if stored:
+            PostFingerprint.objects.on_post(post.pk).filter(
+                post_id=post.pk).delete()
+        return
+    PostFingerprint(
+        post_id=post.pk,
+        author_id=post.author_id,
+        created=post.pub_date,
+        **_fields(simhash),
+    ).save(force_insert=not stored)
@@ -0,0 +1,368 @@
+import heapq
+from copy import copy
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, Q, QuerySet
+
+from core import batching
+
+from . import archive, sharding
+from .models import AuthorStats, Follow, Post, Timeline
+from .paginator import seek
+
+BATCH_SIZE = 500
+
+
+def _bulk_insert(timeline, entries):
+    """
+    Пишет записи ленты пачками в queryset timeline,
+    пропуская уже существующие.
+    """
+    entries = iter(entries)
+    batch = list(islice(entries, BATCH_SIZE))
+    while batch:
+        timeline.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, BATCH_SIZE))
+
+
+def _feed_key(post):
+    """Ключ сортировки ленты: (pub_date, id) по убыванию."""
+    return post.pub_date, post.id
+
+
+def is_celebrity(author_id):
+    """
+    Проверит, что у автора слишком много подписчиков для разноса
+    постов по лентам.
+    """
+    return AuthorStats.objects.filter(
+        author_id=author_id,
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).exists()
+
+
+def push_post(post):
+    """
+    Разносит новый пост по лентам всех подписчиков автора.
+
+    Посты знаменитостей не разносятся: их забирают при чтении ленты.
+    Проверка знаменитости — подзапрос того же запроса, что выбирает
+    подписчиков: он не зависит от строк и вычисляется один раз.
+    """
+    celebrity = AuthorStats.objects.filter(
+        author_id=post.author_id,
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    )
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).annotate(
+        celebrity=Exists(celebrity)
+    ).filter(celebrity=False).values_list('user_id', flat=True)
+    _bulk_insert(
+        Timeline.objects.on_post(post.id),
+        (Timeline(user_id=user_id, post_id=post.id, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+    )
+
+
+def add_author(user_id, author_id):
+    """
+    Дописывает в ленту подписчика все посты нового автора.
+    """
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.on_author(author_id).filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date')
+    _bulk_insert(
+        Timeline.objects.on_author(author_id),
+        (Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()),
+    )
+
+
+def remove_author(user_id, author_id):
+    """
+    Убирает из ленты подписчика посты автора, от которого он отписался.
+
+    Если автор после отписки перестал быть знаменитостью, он
+    помечается timeline_pending: его посты допишет в ленты
+    оставшихся подписчиков backfill_demoted, а до тех пор лента
+    читает их напрямую, как посты знаменитости.
+    """
+    Timeline.objects.on_author(author_id).filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+    AuthorStats.objects.filter(
+        author_id=author_id,
+        followers_count=settings.FEED_CELEBRITY_FOLLOWERS - 1,
+    ).update(timeline_pending=True)
+
+
+def backfill_demoted(batch_size=BATCH_SIZE):
+    """
+    Допишет посты авторов с timeline_pending в ленты их подписчиков,
+    по транзакции на batch_size подписок. Вернет число авторов.
+    """
+    authors = list(AuthorStats.objects.filter(
+        timeline_pending=True).values_list('author_id', flat=True))
+    for author_id in authors:
+        follows = Follow.objects.filter(
+            author_id=author_id).values_list('pk', 'user_id')
+        for batch in batching.keyset([follows], batch_size):
+            with transaction.atomic():
+                for _, user_id in batch:
+                    add_author(user_id, author_id)
+        AuthorStats.objects.filter(author_id=author_id).update(
+            timeline_pending=False)
+    return len(authors)
+
+
+class MergedFeed:
+    """
+    Несколько лент постов, слитых в одну по убыванию (pub_date, id).
+
+    sources — список (queryset, field, pk): queryset отдает посты
+    по ключу (field, pk), см. paginator.seek. Объект поддерживает
+    count(), срезы и seek(), поэтому его можно отдавать в Paginator
+    и CursorPaginator.
+    """
+    key = staticmethod(_feed_key)
+
+    def __init__(self, sources):
+        self.sources = sources
+        self.after = None
+        self.before = None
+
+    def seek(self, after=None, before=None):
+        """
+        Вернет копию ленты, начинающуюся от курсора.
+
+        С before лента идет по возрастанию ключа, как того
+        ожидает CursorPaginator.
+        """
+        clone = copy(self)
+        clone.after = after
+        clone.before = before
+        return clone
+
+    def values(self, *fields):
+        """
+        Вернет копию ленты, отдающую словари полей, как values().
+        Поля pub_date и id нужны для слияния и добавляются всегда.
+        """
+        fields = {*fields, 'pub_date', 'id'}
+        clone = copy(self)
+        clone.sources = [
+            (queryset.values(*fields), field, pk)
+            for queryset, field, pk in self.sources
+        ]
+        clone.key = itemgetter('pub_date', 'id')
+        return clone
+
+    def _ordered_sources(self):
+        return [
+            seek(
+                queryset, after=self.after, before=self.before,
+                field=field, pk=pk,
+            )
+            for queryset, field, pk in self.sources
+        ]
+
+    def count(self):
+        """Вернет общее число постов в ленте."""
+        return sum(
+            source.count() for source in self._ordered_sources()
+        )
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        """
+        Вернет срез ленты.
+
+        Из каждого источника читается не больше stop записей,
+        после чего они сливаются k-путевым слиянием.
+        """
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        stop = index.stop
+        if stop is None:
+            stop = self.count()
+        merged = heapq.merge(
+            *(source[:stop] for source in self._ordered_sources()),
+            key=self.key,
+            reverse=self.before is None,
+        )
+        return list(islice(merged, index.start or 0, stop))
+
+
+class FollowFeed(MergedFeed):
+    """
+    Лента подписок пользователя.
+
+    Посты обычных авторов читаются из Timeline, посты знаменитостей
+    и авторов, чьи посты еще не дописаны в ленты, берутся напрямую
+    из Post, и оба потока сливаются. При
+    шардировании каждый поток читается из всех шардов.
+
+    Ключ записи ленты берется из аннотаций: курсор фильтрует то же
+    соединение с Timeline, и лента читается по его индексу.
+    """
+
+    def __init__(self, user):
+        celebrities = list(Follow.objects.filter(
+            Q(author__stats__followers_count__gte=(
+                settings.FEED_CELEBRITY_FOLLOWERS
+            )) | Q(author__stats__timeline_pending=True),
+            user=user,
+        ).values_list('author_id', flat=True))
+        posts = Post.objects.for_feed()
+        entries = posts.filter(timeline_entries__user=user).annotate(
+            entry_date=F('timeline_entries__pub_date'),
+            entry_post=F('timeline_entries__post'),
+        ).exclude(author_id__in=celebrities)
+        sources = [
+            (queryset, 'entry_date', 'entry_post')
+            for queryset in sharding.each_shard(entries)
+        ]
+        if celebrities:
+            sources.extend(
+                (queryset, 'pub_date', 'id')
+                for queryset in sharding.each_shard(
+                    posts.filter(author_id__in=celebrities))
+            )
+        super().__init__(sources)
+
+
+class ArchiveFeed:
+    """
+    Лента горячих постов, продолженная постами из архива.
+
+    В архиве только посты старше archive.cutoff(), поэтому архив
+    читается, лишь когда страница заходит за границу: горячих
+    постов не хватило или последний из них старше границы.
+    hot — запрос или лента с seek(), cold — запрос к архиву или
+    функция, которая его построит, когда архив понадобится.
+    """
+    key = staticmethod(_feed_key)
+    fields = None
+
+    def __init__(self, hot, cold):
+        self.hot = hot
+        self.cold = cold
+        self.after = None
+        self.before = None
+
+    def seek(self, after=None, before=None):
+        """Вернет копию ленты, начинающуюся от курсора, как MergedFeed."""
+        clone = copy(self)
+        clone.after = after
+        clone.before = before
+        return clone
+
+    def values(self, *fields):
+        """
+        Вернет копию ленты, отдающую словари полей, как values().
+        Поля pub_date и id добавляются всегда.
+        """
+        fields = {*fields, 'pub_date', 'id'}
+        clone = copy(self)
+        clone.hot = self.hot.values(*fields)
+        clone.fields = fields
+        clone.key = itemgetter('pub_date', 'id')
+        return clone
+
+    def _seek(self, source):
+        if isinstance(source, QuerySet):
+            return seek(source, after=self.after, before=self.before)
+        return source.seek(after=self.after, before=self.before)
+
+    def _cold(self):
+        cold = self.cold() if callable(self.cold) else self.cold
+        if self.fields is not None:
+            cold = cold.values(*self.fields)
+        return cold
+
+    def _crosses(self, rows, stop):
+        """Проверит, что срез до stop может захватить архивные посты."""
+        if self.before is not None:
+            return self.before[0] < archive.cutoff()
+        return len(rows) < stop or self.key(rows[-1])[0] < archive.cutoff()
+
+    def count(self):
+        """Вернет общее число постов в ленте и в архиве."""
+        return self.hot.count() + self._cold().count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        """
+        Вернет срез ленты: горячие посты, а за границей архива —
+        слитые с ними архивные.
+        """
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        stop = index.stop
+        if stop is None:
+            stop = self.count()
+        rows = list(self._seek(self.hot)[:stop])
+        if self._crosses(rows, stop):
+            rows = heapq.merge(
+                rows,
+                self._seek(self._cold())[:stop],
+                key=self.key,
+                reverse=self.before is None,
+            )
+        return list(islice(rows, index.start or 0, stop))
+
+
+def archived(posts, hot=None):
+    """
+    Вернет ленту hot, по умолчанию сам posts, продолженную постами
+    posts из архива. Без архива вернет hot как есть.
+    """
+    if hot is None:
+        hot = posts
+    if not archive.is_enabled():
+        return hot
+    return ArchiveFeed(hot, posts.using(archive.alias()))
+
+
+def follow_feed(user):
+    """
+    Вернет ленту подписок пользователя.
+
+    Архивных постов в Timeline нет: за границей архива лента
+    читает посты авторов, на которых подписан пользователь.
+    """
+    timeline = FollowFeed(user)
+    if not archive.is_enabled():
+        return timeline
+
+    def archived_posts():
+        authors = list(Follow.objects.filter(
+            user=user).values_list('author_id', flat=True))
+        return Post.objects.for_feed().using(archive.alias()).filter(
+            author_id__in=authors)
+    return ArchiveFeed(timeline, archived_posts)
+
+
+def scatter(posts):
+    """
+    Вернет ленту постов queryset posts из всех шардов, слитую
+    по убыванию (pub_date, id), продолженную постами из архива.
+    Без шардирования и архива вернет сам posts.
+    """
+    hot = posts
+    if sharding.is_sharded():
+        hot = MergedFeed([
+            (queryset, 'pub_date', 'id')
+            for queryset in sharding.each_shard(posts)
+        ])
+    return archived(posts, hot)
@@ -1,6 +1,8 @@
 from django import forms
 
+from . import duplicates
 from .models import Comment, Post
+from .uploads import check_image
 
 
 class PostForm(forms.ModelForm):
@@ -17,6 +19,46 @@ class PostForm(forms.ModelForm):
                       'text': 'Введите сообщение'}
         fields = ('text', 'group', 'image')
 
+    def full_clean(self):
+        """
+        Отклонит слишком большую картинку до того, как ImageField
+        проверит ее в Pillow.
+        """
+        name = self.add_prefix('image')
+        upload = self.files.get(name) if self.is_bound else None
+        error = check_image(upload) if upload else None
+        if error is not None:
+            self.files = self.files.copy()
+            del self.files[name]
+        super().full_clean()
+        if error is not None:
+            self.add_error('image', error)
+
+    def _get_validation_exclusions(self):
+        """
+        Не проверит группу еще раз на уровне модели: ModelChoiceField
+        уже нашел ее в базе.
+        """
+        return [*super()._get_validation_exclusions(), 'group']
+
+    def clean_text(self):
+        """
+        Отклонит текст, почти совпадающий с недавним постом.
+
+        Автор берется из instance: представление создания передает
+        пост с уже заданным автором.
+        """
+        text = self.cleaned_data['text']
+        author_id = self.instance.author_id
+        if author_id is not None and duplicates.find(
+            text, author_id, exclude=self.instance.pk
+        ) is not None:
+            raise forms.ValidationError(
+                'Такой текст уже недавно публиковали.',
+                code='duplicate',
+            )
+        return text
+
 
 class CommentForm(forms.ModelForm):
     """
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import archive, sharding
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """
+    Переносит посты старше ARCHIVE_AFTER_DAYS дней вместе
+    с комментариями в ARCHIVE_DATABASE.
+
+    Посты переносятся пачками по одной транзакции, а между пачками
+    команда ждет --pause секунд, чтобы не держать запись в базе.
+    """
+    help = 'Переносит старые посты и их комментарии в архив.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0.5,
+            help='Пауза между пачками, секунды.',
+        )
+
+    def handle(self, *args, **options):
+        if not archive.is_enabled():
+            raise CommandError('ARCHIVE_DATABASE не задан.')
+        if archive.alias() in sharding.shards():
+            raise CommandError('Архив должен быть отдельной базой.')
+        before = archive.cutoff()
+        total = 0
+        for alias in sharding.shards():
+            while True:
+                moved = archive.archive_batch(
+                    alias, before, options['batch_size'])
+                if not moved:
+                    break
+                total += moved
+                self.stdout.write(f'{alias}: перенесено {total}')
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено постов старше {before:%Y-%m-%d %H:%M}: {total}'
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import feed, sharding
+from posts.models import Follow, Timeline
+
+
+class Command(BaseCommand):
+    """
+    Заполняет ленты подписок по существующим подпискам и постам.
+
+    С --demoted дописывает в ленты только посты авторов, которые
+    перестали быть знаменитостями: отписка их не дописывает, чтобы
+    не обходить всех подписчиков в запросе. Такой запуск стоит
+    повторять по расписанию.
+    """
+    help = 'Заполняет таблицу лент подписок по существующим данным.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Очистить ленты перед заполнением.',
+        )
+        parser.add_argument(
+            '--demoted',
+            action='store_true',
+            help='Дописать только посты бывших знаменитостей.',
+        )
+
+    def handle(self, *args, **options):
+        if options['demoted']:
+            authors = feed.backfill_demoted()
+            self.stdout.write(self.style.SUCCESS(
+                f'Дописаны посты авторов: {authors}'))
+            return
+        if options['clear']:
+            for timeline in sharding.each_shard(Timeline.objects.all()):
+                timeline.delete()
+        follows = Follow.objects.values_list('user_id', 'author_id')
+        total = 0
+        for user_id, author_id in follows.iterator():
+            with transaction.atomic():
+                feed.add_author(user_id, author_id)
+            total += 1
+        entries = sum(
+            timeline.count()
+            for timeline in sharding.each_shard(Timeline.objects.all())
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано подписок: {total}, '
+            f'записей в лентах: {entries}'
+        ))
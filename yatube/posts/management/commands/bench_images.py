@@ -0,0 +1,97 @@
+from io import BytesIO
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageFilter
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.parsers import parse_geometry
+
+from posts import sorl_compat, thumbnails
+
+
+def _sample_image(width=2400, height=1600):
+    """
+    Вернет картинку, похожую на фотографию: плавные градиенты
+    с мелким шумом, который кодируется не бесплатно.
+    """
+    gradient = Image.linear_gradient('L').resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    return Image.merge('RGB', (
+        gradient,
+        gradient.rotate(90).resize((width, height)),
+        noise.filter(ImageFilter.GaussianBlur(1)),
+    ))
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает размер и время кодирования вариантов миниатюры
+    в исходном формате и THUMBNAIL_FORMATS на одной картинке.
+
+    Ничего не сохраняет: миниатюры создаются движком sorl-thumbnail
+    с теми же настройками, что и при загрузке, и пишутся в память.
+    """
+    help = 'Бенчмарк форматов миниатюр: байты и время кодирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--image',
+            help='Путь к картинке; по умолчанию синтетическая 2400x1600.',
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options['image']:
+            with open(options['image'], 'rb') as file:
+                original = file.read()
+            source = ImageFile(options['image'])
+        else:
+            buffer = BytesIO()
+            _sample_image().save(buffer, 'JPEG', quality=95)
+            original = buffer.getvalue()
+            source = ImageFile('sample.jpg')
+        image = Image.open(BytesIO(original))
+        image.load()
+        formats = [None, *thumbnails.modern_formats()]
+        self.stdout.write(
+            f'Картинка {image.width}x{image.height}, '
+            f'оригинал {len(original) / 1024:.1f} КБ, '
+            f'повторов: {options["repeat"]}'
+        )
+        if len(formats) == 1:
+            self.stdout.write(self.style.WARNING(
+                'Pillow не умеет сохранять THUMBNAIL_FORMATS, '
+                'сравнение только по ширинам.'
+            ))
+        for width in settings.THUMBNAIL_WIDTHS:
+            baseline = None
+            for format_ in formats:
+                extra = {'format': format_} if format_ else {}
+                size, elapsed = self.measure(
+                    image, source, width, extra, options['repeat'])
+                baseline = baseline or size
+                self.stdout.write(
+                    f'{width}w {format_ or "исходный":>8}: '
+                    f'{size / 1024:7.1f} КБ '
+                    f'({size / baseline:4.0%}), '
+                    f'{elapsed * 1000:6.1f} мс'
+                )
+
+    def measure(self, image, source, width, extra, repeat):
+        """
+        Вернет размер варианта в байтах и среднее время его создания.
+        """
+        options = thumbnails.full_options(source, **extra)
+        engine = default.engine
+        geometry = parse_geometry(
+            thumbnails.variant_geometry(width),
+            engine.get_image_ratio(image, options),
+        )
+        started = perf_counter()
+        for _ in range(repeat):
+            thumbnail = engine.create(image, geometry, options)
+            data = sorl_compat.encode(engine, thumbnail, image, options)
+        elapsed = (perf_counter() - started) / repeat
+        return len(data), elapsed
@@ -0,0 +1,88 @@
+import random
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.expressions import RawSQL
+
+from posts import feed, search
+from posts.models import Post
+
+User = get_user_model()
+
+PAGE_SIZE = 10
+SYLLABLES = (
+    'ка', 'ло', 'ми', 'ре', 'на', 'ту', 'ве', 'сы', 'по', 'да',
+    'жи', 'бо', 'гу', 'ле', 'ры', 'ча', 'ше', 'зо', 'фи', 'ню',
+)
+
+
+def _vocabulary(size, sample):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(sample.choices(SYLLABLES, k=sample.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает поиск по тексту постов через LIKE (icontains)
+    и через индекс FTS5.
+
+    Данные создаются внутри транзакции и откатываются в конце.
+    """
+    help = 'Бенчмарк поиска: icontains против FTS5.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--words', type=int, default=20000)
+        parser.add_argument('--queries', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(**options)
+            transaction.set_rollback(True)
+
+    def run(self, posts, words, queries, **options):
+        sample = random.Random(0)
+        vocabulary = _vocabulary(words, sample)
+        author = User.objects.create(username='bench_search_author')
+        started = perf_counter()
+        Post.objects.bulk_create(
+            (Post(author=author, text=' '.join(
+                sample.choices(vocabulary, k=sample.randint(8, 30))))
+             for _ in range(posts)),
+            batch_size=feed.BATCH_SIZE,
+        )
+        self.stdout.write(
+            f'Постов: {posts}, слов в словаре: {len(vocabulary)}, '
+            f'запись с индексом: {perf_counter() - started:.1f} с'
+        )
+        terms = sample.sample(vocabulary, queries)
+
+        def icontains(term):
+            return Post.objects.filter(text__icontains=term)
+
+        def fts(term):
+            return Post.objects.filter(pk__in=RawSQL(
+                *search.matching_ids(search.fts_query(term))))
+
+        def like_page(term):
+            return list(icontains(term).order_by('-pub_date')[:PAGE_SIZE])
+
+        def fts_page(term):
+            return search.SearchResults(search.fts_query(term))[:PAGE_SIZE]
+
+        cases = (
+            ('icontains, страница', like_page),
+            ('FTS5, страница', fts_page),
+            ('icontains, count', lambda term: icontains(term).count()),
+            ('FTS5, count', lambda term: fts(term).count()),
+        )
+        for name, run in cases:
+            started = perf_counter()
+            for term in terms:
+                run(term)
+            elapsed = (perf_counter() - started) / len(terms)
+            self.stdout.write(f'{name}: {elapsed * 1000:.2f} мс на запрос')
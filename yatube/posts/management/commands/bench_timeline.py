@@ -0,0 +1,90 @@
+import random
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.test.utils import override_settings
+
+from posts import feed
+from posts.models import Follow, Post
+
+User = get_user_model()
+
+PAGE_SIZE = 10
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает ленту подписок через соединение с Follow
+    и через материализованную таблицу Timeline.
+
+    Данные создаются внутри транзакции и откатываются в конце.
+    """
+    help = 'Бенчмарк ленты подписок: join против Timeline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=3)
+        parser.add_argument('--followers', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--celebrity-followers',
+            type=int,
+            help='Порог знаменитости; по умолчанию все посты разносятся.',
+        )
+
+    def handle(self, *args, **options):
+        threshold = options['celebrity_followers']
+        if threshold is None:
+            threshold = options['followers'] + 1
+        with override_settings(FEED_CELEBRITY_FOLLOWERS=threshold):
+            with transaction.atomic():
+                self.run(**options)
+                transaction.set_rollback(True)
+
+    def run(self, authors, followers, posts, repeat, **options):
+        User.objects.bulk_create(
+            User(username=f'bench_author_{i}') for i in range(authors)
+        )
+        User.objects.bulk_create(
+            (User(username=f'bench_reader_{i}') for i in range(followers)),
+            batch_size=feed.BATCH_SIZE,
+        )
+        # bulk_create в SQLite не возвращает id, перечитываем их.
+        authors = list(User.objects.filter(username__startswith='bench_a'))
+        readers = list(
+            User.objects.filter(username__startswith='bench_r')
+            .values_list('id', flat=True)
+        )
+        Follow.objects.bulk_create(
+            (Follow(user_id=reader, author=author)
+             for author in authors for reader in readers),
+            batch_size=feed.BATCH_SIZE,
+        )
+        started = perf_counter()
+        for author in authors:
+            for i in range(posts):
+                Post.objects.create(author=author, text=f'Пост {i}')
+        write_time = perf_counter() - started
+
+        def join(user_id):
+            return Post.objects.filter(author__following__user_id=user_id)
+
+        def timeline(user_id):
+            return feed.follow_feed(User(id=user_id))
+
+        self.stdout.write(
+            f'Подписчиков на автора: {len(readers)}, '
+            f'постов: {len(authors) * posts}, '
+            f'запись с разносом: {write_time:.3f} c'
+        )
+        for name, build in (('join', join), ('timeline', timeline)):
+            sample = random.Random(0)
+            started = perf_counter()
+            for _ in range(repeat):
+                page = Paginator(build(sample.choice(readers)), PAGE_SIZE)
+                list(page.get_page(1))
+            elapsed = (perf_counter() - started) / repeat
+            self.stdout.write(f'{name}: {elapsed * 1000:.2f} мс на страницу')
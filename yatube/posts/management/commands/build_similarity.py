@@ -0,0 +1,95 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import batching
+from posts import sharding, similarity
+from posts.models import Post
+
+BATCH_SIZE = 2000
+CHUNK_SIZE = 250
+
+
+def _batches(after, batch_size):
+    """Вернет [(id, текст)] постов после after пачками по batch_size."""
+    rows = Post.objects.values_list('pk', 'text')
+    return batching.keyset(sharding.each_shard(rows), batch_size, after)
+
+
+def _chunks(batch, size):
+    return [batch[start:start + size] for start in range(0, len(batch), size)]
+
+
+class Command(BaseCommand):
+    """
+    Заново считает MinHash-подписи и корзины LSH всех постов,
+    например после изменения параметров similarity.
+
+    Подписи пачки считаются в процессах пула, а записываются
+    в базу главным процессом одной транзакцией на пачку.
+    """
+    help = 'Строит индекс похожих постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, 0 — работать в текущем процессе.',
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=0,
+            help='Продолжить с постов, id которых больше заданного.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько постов читать и записывать за один раз.',
+        )
+
+    def handle(self, *args, **options):
+        with batching.worker_map(options['workers']) as map_:
+            self.run(map_, **options)
+
+    def run(self, map_, after, batch_size, **options):
+        self.stdout.write(
+            f'Перестановок: {similarity.NUM_PERM}, '
+            f'полос: {similarity.BANDS} по {similarity.ROWS}'
+        )
+        started = time.perf_counter()
+        posts = signed = 0
+        for batch in _batches(after, batch_size):
+            computed = [
+                row
+                for chunk in map_(
+                    similarity.signatures, _chunks(batch, CHUNK_SIZE))
+                for row in chunk
+            ]
+            for using, post_ids in sharding.group_by_shard(
+                    pk for pk, _ in batch):
+                shard_ids = set(post_ids)
+                with transaction.atomic(using=using):
+                    similarity.store(
+                        post_ids,
+                        [row for row in computed if row[0] in shard_ids],
+                        using=using,
+                    )
+            posts += len(batch)
+            signed += len(computed)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Постов: {posts}, с подписью: {signed}, '
+                f'{posts / elapsed:.1f} постов/с. '
+                f'Продолжить: --after {batch[-1][0]}'
+            )
+        elapsed = time.perf_counter() - started
+        rate = posts / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с: постов {posts}, '
+            f'с подписью {signed}, {rate:.1f} постов/с.'
+        ))
@@ -0,0 +1,127 @@
+import os
+import shutil
+import time
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from posts import archive, caching, media
+from posts.models import Post
+from posts.storage import (content_hash, content_name, is_content_name,
+                           post_images)
+
+UPLOAD_TO = 'posts'
+
+
+def _hash_file(name):
+    with open(post_images.path(name), 'rb') as file:
+        return name, content_hash(file)
+
+
+def _legacy_files():
+    """
+    Вернет имена файлов в каталоге загрузок, названных еще
+    не по содержимому.
+    """
+    root = post_images.path(UPLOAD_TO)
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            path = os.path.join(directory, file_name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            name = f'{UPLOAD_TO}/{relative}'
+            if not is_content_name(name):
+                yield name
+
+
+class Command(BaseCommand):
+    """
+    Переводит загруженные картинки на имена по содержимому:
+    одинаковые файлы сливаются в один, посты переключаются на него.
+
+    Команду можно прервать и запустить снова: исходный файл
+    удаляется последним, после переключения постов.
+    """
+    help = 'Удаляет дубликаты картинок постов, хешируя их в процессах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов для хеширования, 0 — в текущем.',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать дубликаты, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        names = list(_legacy_files())
+        started = time.perf_counter()
+        if options['workers']:
+            with Pool(options['workers']) as pool:
+                hashed = list(pool.imap_unordered(
+                    _hash_file, names, chunksize=16))
+        else:
+            hashed = [_hash_file(name) for name in names]
+        hash_time = time.perf_counter() - started
+        targets = set()
+        duplicates = saved = 0
+        for name, digest in sorted(hashed):
+            target = content_name(name, digest)
+            if target in targets or post_images.exists(target):
+                duplicates += 1
+                saved += post_images.size(name)
+            targets.add(target)
+            if not options['dry_run']:
+                self.move(name, target)
+        if not options['dry_run']:
+            media.recount()
+        self.stdout.write(
+            f'Файлов: {len(names)}, уникальных: {len(targets)}, '
+            f'дубликатов: {duplicates}, освобождено: {saved / 2 ** 20:.1f} '
+            f'МБ. Хеширование: {hash_time:.1f} с, '
+            f'{len(names) / hash_time if hash_time else 0:.0f} файлов/с.'
+        )
+        if options['dry_run']:
+            self.stdout.write('Пробный запуск, изменений нет.')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Готово. Миниатюры пересоздаст warm_thumbnails.'))
+
+    def move(self, name, target):
+        """
+        Переключит посты с name на target и удалит name.
+
+        Сначала target появляется на диске, затем меняются посты,
+        и только потом удаляется исходный файл.
+        """
+        if not post_images.exists(target):
+            os.makedirs(os.path.dirname(post_images.path(target)),
+                        exist_ok=True)
+            try:
+                os.link(post_images.path(name), post_images.path(target))
+            except OSError:
+                shutil.copyfile(
+                    post_images.path(name), post_images.path(target))
+        scopes = set()
+        for posts in archive.each_database(Post.objects.filter(image=name)):
+            with transaction.atomic(using=posts.db):
+                for post in posts.only('id', 'author_id', 'group_id'):
+                    scopes.update(caching.post_scopes(post))
+                posts.update(
+                    image=target,
+                    thumbnail_url='',
+                    thumbnail_width=None,
+                    thumbnail_height=None,
+                    thumbnail_srcset='',
+                    thumbnail_sources='',
+                )
+        if scopes:
+            caching.bump(*scopes)
+        delete_thumbnails(ImageFile(name, post_images), delete_file=False)
+        post_images.delete(name)
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters, media
+
+
+class Command(BaseCommand):
+    """
+    Пересчитывает денормализованные счетчики авторов, групп и постов
+    и ссылки на файлы картинок.
+    """
+    help = 'Исправляет расхождения в сохраненных счетчиках.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=counters.BATCH_SIZE,
+            help='Сколько записей пересчитывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        self.stdout.write(
+            f'Авторов: {counters.recount_authors(batch_size)}, '
+            f'групп: {counters.recount_groups(batch_size)}, '
+            f'постов: {counters.recount_posts(batch_size)}, '
+            f'файлов: {media.recount(batch_size)}'
+        )
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import resharding, sharding
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    """
+    Раскладывает по шардам посты, созданные до шардирования.
+
+    Автоинкремент выдавал id без оглядки на шард автора, поэтому
+    такие посты не находятся по id % числа шардов. Команда копирует
+    справочники в шарды, сдвигает последовательность id за уже
+    выданные и переносит каждый такой пост в шард автора под новым
+    id. Запускается один раз после включения DATABASE_SHARDS, до
+    первых новых постов; старые ссылки на перенесенные посты
+    перестают открываться.
+    """
+    help = 'Переносит посты, созданные до шардирования, в шарды авторов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько постов переносить за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharded():
+            raise CommandError('DATABASE_SHARDS не задан.')
+        resharding.mirror_references()
+        resharding.advance_sequence()
+        total = 0
+        for alias in sharding.shards():
+            while True:
+                post_ids = list(
+                    resharding.misplaced(alias).order_by('pk')
+                    .values_list('pk', flat=True)[:options['batch_size']]
+                )
+                if not post_ids:
+                    break
+                renamed = resharding.reshard(alias, post_ids)
+                total += len(renamed)
+                if options['verbosity'] > 1:
+                    for old_id, new_id in renamed.items():
+                        self.stdout.write(f'{old_id} -> {new_id}')
+                self.stdout.write(f'{alias}: перенесено {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено постов: {total}'))
@@ -0,0 +1,89 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import batching
+from posts import sharding, thumbnails
+from posts.models import Post
+
+BATCH_SIZE = 500
+
+
+def _warm(post_id):
+    try:
+        return post_id, thumbnails.warm(post_id)
+    except Exception:
+        thumbnails.logger.exception(
+            'Не удалось создать миниатюры поста %s', post_id)
+        return post_id, None
+
+
+def _batches(after, batch_size):
+    """Вернет id постов с картинками после after пачками по batch_size."""
+    ids = Post.objects.exclude(image='').values_list('pk', flat=True)
+    return batching.keyset(sharding.each_shard(ids), batch_size, after)
+
+
+class Command(BaseCommand):
+    """
+    Создает миниатюры всех картинок постов заранее, чтобы после
+    выкладки или сброса кэша их не создавали первые посетители.
+    """
+    help = 'Создает миниатюры картинок постов в нескольких процессах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов, 0 — работать в текущем процессе.',
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=0,
+            help='Продолжить с постов, id которых больше заданного.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Сколько постов читать из базы за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        with batching.worker_map(options['workers']) as map_:
+            self.run(map_, **options)
+
+    def run(self, map_, after, batch_size, **options):
+        geometries = (thumbnails.GEOMETRY,
+                      *settings.THUMBNAIL_EXTRA_GEOMETRIES)
+        widths = ', '.join(map(str, settings.THUMBNAIL_WIDTHS))
+        formats = ', '.join(['исходный', *thumbnails.modern_formats()])
+        self.stdout.write(
+            f'Геометрии: {", ".join(geometries)}; '
+            f'ширины вариантов: {widths}; форматы: {formats}'
+        )
+        started = time.perf_counter()
+        posts = created = failed = 0
+        for batch in _batches(after, batch_size):
+            for post_id, count in map_(_warm, batch):
+                posts += 1
+                if count is None:
+                    failed += 1
+                else:
+                    created += count
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'Постов: {posts}, миниатюр: {created}, '
+                f'{posts / elapsed:.1f} постов/с. '
+                f'Продолжить: --after {batch[-1]}'
+            )
+        elapsed = time.perf_counter() - started
+        rate = posts / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с: постов {posts}, '
+            f'миниатюр {created}, ошибок {failed}, {rate:.1f} постов/с.'
+        ))
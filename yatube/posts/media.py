@@ -0,0 +1,107 @@
+import logging
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from . import archive
+from .models import Post, StoredFile
+from .storage import is_content_name, post_images
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def retain(name):
+    """
+    Увеличит число ссылок на файл, создав счетчик при первой ссылке.
+
+    Считаются только файлы, названные хранилищем по содержимому.
+    """
+    if not is_content_name(name):
+        return
+    references = StoredFile.objects.filter(pk=name)
+    if references.update(references=F('references') + 1):
+        return
+    try:
+        with transaction.atomic():
+            StoredFile.objects.create(name=name, references=1)
+    except IntegrityError:
+        references.update(references=F('references') + 1)
+
+
+def release(name):
+    """
+    Уменьшит число ссылок на файл. Файл без ссылок удаляется вместе
+    с миниатюрами после коммита.
+
+    Файлы без счетчика, загруженные до его появления, не трогаются.
+    """
+    if not is_content_name(name):
+        return
+    StoredFile.objects.filter(pk=name, references__gte=1).update(
+        references=F('references') - 1)
+    transaction.on_commit(lambda: _delete_unreferenced(name))
+
+
+def discard(name):
+    """
+    Удалит файл, записанный в откатившейся транзакции, если ссылки
+    на него так и не появилось.
+    """
+    try:
+        with transaction.atomic():
+            if StoredFile.objects.select_for_update().filter(
+                pk=name
+            ).exists():
+                return
+            post_images.delete(name)
+    except Exception:
+        logger.exception('Не удалось удалить файл %s', name)
+
+
+def _delete_unreferenced(name):
+    """
+    Удалит файл, если на него по-прежнему нет ссылок: хранилище могло
+    взять ссылку на тот же файл после release(). Файл удаляется, только
+    если DELETE счетчика с references=0 удалил строку — проверка и
+    удаление идут одним запросом, без блокировок, которых нет в SQLite.
+    """
+    deleted, _ = StoredFile.objects.filter(pk=name, references=0).delete()
+    if not deleted:
+        return
+    try:
+        delete_thumbnails(ImageFile(name, post_images))
+    except Exception:
+        logger.exception('Не удалось удалить файл %s', name)
+
+
+def recount(batch_size=BATCH_SIZE):
+    """
+    Пересчитает ссылки на все файлы по таблице постов.
+    Вернет число файлов.
+    """
+    counted = Counter()
+    for posts in archive.each_database(Post.objects.exclude(image='')):
+        counted.update({
+            name: total for name, total in
+            posts.values_list('image').annotate(total=Count('pk')).order_by()
+            if is_content_name(name)
+        })
+    existing = set(StoredFile.objects.values_list('pk', flat=True))
+    with transaction.atomic():
+        StoredFile.objects.bulk_update(
+            [StoredFile(name=name, references=counted.get(name, 0))
+             for name in existing],
+            ['references'],
+            batch_size=batch_size,
+        )
+        StoredFile.objects.bulk_create(
+            [StoredFile(name=name, references=total)
+             for name, total in counted.items() if name not in existing],
+            batch_size=batch_size,
+        )
+    return len(existing | set(counted))
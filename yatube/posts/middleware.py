@@ -0,0 +1,143 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date, urlencode
+
+from . import caching
+
+PAGE_KEY = 'posts:page:{}'
+SCOPES_KEY = 'posts:page-scopes:{}'
+
+
+def _is_anonymous(request):
+    """
+    Проверит анонимность по отсутствию сессионной куки,
+    не обращаясь к хранилищу сессий.
+    """
+    return (
+        request.method == 'GET'
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def _page_key(request):
+    """
+    Вернет ключ страницы: путь и значения параметров
+    caching.PAGE_CACHE_PARAMS в постоянном порядке.
+    """
+    params = [
+        (name, request.GET[name])
+        for name in caching.PAGE_CACHE_PARAMS if name in request.GET
+    ]
+    return f'{request.path}?{urlencode(params)}'
+
+
+def _etag(versions):
+    """Вернет ETag страницы по поколениям ее областей."""
+    state = '|'.join(
+        f'{scope}={generation}' for scope, generation in versions.items()
+    )
+    return quote_etag(hashlib.md5(state.encode()).hexdigest())
+
+
+def _snapshot(scopes):
+    """
+    Вернет поколения областей, время их изменения и поколение
+    caching.ANY_SCOPE.
+    """
+    *generations, written = caching.generations(*scopes, caching.ANY_SCOPE)
+    last_modified = int(caching.modified(*scopes)) if scopes else 0
+    return dict(zip(scopes, generations)), last_modified, written
+
+
+def _set_validators(response, etag, last_modified):
+    """
+    Проставит ETag и Last-Modified, снятые вместе с поколениями
+    страницы, если представление не задало своих.
+    """
+    response.setdefault('ETag', etag)
+    if not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Кэш целых страниц и условные GET для анонимных посетителей.
+
+    Представление помечает страницу областями через
+    caching.cache_page_scopes(). Вместе с ответом сохраняются
+    поколения этих областей, и при следующем запросе страница
+    отдается из кэша, только если поколения не изменились. Ключ
+    страницы — путь и значимые параметры запроса, см. _page_key().
+
+    ETag страницы строится из тех же поколений, а Last-Modified —
+    из времени последнего изменения областей. Области страницы
+    помнятся дольше самой страницы, PAGE_VALIDATOR_TIMEOUT, поэтому
+    If-None-Match и If-Modified-Since получают 304 и после того,
+    как страница вытеснена из кэша.
+    Проверка идет только по кэшу, без запросов к базе.
+
+    Поколения снимаются до вызова представления, и страница
+    сохраняется под ними: изменение, сделанное, пока представление
+    читало базу, сбросит ее при следующем запросе. Если области
+    страницы еще не известны, она сохраняется, только когда за время
+    представления не сдвинулось ни одно поколение.
+
+    Страница, прочитанная с реплики, отдается без сохранения и без
+    валидаторов, см. caching.can_store().
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _is_anonymous(request):
+            return self.get_response(request)
+        key = _page_key(request)
+        known = cache.get(SCOPES_KEY.format(key)) or ()
+        versions, last_modified, written = _snapshot(known)
+        if known:
+            etag = _etag(versions)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return _set_validators(response, etag, last_modified)
+            response = self._cached(key, versions)
+            if response is not None:
+                return response
+        response = self.get_response(request)
+        scopes = getattr(request, 'page_cache_scopes', None)
+        if (
+            not scopes
+            or response.status_code != 200
+            or response.cookies
+            or not caching.can_store()
+        ):
+            return response
+        if tuple(scopes) != tuple(known):
+            # Области стали известны только после представления: их
+            # поколения годятся, если за это время ничего не менялось.
+            versions, last_modified, changed = _snapshot(scopes)
+            if changed != written:
+                return response
+        _set_validators(response, _etag(versions), last_modified)
+        cache.set(
+            SCOPES_KEY.format(key), tuple(scopes),
+            settings.PAGE_VALIDATOR_TIMEOUT)
+        if settings.PAGE_CACHE_TIMEOUT:
+            cache.set(
+                PAGE_KEY.format(key), (versions, response),
+                settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    def _cached(self, key, versions):
+        """Вернет страницу из кэша, если ее поколения не изменились."""
+        if not settings.PAGE_CACHE_TIMEOUT:
+            return None
+        cached = cache.get(PAGE_KEY.format(key))
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+        return None
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_sources',
+            field=models.TextField(blank=True, editable=False, help_text='JSON-список {"type": ..., "srcset": ...} для <picture>', verbose_name='Миниатюры в других форматах'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_srcset',
+            field=models.TextField(blank=True, editable=False, verbose_name='Размеры миниатюры'),
+        ),
+    ]
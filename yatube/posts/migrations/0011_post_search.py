@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# В индексе «ё» заменена на «е»: unicode61 не считает их одной буквой.
+NORMALIZED = "replace(replace({}.text, 'ё', 'е'), 'Ё', 'Е')"
+
+CREATE = [
+    "CREATE VIRTUAL TABLE posts_post_search USING fts5("
+    "text, content='', tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO posts_post_search(rowid, text) "
+    f"SELECT id, {NORMALIZED.format('posts_post')} FROM posts_post",
+    "CREATE TRIGGER posts_post_search_insert AFTER INSERT ON posts_post "
+    "BEGIN INSERT INTO posts_post_search(rowid, text) "
+    f"VALUES (new.id, {NORMALIZED.format('new')}); END",
+    "CREATE TRIGGER posts_post_search_delete AFTER DELETE ON posts_post "
+    "BEGIN INSERT INTO posts_post_search(posts_post_search, rowid, text) "
+    f"VALUES ('delete', old.id, {NORMALIZED.format('old')}); END",
+    "CREATE TRIGGER posts_post_search_update AFTER UPDATE OF text "
+    "ON posts_post "
+    "BEGIN INSERT INTO posts_post_search(posts_post_search, rowid, text) "
+    f"VALUES ('delete', old.id, {NORMALIZED.format('old')}); "
+    "INSERT INTO posts_post_search(rowid, text) "
+    f"VALUES (new.id, {NORMALIZED.format('new')}); END",
+]
+
+DROP = [
+    'DROP TRIGGER posts_post_search_update',
+    'DROP TRIGGER posts_post_search_delete',
+    'DROP TRIGGER posts_post_search_insert',
+    'DROP TABLE posts_post_search',
+]
+
+
+class Migration(migrations.Migration):
+    """
+    Полнотекстовый индекс FTS5 по тексту постов.
+
+    Таблица без содержимого (content=''): текст хранится только
+    в posts_post, индекс поддерживают триггеры, в том числе
+    для bulk_create и update().
+    """
+
+    dependencies = [
+        ('posts', '0010_stored_files'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, DROP),
+    ]
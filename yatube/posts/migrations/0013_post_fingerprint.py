@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostFingerprint',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='posts.Post', verbose_name='Пост')),
+                ('created', models.DateTimeField(verbose_name='Дата публикации')),
+                ('simhash', models.BigIntegerField(verbose_name='Отпечаток')),
+                ('band0', models.PositiveIntegerField(verbose_name='Полоса 0')),
+                ('band1', models.PositiveIntegerField(verbose_name='Полоса 1')),
+                ('band2', models.PositiveIntegerField(verbose_name='Полоса 2')),
+                ('band3', models.PositiveIntegerField(verbose_name='Полоса 3')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fingerprints', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Отпечаток поста',
+                'verbose_name_plural': 'Отпечатки постов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='postfingerprint',
+            index=models.Index(fields=['band0', 'created'], name='fingerprint_band0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postfingerprint',
+            index=models.Index(fields=['band1', 'created'], name='fingerprint_band1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postfingerprint',
+            index=models.Index(fields=['band2', 'created'], name='fingerprint_band2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postfingerprint',
+            index=models.Index(fields=['band3', 'created'], name='fingerprint_band3_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='timeline_pending',
+            field=models.BooleanField(default=False, help_text='Автор перестал быть знаменитостью, но его посты еще не дописаны в ленты подписчиков', verbose_name='Ленты ждут заполнения'),
+        ),
+    ]
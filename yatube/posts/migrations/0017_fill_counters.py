@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# Счетчики автора: модель и поле со ссылкой на автора.
+AUTHOR_COUNTERS = {
+    'posts_count': ('Post', 'author'),
+    'comments_count': ('Comment', 'author'),
+    'followers_count': ('Follow', 'author'),
+    'following_count': ('Follow', 'user'),
+}
+
+
+def _count(model, field, using):
+    """Вернет выражение: число строк model, ссылающихся полем field."""
+    rows = model._default_manager.using(using).filter(
+        **{field: OuterRef('pk')}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    """
+    Заполнит счетчики, добавленные в 0007 со значением 0: до этой
+    миграции строки без сигналов оставались с нулями.
+    """
+    using = schema_editor.connection.alias
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Group._default_manager.using(using).update(
+        posts_count=_count(Post, 'group', using))
+    Post._default_manager.using(using).update(
+        comments_count=_count(Comment, 'post', using))
+    missing = User._default_manager.using(using).filter(
+        stats__isnull=True).values_list('pk', flat=True)
+    AuthorStats._default_manager.using(using).bulk_create(
+        [AuthorStats(author_id=pk) for pk in missing.iterator()],
+        batch_size=500,
+    )
+    AuthorStats._default_manager.using(using).update(**{
+        name: _count(apps.get_model('posts', model), field, using)
+        for name, (model, field) in AUTHOR_COUNTERS.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0016_authorstats_timeline_pending'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
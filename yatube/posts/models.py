@@ -1,29 +1,109 @@
+import json
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .sharding import ShardedQuerySet
+from .storage import post_images
+
 User = get_user_model()
 
 
-class Group(models.Model):
+class CountedModel(models.Model):
+    """
+    Модель с денормализованными счетчиками.
+
+    Счетчики меняются только атомарными F()-обновлениями, поэтому
+    при сохранении существующей записи они не перезаписываются.
+    """
+    counter_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """Сохранит запись, не трогая счетчики."""
+        if not self._state.adding and not kwargs.get('force_insert'):
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key
+                    and field.name not in self.counter_fields
+                ]
+        super().save(*args, **kwargs)
+
+
+class Group(CountedModel):
     """Модель группы."""
+    counter_fields = ('posts_count',)
+
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, max_length=50)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self):
         """Вернет название группы."""
         return self.title
 
 
-class Post(models.Model):
+class PostQuerySet(ShardedQuerySet):
+    """Запросы к постам."""
+
+    FEED_DEFERRED = (
+        'author__password',
+        'author__last_login',
+        'author__email',
+        'author__date_joined',
+        'group__description',
+    )
+
+    def for_feed(self):
+        """
+        Вернет посты для ленты: автор и группа подгружаются тем же
+        запросом, а неиспользуемые в ленте колонки не читаются.
+        Число комментариев берется из сохраненного счетчика.
+        """
+        return self.select_related('author', 'group').defer(
+            *self.FEED_DEFERRED
+        )
+
+
+class Post(CountedModel):
     """Модель поста."""
+    counter_fields = ('comments_count',)
+    # Поля, прежние значения которых сигналы сравнивают при сохранении.
+    # Они запоминаются при чтении из базы, без лишнего SELECT.
+    tracked_fields = ('group', 'image', 'text')
+
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         """
         Сортировка по убыванию
         по дате публикации.
+
+        Индексы отдают ленты по ключу (pub_date, id) без сортировки:
+        id в SQLite дописывается в конец каждого индекса по возрастанию,
+        поэтому и дата в индексе по возрастанию, а читается он с конца.
         """
         ordering = ['-pub_date']
+        indexes = (
+            models.Index(
+                fields=['pub_date'],
+                name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='post_author_pub_date_idx'),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='post_group_pub_date_idx'),
+        )
 
     text = models.TextField(
         verbose_name='Текст поста',
@@ -50,22 +130,113 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_images,
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False
+    )
+    thumbnail_url = models.CharField(
+        'Адрес миниатюры',
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    thumbnail_width = models.PositiveIntegerField(
+        'Ширина миниатюры',
+        null=True,
+        editable=False
+    )
+    thumbnail_height = models.PositiveIntegerField(
+        'Высота миниатюры',
+        null=True,
+        editable=False
+    )
+    thumbnail_srcset = models.TextField(
+        'Размеры миниатюры',
+        blank=True,
+        editable=False
+    )
+    thumbnail_sources = models.TextField(
+        'Миниатюры в других форматах',
+        blank=True,
+        editable=False,
+        help_text='JSON-список {"type": ..., "srcset": ...} для <picture>'
+    )
 
     def __str__(self):
         """Вернет текст поста."""
         return self.text[:settings.LAST_SYMBOLS]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Прочитает пост и запомнит значения tracked_fields."""
+        instance = super().from_db(db, field_names, values)
+        instance._track(cls.tracked_fields)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        """Перечитает пост и запомнит перечитанные tracked_fields."""
+        super().refresh_from_db(using=using, fields=fields)
+        self._track(self.tracked_fields, fields)
+
+    def save(self, *args, **kwargs):
+        """Сохранит пост и запомнит сохраненные tracked_fields."""
+        super().save(*args, **kwargs)
+        self._track(self.tracked_fields, kwargs.get('update_fields'))
+
+    def _track(self, names, only=None):
+        """
+        Запомнит текущие значения полей names как сохраненные.
+        Отложенные поля и поля не из only пропускаются.
+        """
+        tracked = self.__dict__.setdefault('_tracked', {})
+        deferred = self.get_deferred_fields()
+        for name in names:
+            attname = self._meta.get_field(name).attname
+            if attname in deferred or (
+                only is not None and name not in only
+                and attname not in only
+            ):
+                continue
+            value = getattr(self, attname)
+            tracked[name] = (value.name or '') if name == 'image' else value
+
+    def saved_values(self):
+        """
+        Вернет {поле: значение в базе} для tracked_fields или None,
+        если пост прочитан не целиком.
+        """
+        tracked = self.__dict__.get('_tracked', {})
+        if len(tracked) < len(self.tracked_fields):
+            return None
+        return tracked
+
+    @property
+    def picture_sources(self):
+        """Вернет сохраненные варианты миниатюры для <source>."""
+        if not self.thumbnail_sources:
+            return []
+        return json.loads(self.thumbnail_sources)
+
 
 class Comment(models.Model):
     """Модель комментария."""
+    objects = ShardedQuerySet.as_manager()
+
     class Meta:
         """
         Сортировка по убыванию
         по дате публикации.
         """
         ordering = ['-created']
+        indexes = (
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'),
+        )
 
     post = models.ForeignKey(
         Post,
@@ -115,12 +286,260 @@ class Follow(models.Model):
 
     class Meta:
         """
-        Создание уникальных пар между автором и подписчиком.
+        Создание уникальных пар между автором и подписчиком
+        и индекс подписчиков автора для разноса постов по лентам.
         """
         verbose_name_plural = 'Подписки'
         verbose_name = 'Подписка'
         constraints = (
             models.UniqueConstraint(
                 fields=['user', 'author'],
-                name='unique_connection')
+                name='unique_connection'),
         )
+        indexes = (
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'),
+        )
+
+
+class AuthorStats(models.Model):
+    """
+    Счетчики автора.
+
+    Хранятся отдельно от пользователя и обновляются сигналами,
+    чтобы страницы не считали посты и подписки на каждый запрос.
+    """
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0
+    )
+    timeline_pending = models.BooleanField(
+        verbose_name='Ленты ждут заполнения',
+        default=False,
+        help_text='Автор перестал быть знаменитостью, но его посты '
+                  'еще не дописаны в ленты подписчиков'
+    )
+
+    def __str__(self):
+        """Вернет информацию о счетчиках."""
+        return f'Счетчики {self.author}'
+
+    class Meta:
+        verbose_name_plural = 'Счетчики авторов'
+        verbose_name = 'Счетчики автора'
+
+
+class StoredFile(models.Model):
+    """
+    Счетчик ссылок постов на файл картинки.
+
+    Одинаковые картинки хранятся одним файлом, поэтому файл
+    удаляется, только когда на него не ссылается ни один пост.
+    """
+    name = models.CharField(
+        'Имя файла',
+        max_length=255,
+        primary_key=True
+    )
+    references = models.PositiveIntegerField(
+        'Число ссылок',
+        default=0
+    )
+
+    def __str__(self):
+        """Вернет имя файла."""
+        return self.name
+
+    class Meta:
+        verbose_name_plural = 'Файлы картинок'
+        verbose_name = 'Файл картинки'
+
+
+class PostSignature(models.Model):
+    """
+    MinHash-подпись текста поста для поиска похожих постов.
+
+    Подпись — NUM_PERM беззнаковых 32-битных минимумов, см. similarity.
+    """
+    objects = ShardedQuerySet.as_manager()
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Пост'
+    )
+    minhash = models.BinaryField(
+        verbose_name='Подпись'
+    )
+
+    def __str__(self):
+        """Вернет информацию о подписи."""
+        return f'Подпись поста {self.post_id}'
+
+    class Meta:
+        verbose_name_plural = 'Подписи постов'
+        verbose_name = 'Подпись поста'
+
+
+class SimilarityBucket(models.Model):
+    """
+    Корзина LSH: пост попадает в одну корзину на каждую полосу
+    подписи, и похожие посты чаще всего делят корзины.
+
+    Индекс (key, post) покрывает поиск соседей по корзинам.
+    """
+    objects = ShardedQuerySet.as_manager()
+
+    key = models.BigIntegerField(
+        verbose_name='Ключ корзины'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='similarity_buckets',
+        verbose_name='Пост'
+    )
+
+    def __str__(self):
+        """Вернет информацию о корзине."""
+        return f'{self.post_id} в корзине {self.key}'
+
+    class Meta:
+        verbose_name_plural = 'Корзины похожих постов'
+        verbose_name = 'Корзина похожих постов'
+        indexes = (
+            models.Index(
+                fields=['key', 'post'],
+                name='similarity_key_post_idx'),
+        )
+
+
+class PostFingerprint(models.Model):
+    """
+    SimHash текста поста для поиска почти одинаковых постов.
+
+    64 бита отпечатка разбиты на четыре полосы по 16 бит:
+    у отпечатков, различающихся не больше чем в трех битах, совпадает
+    хотя бы одна полоса, и кандидатов находит индекс по полосе.
+    """
+    objects = ShardedQuerySet.as_manager()
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='fingerprint',
+        verbose_name='Пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='fingerprints',
+        verbose_name='Автор'
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+    simhash = models.BigIntegerField(
+        verbose_name='Отпечаток'
+    )
+    band0 = models.PositiveIntegerField('Полоса 0')
+    band1 = models.PositiveIntegerField('Полоса 1')
+    band2 = models.PositiveIntegerField('Полоса 2')
+    band3 = models.PositiveIntegerField('Полоса 3')
+
+    def __str__(self):
+        """Вернет информацию об отпечатке."""
+        return f'Отпечаток поста {self.post_id}'
+
+    class Meta:
+        verbose_name_plural = 'Отпечатки постов'
+        verbose_name = 'Отпечаток поста'
+        indexes = [
+            models.Index(
+                fields=[f'band{band}', 'created'],
+                name=f'fingerprint_band{band}_idx')
+            for band in range(4)
+        ]
+
+
+class Timeline(models.Model):
+    """
+    Материализованная лента подписок.
+
+    Строка пишется каждому подписчику при создании поста, поэтому
+    лента читается одним диапазоном по индексу (user, pub_date, post).
+    """
+    objects = ShardedQuerySet.as_manager()
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    def __str__(self):
+        """Вернет информацию о записи ленты."""
+        return f'{self.post_id} в ленте {self.user}'
+
+    class Meta:
+        """
+        Уникальная пара подписчик-пост и индекс для чтения ленты.
+        """
+        verbose_name_plural = 'Ленты подписок'
+        verbose_name = 'Запись ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'),
+        )
+        indexes = (
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='timeline_user_date_post_idx'),
+        )
+
+
+class PostSequence(models.Model):
+    """
+    Последовательность id постов при шардировании.
+
+    Номер берется из основной базы, а шард автора дописывается
+    к нему, см. sharding.new_post_id.
+    """
+
+    class Meta:
+        verbose_name_plural = 'Номера постов'
+        verbose_name = 'Номер поста'
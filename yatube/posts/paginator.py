@@ -0,0 +1,145 @@
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.utils.functional import SimpleLazyObject
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_cursor(obj, field='pub_date'):
+    """
+    Вернет непрозрачный курсор для ключа (field, id) записи
+    или словаря из values().
+    Даты кодируются в ISO 8601, остальные значения — str().
+    """
+    if isinstance(obj, dict):
+        value, pk = obj[field], obj['id']
+    else:
+        value, pk = getattr(obj, field), obj.pk
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return urlsafe_base64_encode(f'{value}|{pk}'.encode())
+
+
+def decode_cursor(token, parse=parse_datetime):
+    """
+    Вернет ключ (значение, id) из курсора или None,
+    если курсор отсутствует или поврежден.
+
+    parse превращает строку в значение ключа, по умолчанию в дату.
+    """
+    if not token:
+        return None
+    try:
+        value, pk = force_str(urlsafe_base64_decode(token)).split('|')
+        value, pk = parse(value), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+def seek(queryset, after=None, before=None, field='pub_date', pk='id'):
+    """
+    Отфильтрует queryset по ключу (field, pk).
+
+    С after вернет записи старше курсора по убыванию ключа,
+    с before — записи новее курсора по возрастанию ключа.
+
+    Лишнее на первый взгляд условие field >= или <= значения курсора
+    дает SQLite диапазон по индексу: по одному OR индекс не выбирается.
+    """
+    if before is not None:
+        pub_date, key = before
+        return queryset.filter(
+            Q(**{f'{field}__gt': pub_date})
+            | Q(**{field: pub_date, f'{pk}__gt': key}),
+            **{f'{field}__gte': pub_date},
+        ).order_by(field, pk)
+    if after is not None:
+        pub_date, key = after
+        queryset = queryset.filter(
+            Q(**{f'{field}__lt': pub_date})
+            | Q(**{field: pub_date, f'{pk}__lt': key}),
+            **{f'{field}__lte': pub_date},
+        )
+    return queryset.order_by(f'-{field}', f'-{pk}')
+
+
+class CursorPaginator(Paginator):
+    """
+    Пагинатор по ключу (field, id), по умолчанию (pub_date, id).
+
+    Не считает общее число записей и не использует OFFSET:
+    страница читается одним диапазоном по индексу. Вместо номеров
+    страниц у страницы есть next_cursor и previous_cursor.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, after=None, before=None,
+                 field='pub_date'):
+        super().__init__(object_list, per_page)
+        self.after = after
+        self.before = before
+        self.field = field
+
+    def _seek(self, after=None, before=None):
+        if isinstance(self.object_list, QuerySet):
+            return seek(
+                self.object_list, after=after, before=before, field=self.field
+            )
+        return self.object_list.seek(after=after, before=before)
+
+    def page(self, number=1):
+        """Вернет страницу, на которую указывает курсор."""
+        limit = self.per_page + 1
+        if self.before is not None:
+            items = list(self._seek(before=self.before)[:limit])
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            has_next = True
+        else:
+            items = list(self._seek(after=self.after)[:limit])
+            has_next = len(items) > self.per_page
+            items = items[:self.per_page]
+            has_previous = self.after is not None
+        page = self._get_page(items, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if items and has_next:
+            page.next_cursor = encode_cursor(items[-1], self.field)
+        if items and has_previous:
+            page.previous_cursor = encode_cursor(items[0], self.field)
+        return page
+
+
+def paginate(request, object_list, per_page, count=None):
+    """
+    Вернет страницу списка постов.
+
+    По умолчанию используется курсор из ?after=/?before=,
+    а при ?page=N — обычная постраничная навигация.
+    Если известен сохраненный счетчик count, COUNT(*) не выполняется.
+    """
+    if 'page' in request.GET:
+        paginator = Paginator(object_list, per_page)
+        if count is not None:
+            paginator.count = count
+        return paginator.get_page(request.GET.get('page'))
+    paginator = CursorPaginator(
+        object_list,
+        per_page,
+        after=decode_cursor(request.GET.get('after')),
+        before=decode_cursor(request.GET.get('before')),
+    )
+    return paginator.page()
+
+
+def lazy_paginate(request, object_list, per_page, count=None):
+    """
+    Как paginate, но страница читается при первом обращении:
+    если шаблон взял список из {% cache %}, посты не читаются.
+    """
+    return SimpleLazyObject(
+        lambda: paginate(request, object_list, per_page, count=count))
@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.functions import Mod
+
+from . import archive, caching, sharding
+from .models import Comment, Group, Post, PostSequence
+
+User = get_user_model()
+
+# Строки, которые переезжают вместе с постом под его новым id.
+POST_ROWS = (Comment, *archive.HOT_ONLY_MODELS)
+
+
+def mirror_references():
+    """
+    Скопирует в шарды всех пользователей и групп: сигналы копируют
+    только тех, кто сохранялся после включения шардирования.
+    """
+    for model in (User, Group):
+        for instance in model._base_manager.iterator():
+            sharding.mirror(instance)
+
+
+def advance_sequence():
+    """
+    Сдвинет последовательность id постов за самый большой из уже
+    выданных: до шардирования id выдавал автоинкремент, и новые
+    id совпали бы со старыми.
+    """
+    count = len(sharding.shards())
+    top = max(
+        queryset.aggregate(top=models.Max('pk'))['top'] or 0
+        for queryset in archive.each_database(Post._base_manager.all())
+    )
+    sequence = top // count + 1
+    if PostSequence.objects.filter(pk__gte=sequence).exists():
+        return
+    PostSequence.objects.create(pk=sequence)
+    connection = connections[DEFAULT_DB_ALIAS]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+            no_style(), [PostSequence]
+        ):
+            cursor.execute(sql)
+
+
+def misplaced(alias):
+    """
+    Вернет посты шарда alias, которые лежат не в шарде автора или
+    чей id указывает на другой шард. Такие посты остаются от базы
+    без шардирования.
+    """
+    aliases = sharding.shards()
+    index = aliases.index(alias)
+    return Post._base_manager.using(alias).annotate(
+        id_shard=Mod('id', len(aliases)),
+        author_shard=Mod('author_id', len(aliases)),
+    ).exclude(id_shard=index, author_shard=index)
+
+
+def _copy_renumbered(model, rows, using):
+    """Вставит строки в базу using, автоинкрементные id выдаст она."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not isinstance(field, models.AutoField)
+    ]
+    archive.copy_rows(model, rows, using, fields)
+
+
+def reshard(using, post_ids):
+    """
+    Перенесет посты post_ids базы using в шарды их авторов под
+    новыми id. Вернет {старый id: новый id}.
+
+    Комментарии и строки, построенные по посту, переезжают вместе
+    с ним. Как и в archive.move, строки удаляются без сигналов:
+    счетчики и ссылки на картинки не меняются. Страницы со старыми
+    id сбрасываются — по ним пост больше не найти.
+    """
+    posts = list(Post._base_manager.using(using).filter(pk__in=post_ids))
+    rows = {
+        model: list(
+            model._base_manager.using(using).filter(post_id__in=post_ids))
+        for model in POST_ROWS
+    }
+    renamed = {
+        post.pk: sharding.new_post_id(
+            PostSequence.objects.create().pk, post.author_id)
+        for post in posts
+    }
+    targets = {}
+    for post in posts:
+        caching.bump(*caching.post_scopes(post))
+        targets.setdefault(
+            sharding.shard_for_author(post.author_id), []).append(post)
+    with transaction.atomic(using=using):
+        for alias, moved in targets.items():
+            old_ids = {post.pk for post in moved}
+            with transaction.atomic(using=alias):
+                for post in moved:
+                    post.pk = renamed[post.pk]
+                archive.copy_rows(Post, moved, alias)
+                for model, model_rows in rows.items():
+                    model_rows = [
+                        row for row in model_rows if row.post_id in old_ids]
+                    for row in model_rows:
+                        row.post_id = renamed[row.post_id]
+                    _copy_renumbered(model, model_rows, alias)
+        for model in POST_ROWS:
+            model._base_manager.using(using).filter(
+                post_id__in=post_ids)._raw_delete(using)
+        Post._base_manager.using(using).filter(
+            pk__in=post_ids)._raw_delete(using)
+    return renamed
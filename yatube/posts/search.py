@@ -0,0 +1,140 @@
+import heapq
+import math
+import re
+from itertools import islice
+
+from django.db import connections
+
+from . import sharding
+from .models import Post
+
+TABLE = 'posts_post_search'
+WORD = re.compile(r'\w+')
+# Окончания русских слов, от длинных к коротким. Запрос ищет
+# основу слова, поэтому «коты», «кота» и «котами» находят «кот».
+ENDINGS = (
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ией', 'ия', 'ие', 'ий', 'ая', 'яя', 'ое', 'ее', 'ые', 'ый', 'ой',
+    'ом', 'ем', 'ах', 'ях', 'ов', 'ев', 'ей', 'ам', 'ям', 'ую', 'юю',
+    'ть', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+)
+MIN_STEM = 3
+# Основы короче ищутся не префиксом, а основой с каждым из ENDINGS:
+# префикс «кот» нашел бы и «который».
+PREFIX_MIN_STEM = 5
+
+
+def normalize(text):
+    """Приведет текст к виду, в котором он лежит в индексе."""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def words(text):
+    """Вернет слова текста в нижнем регистре, как их видит поиск."""
+    return WORD.findall(normalize(text).lower())
+
+
+def stem(word):
+    """Вернет основу слова: слово без окончания из ENDINGS."""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def _term(word):
+    base = stem(word)
+    if len(base) >= PREFIX_MIN_STEM:
+        return f'"{base}"*'
+    forms = [base] + [base + ending for ending in ENDINGS]
+    return '({})'.format(' OR '.join(f'"{form}"' for form in forms))
+
+
+def fts_query(text):
+    """
+    Вернет запрос FTS5: все слова, каждое как префикс своей основы,
+    а короткие основы — как перечень форм.
+    Вернет пустую строку, если слов нет.
+
+    Слова берутся в кавычки, поэтому синтаксис FTS5 из ввода
+    пользователя не интерпретируется. AND пишется явно: неявный
+    AND перед скобками FTS5 не разбирает.
+    """
+    return ' AND '.join(_term(word) for word in words(text))
+
+
+def parse_rank(value):
+    """Вернет ранг из курсора; бесконечность и NaN не допускаются."""
+    rank = float(value)
+    if not math.isfinite(rank):
+        raise ValueError(value)
+    return rank
+
+
+def matching_ids(query):
+    """
+    Вернет SQL и параметры подзапроса id постов, подходящих под query
+    из fts_query, для filter(pk__in=RawSQL(...)).
+    """
+    return f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', (query,)
+
+
+class SearchResults:
+    """
+    Посты, найденные полнотекстовым поиском, по релевантности.
+
+    Для CursorPaginator: ключ страницы — (search_rank, id), где
+    search_rank — bm25 из FTS5, меньше значит релевантнее.
+    При шардировании индекс свой в каждом шарде, и ранги
+    сливаются как есть: bm25 шарда считается по его постам.
+    """
+
+    def __init__(self, query, after=None, before=None):
+        self.query = query
+        self.after = after
+        self.before = before
+
+    def seek(self, after=None, before=None):
+        return type(self)(self.query, after=after, before=before)
+
+    def _ranked_ids(self, limit):
+        sql = f'SELECT rowid, rank FROM {TABLE} WHERE {TABLE} MATCH %s'
+        params = [self.query]
+        if self.before is not None:
+            sql += (' AND (rank < %s OR (rank = %s AND rowid < %s))'
+                    ' ORDER BY rank DESC, rowid DESC')
+            params += [self.before[0], self.before[0], self.before[1]]
+        else:
+            if self.after is not None:
+                sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+                params += [self.after[0], self.after[0], self.after[1]]
+            sql += ' ORDER BY rank, rowid'
+        sql += ' LIMIT %s'
+        params.append(limit)
+        ranked = []
+        for alias in sharding.shards():
+            with connections[alias].cursor() as cursor:
+                cursor.execute(sql, params)
+                ranked.append(cursor.fetchall())
+        merged = heapq.merge(
+            *ranked,
+            key=lambda row: (row[1], row[0]),
+            reverse=self.before is not None,
+        )
+        return list(islice(merged, limit))
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.start or key.stop is None:
+            raise TypeError('Поддерживаются только срезы [:n].')
+        if not self.query:
+            return []
+        ranked = self._ranked_ids(key.stop)
+        posts = sharding.in_bulk(
+            Post.objects.for_feed(), [pk for pk, _ in ranked])
+        result = []
+        for pk, rank in ranked:
+            post = posts.get(pk)
+            if post is not None:
+                post.search_rank = rank
+                result.append(post)
+        return result
@@ -0,0 +1,211 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models
+
+# Модели, строки которых живут в шарде автора поста: сам пост,
+# его комментарии и все, что строится по посту. Комментарии лежат
+# рядом с постом, чтобы страница поста читалась из одного шарда.
+SHARDED_MODELS = {
+    'posts.post',
+    'posts.comment',
+    'posts.timeline',
+    'posts.postsignature',
+    'posts.similaritybucket',
+    'posts.postfingerprint',
+}
+
+# Поля справочников, которые копируются в шарды: только те, что
+# выводятся при соединении с постами. Пароли и даты входа остаются
+# в основной базе.
+MIRRORED_FIELDS = {
+    settings.AUTH_USER_MODEL.lower(): ('username', 'first_name', 'last_name'),
+    'posts.group': ('title', 'slug', 'description'),
+}
+
+
+def shards():
+    """Вернет псевдонимы шардов, без шардирования — [default]."""
+    return list(settings.DATABASE_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded():
+    """Проверит, что посты разложены по DATABASE_SHARDS."""
+    return bool(settings.DATABASE_SHARDS)
+
+
+def shard_for_author(author_id):
+    """Вернет шард, в котором лежат посты автора."""
+    aliases = shards()
+    return aliases[author_id % len(aliases)]
+
+
+def shard_for_post(post_id):
+    """
+    Вернет шард поста по его id: при шардировании id выдается так,
+    что остаток от деления на число шардов — номер шарда автора.
+    """
+    aliases = shards()
+    return aliases[post_id % len(aliases)]
+
+
+def new_post_id(sequence, author_id):
+    """Вернет id поста автора по номеру из общей последовательности."""
+    aliases = shards()
+    return sequence * len(aliases) + aliases.index(
+        shard_for_author(author_id))
+
+
+def each_shard(queryset):
+    """
+    Вернет копии queryset для каждого шарда.
+
+    Без шардирования и для моделей основной базы вернет сам
+    queryset: его базу по-прежнему выбирают роутеры.
+    """
+    if (
+        not is_sharded()
+        or queryset.model._meta.label_lower not in SHARDED_MODELS
+    ):
+        return [queryset]
+    return [queryset.using(alias) for alias in shards()]
+
+
+def group_by_shard(post_ids):
+    """Вернет [(шард, [id постов])] для постов post_ids."""
+    grouped = defaultdict(list)
+    for pk in post_ids:
+        grouped[shard_for_post(pk)].append(pk)
+    return list(grouped.items())
+
+
+def in_bulk(queryset, post_ids):
+    """Как queryset.in_bulk(post_ids), но по одному запросу на шард."""
+    if not is_sharded():
+        return queryset.in_bulk(post_ids)
+    found = {}
+    for alias, ids in group_by_shard(post_ids):
+        found.update(queryset.using(alias).in_bulk(ids))
+    return found
+
+
+def mirrors():
+    """
+    Вернет базы с постами, кроме основной: шарды и архив.
+    В них копируются справочники.
+    """
+    aliases = list(settings.DATABASE_SHARDS)
+    if settings.ARCHIVE_DATABASE:
+        aliases.append(settings.ARCHIVE_DATABASE)
+    return [
+        alias for alias in dict.fromkeys(aliases)
+        if alias != DEFAULT_DB_ALIAS
+    ]
+
+
+def mirror(instance, update_fields=None, aliases=None):
+    """
+    Скопирует пользователя или группу в базы aliases, по умолчанию
+    во все шарды и архив: посты ссылаются на них внешними ключами
+    и соединяются с ними в ленте. Сохранение, не задевшее
+    MIRRORED_FIELDS, например запись last_login при входе, ничего
+    не копирует.
+    """
+    model = type(instance)
+    fields = MIRRORED_FIELDS[model._meta.label_lower]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    values = {field: getattr(instance, field) for field in fields}
+    for alias in mirrors() if aliases is None else aliases:
+        model._base_manager.using(alias).update_or_create(
+            pk=instance.pk, defaults=values)
+
+
+def unmirror(instance):
+    """Удалит копии пользователя или группы вместе с их постами."""
+    for alias in mirrors():
+        type(instance)._base_manager.using(alias).filter(
+            pk=instance.pk).delete()
+
+
+class ShardedQuerySet(models.QuerySet):
+    """Запросы к модели, строки которой разложены по шардам."""
+
+    def on_post(self, post_id):
+        """Направит запрос в шард поста post_id."""
+        if not is_sharded():
+            return self
+        return self.using(shard_for_post(post_id))
+
+    def on_author(self, author_id):
+        """Направит запрос в шард постов автора author_id."""
+        if not is_sharded():
+            return self
+        return self.using(shard_for_author(author_id))
+
+    def create(self, **kwargs):
+        """
+        Без явной базы сохранит объект в шард, который роутер
+        выберет по самому объекту: у queryset подсказки нет.
+        """
+        if self._db is not None or not is_sharded():
+            return super().create(**kwargs)
+        instance = self.model(**kwargs)
+        instance.save(force_insert=True)
+        return instance
+
+
+class ShardRouter:
+    """
+    Направляет запросы к моделям из SHARDED_MODELS в шард по
+    подсказке instance: сохраняемому объекту, посту, комментарии
+    которого читаются через post.comments, или автору в author.posts.
+
+    Запросы без подсказки не угадываются: их направляют явно через
+    on_post(), on_author() или each_shard(). Комментарии поста
+    из архива читаются из архива. Остальные модели читаются
+    из основной базы, даже если объект-подсказка пришел из шарда
+    или архива.
+    """
+
+    def _shard(self, model, instance):
+        if instance is None:
+            return None
+        label = model._meta.label_lower
+        if label not in SHARDED_MODELS:
+            # Автор поста из шарда — копия: его подписки и счетчики
+            # лежат в основной базе.
+            if instance._state.db in mirrors():
+                return DEFAULT_DB_ALIAS
+            return None
+        if (
+            settings.ARCHIVE_DATABASE
+            and instance._state.db == settings.ARCHIVE_DATABASE
+        ):
+            return instance._state.db
+        if not is_sharded():
+            return None
+        instance_label = instance._meta.label_lower
+        if instance_label == 'posts.post':
+            if instance.pk is not None:
+                return shard_for_post(instance.pk)
+            return shard_for_author(instance.author_id)
+        if instance_label in SHARDED_MODELS:
+            return shard_for_post(instance.post_id)
+        if (
+            label == 'posts.post'
+            and instance_label == settings.AUTH_USER_MODEL.lower()
+        ):
+            return shard_for_author(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in mirrors():
+            return True
+        return None
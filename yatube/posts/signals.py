@@ -0,0 +1,247 @@
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, duplicates, feed, media
+from . import sharding, similarity, thumbnails
+from .models import AuthorStats, Comment, Follow, Group, Post, PostSequence
+from .storage import RetainedName
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Post)
+def assign_post_id(sender, instance, raw=False, **kwargs):
+    """
+    При шардировании выдает новому посту id, по которому виден
+    его шард: автоинкремент каждого шарда выдал бы одинаковые id.
+    """
+    if not raw and instance.pk is None and sharding.is_sharded():
+        sequence = PostSequence.objects.create().pk
+        instance.pk = sharding.new_post_id(sequence, instance.author_id)
+
+
+@receiver(pre_save, sender=Post)
+def remember_saved_state(sender, instance, raw=False, **kwargs):
+    """
+    Запоминает прежние группу, картинку и текст поста перед
+    сохранением. Их запомнил сам пост при чтении из базы, а если
+    он прочитан не целиком, они перечитываются.
+
+    Миниатюра замененной картинки сбрасывается, пока фоновая
+    задача не создаст новую.
+    """
+    instance._saved_group_id = None
+    instance._saved_image = ''
+    instance._saved_text = None
+    instance._image_changed = False
+    instance._text_changed = False
+    if raw:
+        return
+    if not instance._state.adding:
+        saved = instance.saved_values()
+        if saved is None:
+            row = Post.objects.on_post(instance.pk).filter(
+                pk=instance.pk
+            ).values_list('group_id', 'image', 'text').first()
+            if row is not None:
+                saved = dict(zip(Post.tracked_fields, row))
+        if saved is not None:
+            instance._saved_group_id = saved['group']
+            instance._saved_image = saved['image'] or ''
+            instance._saved_text = saved['text']
+    instance._text_changed = instance.text != instance._saved_text
+    if (instance.image.name or '') != instance._saved_image:
+        instance._image_changed = True
+        instance.thumbnail_url = ''
+        instance.thumbnail_width = None
+        instance.thumbnail_height = None
+        instance.thumbnail_srcset = ''
+        instance.thumbnail_sources = ''
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счетчики постов автора и групп."""
+    if raw:
+        return
+    if created:
+        counters.bump_author(instance.author_id, 'posts_count', 1)
+        counters.bump_group(instance.group_id, 1)
+    elif instance._saved_group_id != instance.group_id:
+        counters.bump_group(instance._saved_group_id, -1)
+        counters.bump_group(instance.group_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    """Уменьшает счетчики постов автора и группы."""
+    counters.bump_author(instance.author_id, 'posts_count', -1)
+    counters.bump_group(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, raw=False, **kwargs):
+    """
+    Обновляет ссылки на файлы картинок.
+
+    Имя файла сравнивается после сохранения: хранилище называет
+    файл по содержимому, и та же картинка получает то же имя.
+    На только что загруженный файл хранилище уже взяло ссылку.
+    """
+    if raw:
+        return
+    name = instance.image.name or ''
+    uploaded = isinstance(name, RetainedName)
+    if uploaded:
+        instance.image.name = str(name)
+    if name == instance._saved_image:
+        if uploaded:
+            media.release(name)
+        return
+    if instance.image and not uploaded:
+        media.retain(name)
+    if instance._saved_image:
+        media.release(instance._saved_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    """Убирает ссылку удаленного поста на файл картинки."""
+    if instance.image:
+        media.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счетчики комментариев поста и автора."""
+    if created and not raw:
+        counters.bump_post(instance.post_id, 1)
+        counters.bump_author(instance.author_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    """Уменьшает счетчики комментариев поста и автора."""
+    counters.bump_post(instance.post_id, -1)
+    counters.bump_author(instance.author_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    """Обновляет счетчики подписчиков и подписок."""
+    if created and not raw:
+        counters.bump_author(instance.author_id, 'followers_count', 1)
+        counters.bump_author(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    """Уменьшает счетчики подписчиков и подписок."""
+    counters.bump_author(instance.author_id, 'followers_count', -1)
+    counters.bump_author(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnail(sender, instance, raw=False, **kwargs):
+    """Ставит в очередь создание миниатюры новой картинки."""
+    if not raw and instance._image_changed and instance.image:
+        thumbnails.schedule(instance.pk)
+
+
+@receiver(request_started)
+def defer_thumbnails(sender, **kwargs):
+    """Откладывает миниатюры запроса до отправки ответа."""
+    thumbnails.defer()
+
+
+@receiver(request_finished)
+def create_deferred_thumbnails(sender, **kwargs):
+    """Создает миниатюры, отложенные в запросе."""
+    thumbnails.run_deferred()
+
+
+@receiver(post_save, sender=Post)
+def index_similarity(sender, instance, created, raw=False, **kwargs):
+    """Обновляет подпись поста для похожих постов при новом тексте."""
+    if not raw and instance._text_changed:
+        similarity.index_post(instance, created)
+
+
+@receiver(post_save, sender=Post)
+def remember_fingerprint(sender, instance, created, raw=False, **kwargs):
+    """Сохраняет отпечаток нового текста для поиска дубликатов."""
+    if not raw and instance._text_changed:
+        duplicates.remember(instance, created, instance._saved_text)
+
+
+@receiver(post_save, sender=Post)
+def push_to_timelines(sender, instance, created, raw=False, **kwargs):
+    """Разносит новый пост по лентам подписчиков."""
+    if created and not raw:
+        feed.push_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_timeline(sender, instance, created, raw=False, **kwargs):
+    """Добавляет в ленту посты автора после подписки."""
+    if created and not raw:
+        feed.add_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    """Убирает из ленты посты автора после отписки."""
+    feed.remove_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    """Сдвигает поколения страниц, на которых виден пост."""
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    caching.bump(*caching.post_scopes(instance, saved_group_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_fragments(sender, instance, **kwargs):
+    """Сдвигает поколения страниц, на которых видна группа."""
+    caching.bump('global', f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    """Сдвигает поколение страницы поста с комментарием."""
+    caching.bump(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, using=None,
+                        **kwargs):
+    """
+    Заводит пустые счетчики новому пользователю: страницы их только
+    читают и сами не создают.
+    """
+    if created and not raw and using == DEFAULT_DB_ALIAS:
+        AuthorStats.objects.create(author=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def mirror_reference(sender, instance, raw=False, using=None,
+                     update_fields=None, **kwargs):
+    """Копирует пользователя или группу в шарды постов."""
+    if not raw and using == DEFAULT_DB_ALIAS:
+        sharding.mirror(instance, update_fields)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def unmirror_reference(sender, instance, using=None, **kwargs):
+    """Удаляет копии пользователя или группы из шардов."""
+    if using == DEFAULT_DB_ALIAS:
+        sharding.unmirror(instance)
@@ -0,0 +1,180 @@
+import hashlib
+import heapq
+import random
+import struct
+from functools import lru_cache
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+
+from . import search, sharding
+from .models import Post, PostSignature, SimilarityBucket
+
+NUM_PERM = 64
+# 16 полос по 4 строки: посты с общей корзиной обычно похожи
+# по Жаккару больше чем на 0,5, а корзины частых слов остаются
+# маленькими, и поиск соседей читает десятки строк, а не тысячи.
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+MIN_WORD = 3
+# Наибольшее простое меньше 2 ** 32: значения подписи помещаются
+# в 32 бита без маски, а (a * x + b) mod PRIME остается перестановкой.
+PRIME = 4294967291
+# Перестановки фиксированы: подписи из разных процессов и разных
+# запусков должны совпадать.
+_random = random.Random(1)
+PERMUTATIONS = tuple(
+    (_random.randrange(1, PRIME), _random.randrange(0, PRIME))
+    for _ in range(NUM_PERM)
+)
+SIGNATURE = struct.Struct(f'<{NUM_PERM}I')
+BAND = struct.Struct(f'<H{ROWS}I')
+
+
+def shingles(text):
+    """
+    Вернет множество основ слов текста, как их видит поиск.
+    Короткие слова, в основном предлоги и союзы, не учитываются.
+    """
+    return {
+        search.stem(word) for word in search.words(text)
+        if len(word) >= MIN_WORD
+    }
+
+
+@lru_cache(maxsize=2 ** 16)
+def _hash(shingle):
+    digest = hashlib.blake2b(shingle.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % PRIME
+
+
+def signature(text):
+    """
+    Вернет MinHash-подпись текста: NUM_PERM минимумов хешей его
+    основ после перестановок (a * x + b) mod PRIME.
+    Вернет None, если в тексте нет слов.
+    """
+    hashes = [_hash(shingle) for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return [
+        min([(a * value + b) % PRIME for value in hashes])
+        for a, b in PERMUTATIONS
+    ]
+
+
+def bucket_keys(minhash):
+    """Вернет ключи корзин LSH подписи, по одному на полосу."""
+    keys = []
+    for band in range(BANDS):
+        rows = minhash[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(
+            BAND.pack(band, *rows), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def index_post(post, created=False):
+    """
+    Пересчитает подпись и корзины поста после сохранения текста.
+
+    Новому посту нечего удалять, поэтому он обходится вставками.
+    """
+    minhash = signature(post.text)
+    buckets = SimilarityBucket.objects.on_post(post.pk)
+    if not created:
+        buckets.filter(post_id=post.pk).delete()
+        if minhash is None:
+            PostSignature.objects.on_post(post.pk).filter(
+                post_id=post.pk).delete()
+    if minhash is None:
+        return
+    PostSignature(
+        post_id=post.pk, minhash=SIGNATURE.pack(*minhash)
+    ).save(force_insert=created)
+    buckets.bulk_create(
+        SimilarityBucket(key=key, post_id=post.pk)
+        for key in bucket_keys(minhash)
+    )
+
+
+def signatures(rows):
+    """
+    Вернет [(id, подпись)] для строк [(id, текст)], пропуская
+    тексты без слов. Не обращается к базе: пачки можно считать
+    в процессах пула.
+    """
+    result = []
+    for post_id, text in rows:
+        minhash = signature(text)
+        if minhash is not None:
+            result.append((post_id, minhash))
+    return result
+
+
+def store(post_ids, computed, using=DEFAULT_DB_ALIAS):
+    """
+    Заменит подписи и корзины постов post_ids подписями computed
+    из signatures в базе using. Вызывается в транзакции.
+
+    Корзин в BANDS раз больше, чем постов, поэтому они пишутся
+    executemany без создания объектов моделей.
+    """
+    SimilarityBucket.objects.using(using).filter(
+        post_id__in=post_ids).delete()
+    stored = PostSignature.objects.using(using)
+    stored.filter(post_id__in=post_ids).delete()
+    stored.bulk_create(
+        PostSignature(post_id=post_id, minhash=SIGNATURE.pack(*minhash))
+        for post_id, minhash in computed
+    )
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    table = quote(SimilarityBucket._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ({quote("key")}, {quote("post_id")}) '
+            'VALUES (%s, %s)',
+            [
+                (key, post_id)
+                for post_id, minhash in computed
+                for key in bucket_keys(minhash)
+            ],
+        )
+
+
+def related_ids(post_id, limit):
+    """
+    Вернет id постов, делящих с постом больше всего корзин,
+    одним запросом по индексу (key, post).
+
+    При шардировании ключи корзин читаются из шарда поста,
+    а соседи ищутся в каждом шарде.
+    """
+    keys = SimilarityBucket.objects.on_post(post_id).filter(
+        post_id=post_id).values('key')
+    if sharding.is_sharded():
+        keys = list(keys.values_list('key', flat=True))
+    neighbours = (
+        SimilarityBucket.objects.filter(key__in=keys)
+        .exclude(post_id=post_id)
+        .values_list('post_id')
+        .annotate(shared=Count('pk'))
+        .order_by('-shared', '-post_id')
+    )
+    ranked = heapq.merge(
+        *(queryset[:limit] for queryset in sharding.each_shard(neighbours)),
+        key=lambda row: (row[1], row[0]),
+        reverse=True,
+    )
+    return [pk for pk, _ in islice(ranked, limit)]
+
+
+def related_posts(post_id, limit):
+    """Вернет до limit похожих постов для ленты, от самых похожих."""
+    ids = related_ids(post_id, limit)
+    if not ids:
+        return []
+    posts = sharding.in_bulk(Post.objects.for_feed(), ids)
+    return [posts[pk] for pk in ids if pk in posts]
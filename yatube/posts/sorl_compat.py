@@ -0,0 +1,86 @@
+import sorl
+from django.core import checks
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+# Выпуски sorl-thumbnail, на которых проверены обращения к закрытым
+# методам ниже. Других мест с закрытым API sorl в проекте нет.
+TESTED_VERSIONS = ('12.7',)
+
+
+def is_tested():
+    """Проверит, что установлен выпуск sorl из TESTED_VERSIONS."""
+    release = '.'.join(sorl.__version__.split('.')[:2])
+    return release in TESTED_VERSIONS
+
+
+@checks.register(checks.Tags.compatibility)
+def check_version(app_configs, **kwargs):
+    """Предупредит, если выпуск sorl не проверен."""
+    if is_tested():
+        return []
+    return [checks.Warning(
+        f'sorl-thumbnail {sorl.__version__} не проверен: пакетный '
+        f'поиск миниатюр отключен.',
+        hint=f'Проверьте posts/sorl_compat.py и добавьте выпуск '
+             f'в TESTED_VERSIONS ({", ".join(TESTED_VERSIONS)}).',
+        id='posts.W001',
+    )]
+
+
+def image_format(source):
+    """Вернет формат, в котором sorl сохранит миниатюру source."""
+    return default.backend._get_format(source)
+
+
+def thumbnail_name(source, geometry, options):
+    """Вернет имя файла, которое sorl даст миниатюре."""
+    return default.backend._get_thumbnail_filename(
+        source, geometry, options)
+
+
+def encode(engine, thumbnail, image, options):
+    """Вернет байты миниатюры, которые sorl записал бы в файл."""
+    return engine._get_raw_data(
+        thumbnail, options['format'], options['quality'],
+        image_info=engine.get_image_info(image),
+    )
+
+
+def can_lookup():
+    """
+    Проверит, что миниатюры можно искать пакетом: хранилище
+    ключей — стандартное, с кэшем, а выпуск sorl проверен.
+    """
+    return is_tested() and isinstance(
+        default.kvstore, cached_db_kvstore.KVStore)
+
+
+def key(image_file):
+    """Вернет ключ записи о файле в хранилище sorl."""
+    return add_prefix(image_file.key)
+
+
+def lookup(keys):
+    """
+    Прочитает значения ключей хранилища sorl одним get_many к кэшу
+    и одним запросом к таблице для промахов.
+    """
+    kvstore = default.kvstore
+    empty = cached_db_kvstore.EMPTY_VALUE
+    found = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        loaded = dict(
+            KVStore.objects.filter(key__in=missing).values_list('key', 'value')
+        )
+        for key in missing:
+            loaded.setdefault(key, empty)
+        kvstore.cache.set_many(loaded, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(loaded)
+    return {
+        key: value for key, value in found.items() if value != empty
+    }
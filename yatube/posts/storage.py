@@ -0,0 +1,78 @@
+import hashlib
+import os
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from core import db
+
+HASH_CHUNK_SIZE = 64 * 1024
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def content_hash(content):
+    """Вернет sha256 содержимого файла, читая его по частям."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'chunks'):
+        chunks = content.chunks(HASH_CHUNK_SIZE)
+    else:
+        chunks = iter(lambda: content.read(HASH_CHUNK_SIZE), b'')
+    for chunk in chunks:
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    """
+    Вернет имя файла по хешу содержимого: каталог из upload_to,
+    подкаталог из первых символов хеша и исходное расширение.
+    """
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], digest + extension)
+
+
+def is_content_name(name):
+    """Вернет True, если файл назван по содержимому."""
+    return bool(CONTENT_NAME.search(name))
+
+
+class RetainedName(str):
+    """Имя файла, ссылку на который хранилище уже взяло при загрузке."""
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — хеш его содержимого.
+
+    Одинаковые загрузки получают одно имя и сохраняются один раз,
+    а значит, и миниатюры sorl-thumbnail для них создаются один раз.
+    Файлы не удаляются хранилищем: за ссылками на них следит
+    posts.media. Ссылка на файл берется до проверки, что он уже
+    есть на диске: иначе соседний запрос мог бы удалить файл
+    без ссылок между проверкой и сохранением поста.
+    """
+
+    def save(self, name, content, max_length=None):
+        from . import media
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if hasattr(content, 'temporary_file_path'):
+            # Временный файл загрузки копируется, а не переносится:
+            # после отката retry_on_lock повтор представления снова
+            # прочитает его.
+            content = File(content.file, content.name)
+        name = content_name(name, content_hash(content))
+        media.retain(name)
+        if not self.exists(name):
+            name = super().save(name, content, max_length=max_length)
+            db.on_rollback(lambda: media.discard(name))
+        return RetainedName(name)
+
+
+post_images = ContentAddressedStorage()
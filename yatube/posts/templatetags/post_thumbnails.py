@@ -0,0 +1,14 @@
+from django import template
+
+from .. import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """
+    Подготовит миниатюры всех постов страницы разом.
+    """
+    thumbnails.prefetch(posts)
+    return ''
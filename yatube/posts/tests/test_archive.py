@@ -0,0 +1,183 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import counters, feed
+from ..models import AuthorStats, Comment, Follow, Group, Post, Timeline
+
+User = get_user_model()
+
+ARCHIVE = 'archive_test'
+
+
+@override_settings(
+    ARCHIVE_DATABASE=ARCHIVE, ARCHIVE_AFTER_DAYS=30, LAST_POSTS=3)
+class ArchiveTests(TestCase):
+    databases = {'default', ARCHIVE}
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.archive_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.databases[ARCHIVE] = {
+            **connections['default'].settings_dict,
+            'NAME': cls.archive_path,
+        }
+        with override_settings(ARCHIVE_DATABASE=ARCHIVE):
+            call_command('migrate', database=ARCHIVE, verbosity=0)
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(7)
+        ]
+        cls.old = cls.posts[:3]
+        for days, post in enumerate(cls.old):
+            post.pub_date = timezone.now() - timedelta(days=60 - days)
+            Post.objects.filter(pk=post.pk).update(pub_date=post.pub_date)
+        cls.comment = Comment.objects.create(
+            post=cls.old[0], author=cls.reader, text='Старый коммент')
+        call_command(
+            'archive_posts', batch_size=2, pause=0, stdout=StringIO())
+        cls.expected = [post.id for post in reversed(cls.posts)]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[ARCHIVE].close()
+        del connections.databases[ARCHIVE]
+        if hasattr(connections._connections, ARCHIVE):
+            delattr(connections._connections, ARCHIVE)
+        os.remove(cls.archive_path)
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_old_posts_moved(self):
+        """Старые посты с комментариями переезжают в архив."""
+        old_ids = [post.id for post in self.old]
+        self.assertFalse(Post.objects.filter(pk__in=old_ids).exists())
+        self.assertEqual(
+            Post.objects.using(ARCHIVE).filter(pk__in=old_ids).count(), 3)
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertTrue(
+            Comment.objects.using(ARCHIVE).filter(pk=self.comment.pk).exists())
+        self.assertFalse(Comment.objects.filter(pk=self.comment.pk).exists())
+        self.assertFalse(Timeline.objects.filter(post_id__in=old_ids).exists())
+        self.assertEqual(
+            Post.objects.using(ARCHIVE).get(pk=old_ids[0]).comments_count, 1)
+
+    def test_counters_keep_archived_posts(self):
+        """Перенос и пересчет не меняют счетчики постов."""
+        AuthorStats.objects.all().delete()
+        self.assertEqual(counters.author_stats(self.author.id).posts_count, 7)
+        counters.recount_posts()
+        self.assertEqual(
+            Post.objects.using(ARCHIVE).get(pk=self.old[0].pk).comments_count,
+            1,
+        )
+
+    def read_all(self, url):
+        """Пройдет ленту курсором до конца и обратно на шаг."""
+        pages = [self.reader_client.get(url).context['page_obj']]
+        while pages[-1].next_cursor:
+            pages.append(self.reader_client.get(
+                url, {'after': pages[-1].next_cursor}).context['page_obj'])
+        back = self.reader_client.get(
+            url, {'before': pages[-1].previous_cursor}).context['page_obj']
+        self.assertEqual(list(back), list(pages[-2]))
+        return [post.id for page in pages for post in page]
+
+    def test_feeds_fall_through_to_archive(self):
+        """Ленты продолжаются постами из архива после границы."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.read_all(url), self.expected)
+
+    def test_first_page_skips_archive(self):
+        """Страница, не дошедшая до границы, не читает архив."""
+        with CaptureQueriesContext(connections[ARCHIVE]) as queries:
+            self.reader_client.get(reverse('posts:index'))
+        self.assertEqual(len(queries), 0)
+
+    def test_api_feeds_fall_through(self):
+        """API отдает архивные посты следом за горячими."""
+        for url in (
+            reverse('api:index'),
+            reverse('api:profile', kwargs={'username': 'author'}),
+        ):
+            with self.subTest(url=url):
+                ids, link = [], url
+                while link:
+                    data = self.reader_client.get(link).json()
+                    ids.extend(post['id'] for post in data['results'])
+                    link = data['next']
+                self.assertEqual(ids, self.expected)
+
+    def test_archived_post_detail(self):
+        """Архивный пост открывается с комментариями, но без формы."""
+        post_id = self.old[0].id
+        response = self.reader_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post_id}))
+        self.assertEqual(response.context['post'].id, post_id)
+        self.assertEqual(list(response.context['comments']), [self.comment])
+        self.assertIsNone(response.context['form'])
+        self.assertNotContains(response, 'Добавить комментарий')
+        response = self.reader_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': post_id}))
+        self.assertContains(response, 'Старый коммент')
+        data = self.reader_client.get(
+            reverse('api:post_detail', kwargs={'post_id': post_id})).json()
+        self.assertEqual(data['id'], post_id)
+        self.assertEqual(len(data['comments']['results']), 1)
+        data = self.reader_client.get(
+            reverse('api:post_comments', kwargs={'post_id': post_id})).json()
+        self.assertEqual(len(data['results']), 1)
+
+    def test_archived_post_read_only(self):
+        """Архивный пост нельзя комментировать, а чужой id — 404."""
+        response = self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.old[0].id}),
+            data={'text': 'Новый коммент'},
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.reader_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': 10 ** 6}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_archived_order_matches_feed_key(self):
+        """Архивные посты идут после горячих по ключу ленты."""
+        self.assertEqual(
+            self.expected,
+            [post.id for post in sorted(
+                list(Post.objects.all())
+                + list(Post.objects.using(ARCHIVE).all()),
+                key=feed._feed_key, reverse=True,
+            )],
+        )
@@ -0,0 +1,181 @@
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.queries import record_queries
+
+from ..models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.group_2 = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test_slug2',
+            description='Тестовое описание 2',
+        )
+
+    def stats(self, user):
+        return AuthorStats.objects.get(author=user)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счетчики."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        post.group = self.group_2
+        post.save()
+        self.group.refresh_from_db()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.group_2.posts_count, 1)
+        post.delete()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+        self.assertEqual(self.group_2.posts_count, 0)
+
+    def test_comment_counters(self):
+        """Комментарии меняют счетчики поста и автора."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.reader).comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(self.stats(self.reader).comments_count, 0)
+
+    def test_save_compares_loaded_values(self):
+        """
+        Прочитанный пост сохраняется без повторного чтения,
+        а прочитанный не целиком — перечитывается.
+        """
+        Post.objects.create(author=self.user, text='Пост', group=self.group)
+        for posts, group, reads in (
+            (Post.objects.all(), self.group_2, 0),
+            (Post.objects.defer('group'), self.group, 1),
+        ):
+            with self.subTest(reads=reads):
+                post = posts.get()
+                post.group = group
+                with record_queries() as log:
+                    post.save()
+                self.assertEqual(len([
+                    query for query in log.queries
+                    if query.startswith('SELECT')
+                    and 'FROM "posts_post"' in query
+                ]), reads)
+        self.group.refresh_from_db()
+        self.group_2.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.group_2.posts_count, 0)
+
+    def test_stale_instance_keeps_counters(self):
+        """Сохранение старой копии поста не затирает счетчик."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счетчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.user).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount исправляет расхождения."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        AuthorStats.objects.update(posts_count=42, comments_count=42)
+        Group.objects.update(posts_count=42)
+        Post.objects.update(comments_count=42)
+        call_command('recount', batch_size=1, stdout=StringIO())
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(post.comments_count, 1)
+
+    def test_migration_fills_counters(self):
+        """Миграция 0017 заполняет счетчики по таблицам."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', group=self.group)
+        Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        Follow.objects.create(user=self.reader, author=self.user)
+        AuthorStats.objects.filter(author=self.reader).delete()
+        AuthorStats.objects.update(posts_count=0, followers_count=0)
+        Group.objects.update(posts_count=0)
+        Post.objects.update(comments_count=0)
+        migration = import_module('posts.migrations.0017_fill_counters')
+        state = MigrationExecutor(connection).loader.project_state(
+            ('posts', '0016_authorstats_timeline_pending'))
+        migration.fill_counters(
+            state.apps, SimpleNamespace(connection=connection))
+        self.group.refresh_from_db()
+        post.refresh_from_db()
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.assertEqual(self.stats(self.user).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).comments_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.group_2.posts_count, 0)
+        self.assertEqual(post.comments_count, 1)
+
+    def test_new_user_gets_stats(self):
+        """Новый пользователь сразу получает пустые счетчики."""
+        user = User.objects.create_user(username='new')
+        self.assertEqual(self.stats(user).posts_count, 0)
+
+    def test_pages_do_not_create_stats(self):
+        """Страницы без строки счетчиков считают их, но не сохраняют."""
+        Post.objects.create(author=self.user, text='Пост')
+        AuthorStats.objects.filter(author=self.user).delete()
+        with record_queries() as log:
+            response = Client().get(
+                reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertContains(response, 'Всего постов: 1')
+        self.assertFalse([
+            query for query in log.queries if query.startswith('INSERT')])
+        self.assertFalse(
+            AuthorStats.objects.filter(author=self.user).exists())
+
+    def test_profile_reads_stored_count(self):
+        """Профиль показывает сохраненный счетчик постов."""
+        Post.objects.create(author=self.user, text='Пост')
+        AuthorStats.objects.filter(author=self.user).update(posts_count=7)
+        response = Client().get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertContains(response, 'Всего постов: 7')
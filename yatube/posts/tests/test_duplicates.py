@@ -0,0 +1,154 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.queries import record_queries
+
+from .. import duplicates
+from ..models import Post, PostFingerprint
+
+User = get_user_model()
+
+SPAM = (
+    'Только сегодня скидки до девяноста процентов на все товары '
+    'магазина, переходите по ссылке в профиле и забирайте подарок'
+)
+SPAM_EDITED = SPAM.replace('переходите', 'переходи')
+OTHER = (
+    'Вчера гуляли по набережной, смотрели на корабли и ели мороженое, '
+    'а вечером пошел сильный дождь и пришлось прятаться под мостом'
+)
+
+
+class FingerprintTests(TestCase):
+    def test_short_text_skipped(self):
+        """Короткие тексты не получают отпечатка."""
+        self.assertIsNone(duplicates.fingerprint('Новый пост'))
+
+    def test_near_duplicates_close(self):
+        """Почти одинаковые тексты близки, разные — далеки."""
+        spam = duplicates.fingerprint(SPAM)
+        self.assertLessEqual(
+            duplicates.distance(spam, duplicates.fingerprint(SPAM_EDITED)),
+            duplicates.DISTANCE,
+        )
+        self.assertGreater(
+            duplicates.distance(spam, duplicates.fingerprint(OTHER)),
+            duplicates.DISTANCE,
+        )
+
+    def test_bands_cover_fingerprint(self):
+        """Полосы вместе составляют отпечаток."""
+        spam = duplicates.fingerprint(SPAM)
+        self.assertEqual(
+            sum(value << (band * duplicates.BAND_BITS)
+                for band, value in enumerate(duplicates.bands(spam))),
+            spam,
+        )
+
+
+class FindDuplicatesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.other = User.objects.create_user(username='other')
+        cls.post = Post.objects.create(author=cls.author, text=SPAM)
+
+    def test_fingerprint_saved(self):
+        """Новый пост сохраняет отпечаток."""
+        fingerprint = PostFingerprint.objects.get(post=self.post)
+        self.assertEqual(fingerprint.author, self.author)
+        self.assertEqual(
+            fingerprint.band0, duplicates.bands(
+                duplicates.fingerprint(SPAM))[0])
+
+    def test_find_by_any_author(self):
+        """Дубликат находится у того же и у другого автора."""
+        for author in (self.author, self.other):
+            with self.subTest(author=author):
+                self.assertEqual(
+                    duplicates.find(SPAM_EDITED, author.id), self.post.id)
+        self.assertIsNone(duplicates.find(OTHER, self.other.id))
+
+    def test_find_excludes_post(self):
+        """Пост не считается дубликатом самого себя."""
+        self.assertIsNone(
+            duplicates.find(SPAM, self.author.id, exclude=self.post.id))
+
+    def test_windows(self):
+        """Старые посты сверяются только с постами того же автора."""
+        PostFingerprint.objects.filter(post=self.post).update(
+            created=self.post.pub_date - timedelta(days=1))
+        self.assertEqual(
+            duplicates.find(SPAM_EDITED, self.author.id), self.post.id)
+        self.assertIsNone(duplicates.find(SPAM_EDITED, self.other.id))
+
+    def test_newest_candidates_first(self):
+        """Из кандидатов сверяются самые свежие."""
+        spam = duplicates.fingerprint(SPAM)
+        # Совпадает с SPAM только младшая полоса.
+        decoy = spam ^ (duplicates.MASK ^ duplicates.BAND_MASK)
+        for i in range(duplicates.CANDIDATES):
+            post = Post.objects.create(author=self.other, text=f'Пост {i}')
+            PostFingerprint.objects.create(
+                post=post,
+                author=self.other,
+                created=post.pub_date - timedelta(minutes=10),
+                **duplicates._fields(decoy),
+            )
+        post = Post.objects.create(author=self.other, text=SPAM)
+        self.assertEqual(
+            duplicates.find(SPAM_EDITED, self.author.id, exclude=self.post.id),
+            post.id,
+        )
+
+    def test_single_query(self):
+        """Проверка — один запрос по индексам полос."""
+        with record_queries() as log:
+            duplicates.find(SPAM_EDITED, self.other.id)
+        self.assertEqual(len(log), 1)
+        self.assertNotIn('posts_post"', log.queries[0])
+
+    @override_settings(DUPLICATE_POST_MIN_WORDS=1)
+    def test_edit_forgets_old_text(self):
+        """После правки поста ищется его новый текст."""
+        post = Post.objects.create(author=self.other, text=OTHER)
+        post.text = 'Совсем другой текст'
+        post.save()
+        self.assertIsNone(duplicates.find(OTHER, self.author.id))
+        self.assertEqual(
+            duplicates.find('Совсем другой текст', self.author.id), post.id)
+
+
+class DuplicateFormTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text=SPAM)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_create_rejects_duplicate(self):
+        """Почти одинаковый пост не создается."""
+        response = self.client.post(
+            reverse('posts:post_create'), data={'text': SPAM_EDITED})
+        self.assertTrue(
+            response.context['form'].has_error('text', 'duplicate'))
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_edit_keeps_own_text(self):
+        """Пост можно сохранить с его же текстом."""
+        response = self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': SPAM_EDITED},
+        )
+        self.assertRedirects(
+            response,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
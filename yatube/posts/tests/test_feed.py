@@ -0,0 +1,146 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import feed
+from ..models import AuthorStats, Follow, Post, Timeline
+
+User = get_user_model()
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        cls.stranger = User.objects.create_user(username='stranger')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+
+    def test_new_post_pushed_to_followers(self):
+        """Новый пост попадает только в ленты подписчиков."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        entry = Timeline.objects.get(post=post)
+        self.assertEqual(entry.user, self.follower)
+        self.assertEqual(entry.pub_date, post.pub_date)
+
+    def test_follow_fills_timeline(self):
+        """После подписки в ленте появляются старые посты автора."""
+        post = Post.objects.create(author=self.stranger, text='Пост')
+        Follow.objects.create(user=self.follower, author=self.stranger)
+        self.assertTrue(Timeline.objects.filter(
+            user=self.follower, post=post).exists())
+
+    def test_unfollow_trims_timeline(self):
+        """После отписки посты автора уходят из ленты."""
+        Post.objects.create(author=self.author, text='Пост')
+        Follow.objects.filter(
+            user=self.follower, author=self.author).delete()
+        self.assertFalse(
+            Timeline.objects.filter(user=self.follower).exists())
+
+    def test_post_delete_trims_timeline(self):
+        """Удаленный пост уходит из ленты."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        post.delete()
+        self.assertFalse(Timeline.objects.filter(post_id=post.id).exists())
+
+    def test_follow_index_matches_join(self):
+        """Лента совпадает с выборкой через подписки."""
+        for i in range(3):
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+        Post.objects.create(author=self.stranger, text='Чужой пост')
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        expected = list(Post.objects.filter(
+            author__following__user=self.follower))
+        self.assertEqual(list(response.context['page_obj']), expected)
+
+    def test_cursor_ignores_other_timelines(self):
+        """Курсор не размножает пост, который есть в чужих лентах."""
+        Follow.objects.create(user=self.stranger, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        page = feed.follow_feed(self.follower).seek(
+            after=(posts[-1].pub_date, posts[-1].id))
+        self.assertEqual(list(page[:10]), posts[-2::-1])
+
+    def test_backfill_command(self):
+        """Команда backfill_timeline восстанавливает ленты."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Timeline.objects.all().delete()
+        call_command('backfill_timeline', stdout=StringIO())
+        self.assertTrue(Timeline.objects.filter(
+            user=self.follower, post=post).exists())
+
+
+@override_settings(FEED_CELEBRITY_FOLLOWERS=2)
+class HybridFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.celebrity = User.objects.create_user(username='celebrity')
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.fan = User.objects.create_user(username='fan')
+        Follow.objects.create(user=cls.reader, author=cls.celebrity)
+        Follow.objects.create(user=cls.fan, author=cls.celebrity)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(6):
+            author = cls.celebrity if i % 2 else cls.author
+            Post.objects.create(author=author, text=f'Пост {i}')
+
+    def join(self, user):
+        return list(Post.objects.filter(
+            author__following__user=user).order_by('-pub_date', '-id'))
+
+    def test_celebrity_posts_not_pushed(self):
+        """Посты знаменитости не пишутся в ленты."""
+        self.assertFalse(Timeline.objects.filter(
+            post__author=self.celebrity).exists())
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 3)
+
+    def test_merged_order_matches_join(self):
+        """Слияние лент дает тот же порядок, что и join."""
+        expected = self.join(self.reader)
+        feed_posts = feed.follow_feed(self.reader)
+        self.assertEqual(len(feed_posts), len(expected))
+        self.assertEqual(list(feed_posts[0:6]), expected)
+        self.assertEqual(list(feed_posts[2:5]), expected[2:5])
+
+    def test_paginated_view_matches_join(self):
+        """Страницы follow_index идут в порядке join."""
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), self.join(self.reader))
+
+    def test_demoted_author_backfilled(self):
+        """
+        После потери статуса знаменитости посты попадают в ленты
+        командой, а до нее читаются напрямую.
+        """
+        Follow.objects.filter(user=self.fan, author=self.celebrity).delete()
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 3)
+        self.assertEqual(
+            list(feed.follow_feed(self.reader)[0:10]),
+            self.join(self.reader))
+        call_command('backfill_timeline', demoted=True, stdout=StringIO())
+        self.assertEqual(
+            Timeline.objects.filter(user=self.reader).count(), 6)
+        self.assertFalse(AuthorStats.objects.filter(
+            timeline_pending=True).exists())
+        self.assertEqual(
+            list(feed.follow_feed(self.reader)[0:10]),
+            self.join(self.reader))
@@ -1,14 +1,26 @@
+import hashlib
 import shutil
+import struct
 import tempfile
+import tracemalloc
+import zlib
 from http import HTTPStatus
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.http.multipartparser import MultiPartParser
 from django.test import Client, TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
 from django.urls import reverse
+from PIL import Image
 
+from ..forms import PostForm
 from ..models import Comment, Group, Post
+from ..storage import content_name
+from ..uploads import LimitedUploadHandler
 
 User = get_user_model()
 
@@ -81,7 +93,8 @@ class PostCreateFormTests(TestCase):
             text=form_data['text'],
             group=form_data['group'],
             author=self.user,
-            image='posts/small.gif'
+            image=content_name(
+                'posts/small.gif', hashlib.sha256(small_gif).hexdigest())
         ).exists())
 
     def test_guest_new_post(self):
@@ -167,3 +180,122 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(response.status_code, HTTPStatus.OK)
         self.assertEqual(Comment.objects.count(), comments_count)
         self.assertRedirects(response, redirect)
+
+
+def png_header(width, height):
+    """Вернет PNG из одного заголовка с заявленными размерами."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IEND', b''))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UploadLimitsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, name, content):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(name=name, content=content),
+            },
+        )
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_file_too_large(self):
+        """Слишком большой файл отклоняется по размеру."""
+        response = self.create_post('big.png', b'0' * 4096)
+        errors = response.context['form'].errors.as_data()['image']
+        self.assertEqual(errors[0].code, 'file_too_large')
+        self.assertFalse(Post.objects.exists())
+
+    def test_decompression_bomb(self):
+        """Картинка с огромными размерами отклоняется по заголовку."""
+        response = self.create_post('bomb.png', png_header(50000, 50000))
+        errors = response.context['form'].errors.as_data()['image']
+        self.assertEqual(errors[0].code, 'image_too_large')
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_handler_stops_upload(self):
+        """За пределом обработчик обрывает разбор и запоминает размер."""
+        handler = LimitedUploadHandler()
+        handler.new_file('image', 'big.png', 'image/png', None)
+        handler.receive_data_chunk(b'0' * 1024, 0)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'0' * 512, 1024)
+        self.assertEqual(handler.oversized.size, 1536)
+
+    def test_upload_view_checks_csrf(self):
+        """Форма поста по-прежнему проверяет CSRF-токен."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:post_create'), data={'text': 'Без токена'})
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.exists())
+
+    def test_guest_upload_not_parsed(self):
+        """Загрузка гостя не разбирается: его сразу отправляют на вход."""
+        response = self.client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост гостя',
+                'image': SimpleUploadedFile('guest.png', b'0' * 4096),
+            },
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertFalse(hasattr(response.wsgi_request, '_files'))
+
+    def test_upload_peak_memory(self):
+        """
+        Разбор загрузки и проверка формы не держат файл в памяти,
+        даже если он меньше FILE_UPLOAD_MAX_MEMORY_SIZE.
+        """
+        buffer = BytesIO()
+        Image.effect_noise((1200, 1000), 100).save(
+            buffer, 'JPEG', quality=95)
+        file_size = len(buffer.getvalue())
+        body = encode_multipart(BOUNDARY, {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile('noise.jpg', buffer.getvalue()),
+        })
+        meta = {
+            'CONTENT_TYPE': MULTIPART_CONTENT,
+            'CONTENT_LENGTH': len(body),
+        }
+
+        def upload():
+            data, files = MultiPartParser(
+                meta, BytesIO(body), [LimitedUploadHandler()]).parse()
+            form = PostForm(data, files)
+            self.assertTrue(form.is_valid(), form.errors)
+
+        # Первый разбор подгружает модули Pillow, их память не считаем.
+        upload()
+        tracemalloc.start()
+        try:
+            upload()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(file_size, 1024 * 1024)
+        self.assertLess(file_size, settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        self.assertLess(peak, file_size / 4)
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models.signals import post_save
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core.db import retry_on_lock
+
+from .. import media
+from ..models import Post, StoredFile
+from ..storage import content_name, post_images
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+OTHER_GIF = SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\x00\xFF')
+
+
+def hashed(name, content):
+    return content_name(name, hashlib.sha256(content).hexdigest())
+
+
+class MediaTestMixin:
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+
+    def upload(self, name, content):
+        post = Post(author=self.user, text='Пост с картинкой')
+        post.image.save(name, ContentFile(content))
+        return post
+
+    def references(self, name):
+        return StoredFile.objects.get(name=name).references
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(MediaTestMixin, TestCase):
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки сохраняются одним файлом."""
+        first = self.upload('first.gif', SMALL_GIF)
+        second = self.upload('second.GIF', SMALL_GIF)
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(first.image.name, hashed('posts/a.gif', SMALL_GIF))
+        directory = os.path.dirname(post_images.path(first.image.name))
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_references_counted(self):
+        """Счетчик ссылок следит за загрузками и заменой картинки."""
+        first = self.upload('first.gif', SMALL_GIF)
+        second = self.upload('second.gif', SMALL_GIF)
+        self.assertEqual(self.references(first.image.name), 2)
+        second.image.save('other.gif', ContentFile(OTHER_GIF))
+        self.assertEqual(self.references(first.image.name), 1)
+        self.assertEqual(self.references(second.image.name), 1)
+
+    def test_legacy_names_not_counted(self):
+        """Файлы со старыми именами не получают счетчик."""
+        Post.objects.create(
+            author=self.user, text='Пост', image='posts/old.gif')
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_recount(self):
+        """recount восстанавливает счетчики по таблице постов."""
+        post = self.upload('first.gif', SMALL_GIF)
+        self.upload('second.gif', SMALL_GIF)
+        StoredFile.objects.all().delete()
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(self.references(post.image.name), 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ReleaseFileTests(MediaTestMixin, TransactionTestCase):
+    """Файлы удаляются после коммита, поэтому транзакции настоящие."""
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется только вместе с последней ссылкой."""
+        first = self.upload('first.gif', SMALL_GIF)
+        second = self.upload('second.gif', SMALL_GIF)
+        name = first.image.name
+        first.delete()
+        self.assertTrue(post_images.exists(name))
+        second.delete()
+        self.assertFalse(post_images.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_rolled_back_upload_removed(self):
+        """Файл из откатившейся транзакции удаляется."""
+        name = hashed('posts/a.gif', SMALL_GIF)
+
+        @retry_on_lock
+        def view():
+            post_images.save('posts/a.gif', ContentFile(SMALL_GIF))
+            raise OperationalError('no such table: x')
+
+        with self.assertRaises(OperationalError):
+            view()
+        self.assertFalse(post_images.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    @override_settings(DATABASE_WRITE_RETRY_DELAY=0)
+    def test_upload_survives_lock_retry(self):
+        """Повтор после занятой базы сохраняет загруженную картинку."""
+        attempts = []
+
+        def lock_once(sender, instance, **kwargs):
+            if not attempts:
+                attempts.append(instance)
+                raise OperationalError('database is locked')
+
+        post_save.connect(lock_once, sender=Post)
+        self.addCleanup(post_save.disconnect, lock_once, sender=Post)
+        client = Client()
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name='small.gif', content=SMALL_GIF,
+                    content_type='image/gif'),
+            },
+        )
+        self.assertRedirects(
+            response, reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertEqual(len(attempts), 1)
+        post = Post.objects.get(author=self.user)
+        self.assertEqual(post.image.name, hashed('posts/small.gif', SMALL_GIF))
+        self.assertTrue(post_images.exists(post.image.name))
+        self.assertEqual(self.references(post.image.name), 1)
+
+    def test_upload_keeps_released_file(self):
+        """Загрузка берет ссылку раньше, чем удаляется файл без ссылок."""
+        post = self.upload('first.gif', SMALL_GIF)
+        name = post.image.name
+        StoredFile.objects.filter(name=name).update(references=0)
+        self.assertEqual(
+            post_images.save('posts/b.gif', ContentFile(SMALL_GIF)), name)
+        media._delete_unreferenced(name)
+        self.assertTrue(post_images.exists(name))
+        self.assertEqual(self.references(name), 1)
+
+    def test_reference_taken_before_delete_keeps_file(self):
+        """Ссылка, взятая перед удалением счетчика, сохраняет файл."""
+        post = self.upload('first.gif', SMALL_GIF)
+        name = post.image.name
+        self.addCleanup(post_images.delete, name)
+        StoredFile.objects.filter(name=name).update(references=0)
+
+        def retain_before_delete(execute, sql, params, many, context):
+            if sql.startswith('DELETE') and 'posts_storedfile' in sql:
+                media.retain(name)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(retain_before_delete):
+            media._delete_unreferenced(name)
+        self.assertTrue(post_images.exists(name))
+        self.assertEqual(self.references(name), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class DedupMediaTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.posts = {}
+        for name, content in (('a.gif', SMALL_GIF), ('b.gif', SMALL_GIF),
+                              ('c.gif', OTHER_GIF)):
+            name = f'posts/{name}'
+            path = post_images.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+            self.posts[name] = Post.objects.create(
+                author=self.user, text='Пост', image=name)
+
+    def tearDown(self):
+        shutil.rmtree(post_images.path('posts'), ignore_errors=True)
+
+    def dedup(self, **options):
+        out = StringIO()
+        call_command('dedup_media', stdout=out, **options)
+        return out.getvalue()
+
+    def test_dedup(self):
+        """Дубликаты сливаются, посты переключаются на новые имена."""
+        output = self.dedup(workers=2)
+        self.assertIn('Файлов: 3, уникальных: 2, дубликатов: 1', output)
+        small = hashed('posts/a.gif', SMALL_GIF)
+        other = hashed('posts/c.gif', OTHER_GIF)
+        for name, expected in (('posts/a.gif', small),
+                               ('posts/b.gif', small),
+                               ('posts/c.gif', other)):
+            post = self.posts[name]
+            post.refresh_from_db()
+            self.assertEqual(post.image.name, expected)
+            self.assertFalse(post_images.exists(name))
+            self.assertTrue(post_images.exists(expected))
+        self.assertEqual(self.references(small), 2)
+        self.assertEqual(self.references(other), 1)
+
+    def test_dry_run(self):
+        """Пробный запуск ничего не меняет."""
+        output = self.dedup(workers=0, dry_run=True)
+        self.assertIn('дубликатов: 1', output)
+        self.assertTrue(post_images.exists('posts/a.gif'))
+        self.posts['posts/a.gif'].refresh_from_db()
+        self.assertEqual(
+            self.posts['posts/a.gif'].image.name, 'posts/a.gif')
@@ -2,7 +2,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import Comment, Group, Post
 
 User = get_user_model()
 
@@ -62,3 +62,29 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class PostQuerySetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for i in range(10):
+            author = User.objects.create_user(username=f'auth{i}')
+            post = Post.objects.create(
+                author=author, text=f'Пост {i}', group=cls.group)
+            Comment.objects.create(post=post, author=author, text='Коммент')
+
+    def test_for_feed_single_query(self):
+        """for_feed читает посты, авторов, группы и счетчики одним запросом."""
+        for size in (1, 10):
+            with self.subTest(size=size), self.assertNumQueries(1):
+                for post in Post.objects.for_feed()[:size]:
+                    post.author.get_full_name()
+                    post.author.username
+                    post.group.slug
+                    self.assertEqual(post.comments_count, 1)
@@ -0,0 +1,95 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.queries import check_plans, record_queries
+from core.testing import assert_query_plans
+
+from .. import similarity
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# Похожие посты сортируются по числу общих корзин: это агрегат,
+# и временное B-дерево ему нужно по смыслу.
+SIMILARITY_TABLE = similarity.SimilarityBucket._meta.db_table
+
+
+@override_settings(LAST_POSTS=5, LAST_COMMENTS=5)
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(4)
+        ]
+        cls.groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='')
+            for i in range(2)
+        ]
+        for i in range(40):
+            post = Post.objects.create(
+                text=f'Тестовый пост номер {i}',
+                author=cls.users[i % 4],
+                group=cls.groups[i % 2],
+            )
+            for j in range(i % 3):
+                Comment.objects.create(
+                    post=post, author=cls.users[j], text=f'Коммент {j}')
+        cls.post = post
+        for author in cls.users[1:]:
+            Follow.objects.create(user=cls.users[0], author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.users[0])
+
+    def assert_pages(self, urls, **kwargs):
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                response = assert_query_plans(
+                    self.client, url, allow=(SIMILARITY_TABLE,), **kwargs)
+                self.assertEqual(response.status_code, 200)
+
+    def test_pages_use_indexes(self):
+        """Страницы читают данные по индексам и не сортируют их."""
+        self.assert_pages((
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'group-1'}),
+            reverse('posts:profile', kwargs={'username': 'user1'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+        ))
+
+    def test_next_pages_use_indexes(self):
+        """Следующие страницы по курсору тоже читаются диапазоном."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'group-1'}),
+            reverse('posts:profile', kwargs={'username': 'user1'}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            next_cursor = self.client.get(url).context['page_obj'].next_cursor
+            for name in ('after', 'before'):
+                self.assert_pages((url,), data={name: next_cursor})
+
+    def test_api_uses_indexes(self):
+        """JSON API читает данные по индексам."""
+        self.assert_pages((
+            reverse('api:index'),
+            reverse('api:group_posts', kwargs={'slug': 'group-1'}),
+            reverse('api:profile', kwargs={'username': 'user1'}),
+            reverse('api:follow_index'),
+            reverse('api:post_detail', kwargs={'post_id': self.post.id}),
+        ))
+
+    def test_bad_plan_detected(self):
+        """Проверка замечает сортировку без индекса."""
+        with record_queries() as log:
+            list(Post.objects.order_by('text')[:1])
+        self.assertTrue(check_plans(log, 'text'))
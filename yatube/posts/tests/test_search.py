@@ -0,0 +1,142 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.queries import record_queries
+from core.testing import assert_query_budget
+
+from .. import search
+from ..models import Post
+
+User = get_user_model()
+
+
+class FtsQueryTests(TestCase):
+    def test_words_become_prefixes_of_stems(self):
+        """Слова запроса становятся префиксами основ."""
+        self.assertEqual(
+            search.fts_query('Котятами, КОТЯТА!'), '"котят"* AND "котят"*')
+
+    def test_short_stems_become_forms(self):
+        """Короткая основа ищется своими формами, а не префиксом."""
+        query = search.fts_query('коты')
+        self.assertTrue(query.startswith('("кот" OR "котиями" OR '))
+        self.assertIn(' OR "котами" OR ', query)
+        self.assertNotIn('*', query)
+
+    def test_yo_normalized(self):
+        """Буква «ё» ищется как «е»."""
+        self.assertEqual(search.fts_query('ёлочка'), '"елочк"*')
+
+    def test_syntax_not_interpreted(self):
+        """Операторы FTS5 из ввода не попадают в запрос."""
+        self.assertEqual(
+            search.fts_query('"котята" NEARBY котята*'),
+            '"котят"* AND "nearby"* AND "котят"*',
+        )
+        self.assertTrue(search.fts_query('OR').startswith('("or" OR '))
+        self.assertEqual(search.fts_query('?!'), '')
+
+
+@override_settings(LAST_POSTS=2)
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        texts = (
+            'Кот сидит на окне',
+            'Про котов и кошек: коты, коты, коты',
+            'Собака гуляет',
+            'Новогодняя ёлка',
+            'Котами займемся завтра',
+            'Который час?',
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=text) for text in texts
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def found(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params})
+        return response, list(response.context['page_obj'])
+
+    def next_cursor(self, query):
+        response, _ = self.found(query)
+        return response.context['page_obj'].next_cursor
+
+    def test_ranked_results(self):
+        """Поиск находит формы слова, самый релевантный пост первый."""
+        _, page = self.found('коты')
+        self.assertEqual(page[0], self.posts[1])
+        _, next_page = self.found('коты', after=self.next_cursor('коты'))
+        found = set(page + next_page)
+        self.assertEqual(
+            found, {self.posts[0], self.posts[1], self.posts[4]})
+        self.assertNotIn(self.posts[2], found)
+
+    def test_all_words_required(self):
+        """Пост находится, только если в нем есть все слова запроса."""
+        self.assertEqual(self.found('котов и коты')[1], [self.posts[1]])
+
+    def test_cursor_pages(self):
+        """Страницы по курсору не теряют и не повторяют посты."""
+        response, first = self.found('кот')
+        cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'?q=%D0%BA%D0%BE%D1%82&after={cursor}')
+        response, second = self.found('кот', after=cursor)
+        self.assertIsNone(response.context['page_obj'].next_cursor)
+        self.assertEqual(len(first + second), 3)
+        self.assertEqual(len(set(first + second)), 3)
+        previous = response.context['page_obj'].previous_cursor
+        _, back = self.found('кот', before=previous)
+        self.assertEqual(back, first)
+
+    def test_yo(self):
+        """«елка» находит «ёлку»."""
+        self.assertEqual(self.found('елка')[1], [self.posts[3]])
+
+    def test_index_follows_changes(self):
+        """Индекс следует за update() и удалением постов."""
+        Post.objects.filter(pk=self.posts[2].pk).update(text='Кот-собака')
+        Post.objects.filter(pk=self.posts[0].pk).delete()
+        found = set(self.found('кот')[1]) | set(
+            self.found('кот', after=self.next_cursor('кот'))[1])
+        self.assertIn(self.posts[2], found)
+        self.assertNotIn(self.posts[0], found)
+        self.assertEqual(self.found('собака гуляет')[1], [])
+
+    def test_bad_cursor_and_empty_query(self):
+        """Испорченный курсор и пустой запрос не ломают страницу."""
+        self.assertEqual(len(self.found('кот', after='bm9uZXxuYW4=')[1]), 2)
+        response, page = self.found('')
+        self.assertEqual(page, [])
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_budget(self):
+        """Поиск укладывается в бюджет запросов."""
+        assert_query_budget(
+            self.guest_client, reverse('posts:search'), data={'q': 'кот'})
+
+
+class AdminSearchTests(TestCase):
+    def test_admin_uses_index(self):
+        """Поиск в админке идет по индексу, а не LIKE."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        Post.objects.create(author=admin, text='Коты в админке')
+        Post.objects.create(author=admin, text='Собаки в админке')
+        client = Client()
+        client.force_login(admin)
+        with record_queries() as log:
+            response = client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'кот'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        sql = ' '.join(log.queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
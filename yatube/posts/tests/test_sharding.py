@@ -0,0 +1,281 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connections
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.queries import record_queries
+
+from .. import feed, sharding
+from ..models import Comment, Follow, Group, Post, Timeline
+
+User = get_user_model()
+
+SHARD = 'shard_test'
+SHARDS = ['default', SHARD]
+
+
+class ShardDatabaseMixin:
+    databases = set(SHARDS)
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.shard_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.databases[SHARD] = {
+            **connections['default'].settings_dict, 'NAME': cls.shard_path}
+        with override_settings(DATABASE_SHARDS=SHARDS):
+            call_command('migrate', database=SHARD, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[SHARD].close()
+        del connections.databases[SHARD]
+        if hasattr(connections._connections, SHARD):
+            delattr(connections._connections, SHARD)
+        os.remove(cls.shard_path)
+
+
+@override_settings(DATABASE_SHARDS=SHARDS, LAST_POSTS=3)
+class ShardingTests(ShardDatabaseMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        users = [
+            User.objects.create_user(username=f'user{i}') for i in range(4)]
+        # Авторы выбираются по id: шард автора — id % 2.
+        cls.home = next(user for user in users if user.id % 2 == 0)
+        cls.away = next(user for user in users if user.id % 2 == 1)
+        cls.reader = next(
+            user for user in users if user not in (cls.home, cls.away))
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.home)
+        Follow.objects.create(user=cls.reader, author=cls.away)
+        cls.posts = [
+            Post.objects.create(
+                author=(cls.home, cls.away)[i % 2],
+                group=cls.group,
+                text=f'Пост номер {i}',
+            )
+            for i in range(5)
+        ]
+        cls.expected = [
+            post.id for post in
+            sorted(cls.posts, key=feed._feed_key, reverse=True)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def away_post(self):
+        return next(post for post in self.posts if post.author == self.away)
+
+    def test_post_stored_in_author_shard(self):
+        """Пост лежит в шарде автора, и шард виден по его id."""
+        for post in self.posts:
+            with self.subTest(post=post.text):
+                alias = sharding.shard_for_author(post.author_id)
+                self.assertEqual(post._state.db, alias)
+                self.assertEqual(SHARDS[post.id % 2], alias)
+                self.assertTrue(
+                    Post.objects.using(alias).filter(pk=post.pk).exists())
+                other = SHARDS[1 - post.id % 2]
+                self.assertFalse(
+                    Post.objects.using(other).filter(pk=post.pk).exists())
+
+    def test_users_and_groups_mirrored(self):
+        """Пользователи и группы копируются в шарды."""
+        self.assertTrue(
+            User.objects.using(SHARD).filter(pk=self.reader.pk).exists())
+        self.assertTrue(
+            Group.objects.using(SHARD).filter(slug='test_slug').exists())
+        self.assertEqual(
+            User.objects.using(SHARD).get(pk=self.reader.pk).password, '')
+
+    def test_login_not_mirrored(self):
+        """Запись last_login при входе не копируется в шарды."""
+        with CaptureQueriesContext(connections[SHARD]) as queries:
+            self.reader.save(update_fields=['last_login'])
+        self.assertEqual(len(queries), 0)
+        self.reader.first_name = 'Читатель'
+        self.reader.save(update_fields=['first_name'])
+        self.assertEqual(
+            User.objects.using(SHARD).get(pk=self.reader.pk).first_name,
+            'Читатель',
+        )
+
+    def test_comments_and_timeline_colocated(self):
+        """Комментарии и записи лент лежат в шарде поста."""
+        post = self.away_post()
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Коммент')
+        self.assertEqual(comment._state.db, SHARD)
+        self.assertEqual(list(post.comments.all()), [comment])
+        self.assertTrue(Timeline.objects.using(SHARD).filter(
+            user=self.reader, post=post).exists())
+
+    def test_feeds_merge_shards(self):
+        """Ленты сливают посты обоих шардов по дате, в том числе курсором."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.reader_client.get(url).context['page_obj']
+                second = self.reader_client.get(
+                    url, {'after': first.next_cursor}).context['page_obj']
+                self.assertEqual(
+                    [post.id for post in first] + [post.id for post in second],
+                    self.expected,
+                )
+                back = self.reader_client.get(
+                    url, {'before': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    [post.id for post in back], self.expected[:3])
+
+    def test_api_feeds_merge_shards(self):
+        """API сливает посты обоих шардов."""
+        for url in (reverse('api:index'), reverse('api:follow_index')):
+            with self.subTest(url=url):
+                data = self.reader_client.get(url).json()
+                older = self.reader_client.get(data['next']).json()
+                self.assertEqual(
+                    [post['id'] for post in data['results']
+                     + older['results']],
+                    self.expected,
+                )
+
+    def test_profile_reads_author_shard(self):
+        """Профиль читает посты только из шарда автора."""
+        url = reverse('posts:profile', kwargs={'username': self.away})
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.reader_client.get(url)
+        self.assertEqual(
+            [post.id for post in response.context['page_obj']],
+            [pk for pk in self.expected if pk % 2 == 1],
+        )
+        self.assertFalse([
+            query for query in queries
+            if 'FROM "posts_post"' in query['sql']
+        ])
+
+    def test_queries_recorded_in_shards(self):
+        """record_queries записывает запросы ко всем шардам."""
+        url = reverse('posts:profile', kwargs={'username': self.away})
+        with record_queries() as log:
+            self.reader_client.get(url)
+        self.assertIn(SHARD, log.aliases)
+
+    def test_post_pages_on_shard(self):
+        """Пост из шарда открывается, комментируется и правится."""
+        post = self.away_post()
+        response = self.reader_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertEqual(response.context['post'], post)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.id}),
+            data={'text': 'Коммент'},
+        )
+        self.assertTrue(Comment.objects.using(SHARD).filter(
+            post=post, text='Коммент').exists())
+        response = self.reader_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': post.id}))
+        self.assertContains(response, 'Коммент')
+        away_client = Client()
+        away_client.force_login(self.away)
+        away_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={'text': 'Новый текст'},
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Новый текст')
+
+    def test_search_merges_shards(self):
+        """Поиск собирает найденное из обоих шардов без повторов."""
+        url = reverse('posts:search')
+        first = self.reader_client.get(
+            url, {'q': 'номер'}).context['page_obj']
+        second = self.reader_client.get(
+            url, {'q': 'номер', 'after': first.next_cursor}
+        ).context['page_obj']
+        found = [post.id for post in first] + [post.id for post in second]
+        self.assertEqual(sorted(found), sorted(self.expected))
+
+
+@override_settings(DATABASE_SHARDS=SHARDS)
+class ReshardTests(ShardDatabaseMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        # Данные из базы без шардирования: id выдавал автоинкремент.
+        with override_settings(DATABASE_SHARDS=[]):
+            self.reader = User.objects.create_user(username='reader')
+            self.authors = [
+                User.objects.create_user(username=f'author{i}')
+                for i in range(2)
+            ]
+            Follow.objects.create(user=self.reader, author=self.authors[1])
+            for i in range(6):
+                post = Post.objects.create(
+                    author=self.authors[i % 2], text=f'Старый пост {i}')
+            Comment.objects.create(
+                post=post, author=self.reader, text='Старый коммент')
+
+    def find(self, text):
+        found = [
+            post for queryset in sharding.each_shard(Post.objects.all())
+            for post in queryset.filter(text=text)
+        ]
+        self.assertEqual(len(found), 1)
+        return found[0]
+
+    def test_posts_moved_to_author_shard(self):
+        """Старые посты переезжают в шард автора под новыми id."""
+        call_command('reshard_posts', batch_size=2, stdout=StringIO())
+        for i in range(6):
+            with self.subTest(i=i):
+                post = self.find(f'Старый пост {i}')
+                alias = sharding.shard_for_author(post.author_id)
+                self.assertEqual(post._state.db, alias)
+                self.assertEqual(sharding.shard_for_post(post.id), alias)
+        post = self.find('Старый пост 5')
+        self.assertEqual(post.comments.get().text, 'Старый коммент')
+        self.assertEqual(post.comments_count, 1)
+        client = Client()
+        client.force_login(self.reader)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            [f'Старый пост {i}' for i in (5, 3, 1)],
+        )
+        response = client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, 'Старый коммент')
+
+    def test_new_ids_skip_legacy(self):
+        """Новые посты не получают id, выданные до шардирования."""
+        call_command('reshard_posts', stdout=StringIO())
+        legacy = {
+            pk for queryset in sharding.each_shard(Post.objects.all())
+            for pk in queryset.values_list('pk', flat=True)
+        }
+        post = Post.objects.create(author=self.authors[0], text='Новый пост')
+        self.assertGreater(post.pk, max(legacy))
+        call_command('reshard_posts', stdout=StringIO())
+        self.assertEqual(self.find('Новый пост').pk, post.pk)
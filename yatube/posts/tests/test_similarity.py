@@ -0,0 +1,124 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.queries import record_queries
+
+from .. import similarity
+from ..models import Post, PostSignature, SimilarityBucket
+
+User = get_user_model()
+
+CATS = 'Кошки любят спать на подоконнике и смотреть на птиц во дворе'
+CATS_AGAIN = 'Коты любят спать на подоконнике и смотреть на птиц за окном'
+WEATHER = 'Завтра обещают сильный дождь, ветер и похолодание по области'
+
+
+class SignatureTests(TestCase):
+    def test_shingles_are_stems(self):
+        """Слова сводятся к основам, короткие слова отбрасываются."""
+        self.assertEqual(
+            similarity.shingles('Коты и КОТАМИ на ёлке'), {'кот', 'елк'})
+
+    def test_signature_stable(self):
+        """Подпись одинакова для одинаковых текстов и без слов — None."""
+        minhash = similarity.signature(CATS)
+        self.assertEqual(len(minhash), similarity.NUM_PERM)
+        self.assertEqual(minhash, similarity.signature(CATS))
+        self.assertIsNone(similarity.signature('?! 1 2'))
+
+    def test_similar_texts_share_buckets(self):
+        """Похожие тексты делят корзины, непохожие — нет."""
+        cats = set(similarity.bucket_keys(similarity.signature(CATS)))
+        again = set(similarity.bucket_keys(similarity.signature(CATS_AGAIN)))
+        weather = set(similarity.bucket_keys(similarity.signature(WEATHER)))
+        self.assertEqual(len(cats), similarity.BANDS)
+        self.assertTrue(cats & again)
+        self.assertFalse(cats & weather)
+
+
+class RelatedPostsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.cats = Post.objects.create(author=cls.user, text=CATS)
+        cls.cats_again = Post.objects.create(author=cls.user, text=CATS_AGAIN)
+        cls.weather = Post.objects.create(author=cls.user, text=WEATHER)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_on_create(self):
+        """Новый пост сразу получает подпись и корзину на каждую полосу."""
+        self.assertTrue(
+            PostSignature.objects.filter(post=self.cats).exists())
+        self.assertEqual(
+            SimilarityBucket.objects.filter(post=self.cats).count(),
+            similarity.BANDS,
+        )
+
+    def test_related_posts(self):
+        """Похожим считается пост с общими корзинами."""
+        self.assertEqual(
+            similarity.related_posts(self.cats.id, 5), [self.cats_again])
+        self.assertEqual(similarity.related_posts(self.weather.id, 5), [])
+
+    def test_reindex_on_edit(self):
+        """После правки текста пост ищется по новому тексту."""
+        post = Post.objects.get(pk=self.weather.id)
+        post.text = CATS
+        post.save()
+        self.assertEqual(
+            similarity.related_ids(self.cats.id, 5),
+            [self.weather.id, self.cats_again.id],
+        )
+        self.assertEqual(
+            SimilarityBucket.objects.filter(post=post).count(),
+            similarity.BANDS,
+        )
+
+    def test_unchanged_text_not_reindexed(self):
+        """Сохранение без изменения текста не трогает индекс."""
+        post = Post.objects.get(pk=self.cats.id)
+        with record_queries() as log:
+            post.save()
+        self.assertFalse(
+            [sql for sql in log.queries if 'similarity' in sql])
+
+    def test_post_page_loads_related(self):
+        """
+        Страница поста подгружает похожие записи отдельным запросом
+        и не хранит их в своем кэше.
+        """
+        client = Client()
+        response = client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.cats.id}))
+        url = reverse('posts:post_related', kwargs={'post_id': self.cats.id})
+        self.assertNotIn('related', response.context)
+        self.assertContains(response, url)
+        self.assertNotContains(response, 'Похожие записи')
+        response = client.get(url)
+        self.assertEqual(response.context['related'], [self.cats_again])
+        self.assertContains(response, 'Похожие записи')
+        newer = Post.objects.create(author=self.user, text=self.cats.text)
+        response = client.get(url)
+        self.assertIn(newer, response.context['related'])
+
+    def test_build_similarity(self):
+        """Команда заново строит индекс всех постов."""
+        SimilarityBucket.objects.all().delete()
+        PostSignature.objects.all().delete()
+        out = StringIO()
+        call_command(
+            'build_similarity', workers=0, batch_size=2, stdout=out)
+        self.assertIn('постов 3', out.getvalue())
+        self.assertEqual(PostSignature.objects.count(), 3)
+        self.assertEqual(
+            SimilarityBucket.objects.count(), 3 * similarity.BANDS)
+        self.assertEqual(
+            similarity.related_posts(self.cats.id, 5), [self.cats_again])
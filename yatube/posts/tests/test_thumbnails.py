@@ -0,0 +1,311 @@
+import json
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (Client, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.urls import reverse
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from core.queries import record_queries
+from core.testing import assert_query_budget
+
+from .. import sorl_compat, thumbnails
+from ..models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TransactionTestCase):
+    """
+    Миниатюры создаются после коммита, поэтому тесты идут
+    в настоящих транзакциях.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def create_post(self, name='small.gif'):
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name=name, content=SMALL_GIF, content_type='image/gif'),
+            },
+        )
+        return Post.objects.get(author=self.user)
+
+    def test_thumbnail_saved_after_create(self):
+        """После создания поста сохраняются адрес и размеры миниатюры."""
+        post = self.create_post()
+        self.assertTrue(post.thumbnail_url)
+        self.assertEqual(
+            (post.thumbnail_width, post.thumbnail_height), (960, 339))
+
+    @override_settings(QUERY_BUDGET_ENABLED=True)
+    def test_thumbnail_created_after_response(self):
+        """Миниатюра создается после ответа и не входит в бюджет."""
+        Post.objects.create(author=self.user, text='Первый пост')
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(
+                    name='small.gif', content=SMALL_GIF,
+                    content_type='image/gif'),
+            },
+        )
+        self.assertLessEqual(
+            int(response['X-Query-Count']),
+            response.resolver_match.func.query_budget,
+        )
+        self.assertTrue(
+            Post.objects.get(author=self.user, image__gt='').thumbnail_url)
+
+    def test_page_uses_saved_thumbnail(self):
+        """Страница берет сохраненную миниатюру с размерами."""
+        post = self.create_post()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(
+            response,
+            f'src="{post.thumbnail_url}" width="960" height="339"',
+        )
+
+    def test_srcset_saved_and_rendered(self):
+        """Варианты по ширинам сохраняются и попадают в srcset."""
+        post = self.create_post()
+        self.assertIn(' 480w, ', post.thumbnail_srcset)
+        self.assertTrue(post.thumbnail_srcset.endswith(' 960w'))
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, f'srcset="{post.thumbnail_srcset}"')
+
+    def test_picture_sources_rendered(self):
+        """Сохраненные форматы выводятся в <source> без вычислений."""
+        post = self.create_post()
+        sources = [{'type': 'image/webp', 'srcset': '/media/a.webp 480w'}]
+        Post.objects.filter(pk=post.pk).update(
+            thumbnail_sources=json.dumps(sources))
+        cache.clear()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(
+            response, '<source type="image/webp" srcset="/media/a.webp 480w"')
+
+    @skipUnless('WEBP' in thumbnails.modern_formats(), 'Pillow без WebP')
+    def test_webp_variants_created(self):
+        """При поддержке WebP создаются его варианты."""
+        post = self.create_post()
+        types = [source['type'] for source in post.picture_sources]
+        self.assertIn('image/webp', types)
+
+    @override_settings(THUMBNAIL_FORMATS=('AVIF', 'PNG'))
+    def test_source_variants_created(self):
+        """Варианты создаются только в форматах, которые умеет sorl."""
+        post = self.create_post()
+        self.assertEqual(
+            [source['type'] for source in post.picture_sources],
+            ['image/png'],
+        )
+
+    def test_image_change_resets_thumbnail(self):
+        """Замена картинки сбрасывает миниатюру и создает новую."""
+        post = self.create_post()
+        old_url = post.thumbnail_url
+        post.image = SimpleUploadedFile(
+            name='other.gif',
+            content=SMALL_GIF.replace(b'\xFF\xFF\xFF', b'\x00\x00\xFF'),
+            content_type='image/gif',
+        )
+        post.save()
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_url)
+        self.assertNotEqual(post.thumbnail_url, old_url)
+
+    def test_text_change_keeps_thumbnail(self):
+        """Правка текста не пересоздает миниатюру."""
+        post = self.create_post()
+        old_url = post.thumbnail_url
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail_url, old_url)
+
+    def test_fallback_without_saved_thumbnail(self):
+        """Без сохраненной миниатюры страница создает ее сама."""
+        post = self.create_post()
+        Post.objects.filter(pk=post.pk).update(thumbnail_url='')
+        cache.clear()
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'class="card-img my-2" src="')
+
+    def test_missing_file_is_logged(self):
+        """Ошибка создания миниатюры не ломает сохранение поста."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image='posts/missing.gif')
+        with self.assertLogs(thumbnails.logger, 'ERROR'):
+            thumbnails._generate_safely(post.pk)
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail_url, '')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PrefetchThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Ключи sorl в кэше могли остаться от других тестов
+        # с той же картинкой.
+        cache.clear()
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = []
+        for i in range(3):
+            post = Post(author=cls.user, text=f'Пост {i}')
+            post.image.save(f'small{i}.gif', ContentFile(SMALL_GIF))
+            cls.posts.append(post)
+        cls.thumbnails = [
+            get_thumbnail(post.image, thumbnails.GEOMETRY,
+                          **thumbnails.OPTIONS)
+            for post in cls.posts
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_prefetch_matches_sorl(self):
+        """Пакетный поиск находит те же миниатюры, что и sorl."""
+        posts = list(Post.objects.order_by('pk'))
+        thumbnails.prefetch(posts)
+        for post, thumbnail in zip(posts, self.thumbnails):
+            self.assertEqual(post.prefetched_thumbnail.url, thumbnail.url)
+            self.assertEqual(post.thumbnail_url, '')
+
+    def test_prefetch_queries(self):
+        """
+        Промахи кэша читаются одним запросом, повторно — из кэша.
+        """
+        with record_queries() as log:
+            thumbnails.prefetch(list(Post.objects.all()))
+        self.assertEqual(len(log), 2)
+        with record_queries() as log:
+            thumbnails.prefetch(list(Post.objects.all()))
+        self.assertEqual(len(log), 1)
+
+    def test_prefetch_keeps_markup(self):
+        """С пакетным поиском страница выводится той же разметкой."""
+        url = reverse('posts:index')
+        with mock.patch.object(sorl_compat, 'TESTED_VERSIONS', ()):
+            expected = self.guest_client.get(url).content
+        cache.clear()
+        self.assertEqual(self.guest_client.get(url).content, expected)
+
+    def test_index_without_thumbnail_n_plus_one(self):
+        """Главная страница не читает миниатюры по одной."""
+        response = assert_query_budget(
+            self.guest_client, reverse('posts:index'))
+        self.assertContains(response, self.thumbnails[0].url)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WIDTHS=(960,))
+class WarmThumbnailsTests(TestCase):
+    # Основная миниатюра совпадает с вариантом 960 в исходном формате.
+    PER_POST = 1 + len(thumbnails.modern_formats())
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cache.clear()
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = []
+        for i in range(3):
+            post = Post(author=cls.user, text=f'Пост {i}')
+            post.image.save(f'warm{i}.gif', ContentFile(SMALL_GIF))
+            cls.posts.append(post)
+        Post.objects.create(author=cls.user, text='Без картинки')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def warm(self, **options):
+        out = StringIO()
+        call_command('warm_thumbnails', workers=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_warm_stores_thumbnails(self):
+        """Команда создает и сохраняет миниатюры постов с картинками."""
+        output = self.warm(batch_size=2)
+        for post in self.posts:
+            post.refresh_from_db()
+            self.assertEqual(
+                (post.thumbnail_width, post.thumbnail_height), (960, 339))
+        self.assertIn(f'--after {self.posts[1].pk}', output)
+        self.assertIn(
+            f'постов 3, миниатюр {3 * self.PER_POST}, ошибок 0', output)
+
+    def test_warm_resumes_after_id(self):
+        """С --after обрабатываются только посты с большим id."""
+        output = self.warm(after=self.posts[0].pk)
+        self.assertIn('постов 2', output)
+        self.posts[0].refresh_from_db()
+        self.assertEqual(self.posts[0].thumbnail_url, '')
+
+    @override_settings(THUMBNAIL_EXTRA_GEOMETRIES=('100x100',))
+    def test_warm_extra_geometries(self):
+        """Команда создает миниатюры дополнительных геометрий."""
+        output = self.warm()
+        self.assertIn(f'миниатюр {3 * (self.PER_POST + 1)}', output)
+        source = ImageFile(self.posts[0].image)
+        name = sorl_compat.thumbnail_name(
+            source, '100x100', thumbnails.full_options(source))
+        self.assertTrue(default.storage.exists(name))
+
+
+class SorlCompatTests(SimpleTestCase):
+    def test_installed_version_tested(self):
+        """Установленный выпуск sorl проверен."""
+        self.assertEqual(sorl_compat.check_version(None), [])
+
+    def test_untested_version_disables_lookup(self):
+        """Непроверенный выпуск sorl отключает пакетный поиск."""
+        with mock.patch.object(sorl_compat, 'TESTED_VERSIONS', ()):
+            self.assertEqual(
+                [warning.id for warning in sorl_compat.check_version(None)],
+                ['posts.W001'],
+            )
+            self.assertFalse(sorl_compat.can_lookup())
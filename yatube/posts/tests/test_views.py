@@ -1,13 +1,22 @@
 import shutil
 import tempfile
+from io import StringIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.utils.http import http_date
 
+from core.queries import record_queries
+from core.testing import assert_query_budget
+
+from .. import caching, views
 from ..forms import PostForm, CommentForm
 from ..models import Comment, Follow, Group, Post
 
@@ -223,15 +232,69 @@ class PostPagesTests(TestCase):
         )
         content_add = self.authorized_client.get(
             reverse('posts:index')).content
-        post.delete()
-        content_afther = self.authorized_client.get(
+        Post.objects.filter(pk=post.pk).update(text='Без сигналов')
+        content_update = self.authorized_client.get(
             reverse('posts:index')).content
-        self.assertEqual(content_add, content_afther)
+        self.assertEqual(content_add, content_update)
         cache.clear()
         content_clear = self.authorized_client.get(
             reverse('posts:index')).content
         self.assertNotEqual(content_add, content_clear)
 
+    def test_cached_fragment_skips_posts(self):
+        """При попадании во фрагментный кэш посты не читаются."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.authorized_client.get(url)
+                with record_queries() as log:
+                    second = self.authorized_client.get(url)
+                self.assertEqual(first.content, second.content)
+                self.assertFalse([
+                    query for query in log.queries
+                    if 'FROM "posts_post"' in query
+                ])
+
+    def test_cache_invalidated_on_delete(self):
+        """Удаление поста сразу сбрасывает кэш страниц."""
+        post = Post.objects.create(
+            text='Кээээш',
+            author=self.user,
+            group=self.group
+        )
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'Кээээш')
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(
+                    self.guest_client.get(url), 'Кээээш')
+
+    def test_cache_keyed_by_page_and_viewer(self):
+        """Кэш различает страницы и состояние зрителя."""
+        for i in range(10):
+            Post.objects.create(text=f'Пост {i}', author=self.user)
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(
+            reverse('posts:index'),
+            {'after': first.context['page_obj'].next_cursor})
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(second, 'Тестовый пост 2')
+        self.assertNotContains(first, 'Избранные авторы')
+        self.assertContains(
+            self.authorized_client.get(reverse('posts:index')),
+            'Избранные авторы')
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -252,8 +315,10 @@ class PaginatorViewsTest(TestCase):
             ))
 
         Post.objects.bulk_create(cls.posts)
+        call_command('recount', stdout=StringIO())
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -286,6 +351,48 @@ class PaginatorViewsTest(TestCase):
             response = self.guest_client.get(urls)
             self.assertEqual(len(response.context['page_obj']), 3)
 
+    def test_cursor_pages(self):
+        """Курсоры ведут на следующую и обратно на первую страницу."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url).context['page_obj']
+                self.assertIsNone(first.previous_cursor)
+                second = self.guest_client.get(
+                    url, {'after': first.next_cursor}).context['page_obj']
+                self.assertEqual(len(second), 3)
+                self.assertIsNone(second.next_cursor)
+                self.assertNotIn(second[0], first.object_list)
+                back = self.guest_client.get(
+                    url, {'before': second.previous_cursor}
+                ).context['page_obj']
+                self.assertEqual(back.object_list, first.object_list)
+
+    def test_follow_cursor_pages(self):
+        """Курсоры работают в ленте подписок."""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.authorized_client.force_login(reader)
+        url = reverse('posts:follow_index')
+        first = self.authorized_client.get(url).context['page_obj']
+        second = self.authorized_client.get(
+            url, {'after': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 3)
+        self.assertEqual(
+            list(first) + list(second),
+            list(Post.objects.order_by('-pub_date', '-id')))
+
+    def test_broken_cursor_shows_first_page(self):
+        """Поврежденный курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'broken'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -358,3 +465,380 @@ class FollowViewsTest(TestCase):
             reverse('posts:follow_index')
         )
         self.assertNotIn(post, response.context['page_obj'].object_list)
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.user,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+
+    def test_anonymous_pages_served_without_queries(self):
+        """Повторная анонимная страница отдается без запросов к базе."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    second = self.guest_client.get(url)
+                self.assertEqual(first.content, second.content)
+
+    def test_extra_params_share_page(self):
+        """Посторонние параметры запроса не создают копий страницы."""
+        url = self.urls[0]
+        first = self.guest_client.get(url)
+        second = self.guest_client.get(url, {'utm_source': 'mail'})
+        self.assertIsNone(second.context)
+        self.assertEqual(first.content, second.content)
+        self.assertIsNotNone(
+            self.guest_client.get(url, {'page': 1}).context)
+
+    def test_authorized_pages_not_cached(self):
+        """Страницы авторизованных пользователей не кэшируются целиком."""
+        self.authorized_client.get(self.urls[0])
+        response = self.authorized_client.get(self.urls[0])
+        self.assertIsNotNone(response.context)
+
+    def test_comment_invalidates_post_page(self):
+        """Новый комментарий сбрасывает кэш страницы поста."""
+        url = self.urls[3]
+        self.guest_client.get(url)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Свежий комментарий')
+        self.assertContains(self.guest_client.get(url), 'Свежий комментарий')
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_replica_pages_not_cached(self):
+        """Страница с реплики не кэшируется и отдается без валидаторов."""
+        url = self.urls[0]
+        first = self.guest_client.get(url)
+        self.assertFalse(first.has_header('ETag'))
+        fragment = make_template_fragment_key(
+            'index_page', [first.context['fragment_key']])
+        self.assertIsNone(cache.get(fragment))
+        self.assertIsNotNone(self.guest_client.get(url).context)
+
+    def render_with_write(self, url):
+        """Отдаст страницу, сдвинув поколение 'global' во время вызова."""
+        paginate = views.lazy_paginate
+
+        def write_during_view(*args, **kwargs):
+            caching.bump('global')
+            return paginate(*args, **kwargs)
+
+        with mock.patch.object(views, 'lazy_paginate', write_during_view):
+            return self.guest_client.get(url)
+
+    def test_write_during_first_render_not_cached(self):
+        """Страница, во время которой шла запись, не сохраняется."""
+        url = self.urls[0]
+        first = self.render_with_write(url)
+        self.assertFalse(first.has_header('ETag'))
+        self.assertIsNotNone(self.guest_client.get(url).context)
+
+    def test_write_during_render_keeps_old_generation(self):
+        """Страница сохраняется под поколениями, снятыми до представления."""
+        url = self.urls[0]
+        etag = self.guest_client.get(url)['ETag']
+        caching.bump('global')
+        stale = self.render_with_write(url)
+        self.assertNotEqual(stale['ETag'], etag)
+        response = self.guest_client.get(
+            url, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.context)
+
+    def test_group_change_invalidates_pages(self):
+        """Изменение группы сбрасывает кэш страниц с ней."""
+        for url in self.urls:
+            self.guest_client.get(url)
+        self.group.title = 'Новое название'
+        self.group.save()
+        for url in self.urls[1], self.urls[3]:
+            with self.subTest(url=url):
+                self.assertContains(
+                    self.guest_client.get(url), 'Новое название')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            text='Тестовый пост',
+            author=cls.user,
+            group=cls.group,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+
+    def test_not_modified(self):
+        """Неизменная страница отвечает 304 без запросов к базе."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                first = self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    by_etag = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=first['ETag'])
+                    by_date = self.guest_client.get(
+                        url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+                self.assertEqual(by_etag.status_code, 304)
+                self.assertEqual(by_etag['ETag'], first['ETag'])
+                self.assertEqual(by_date.status_code, 304)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_not_modified_without_page_cache(self):
+        """304 не зависит от кэша целых страниц."""
+        first = self.guest_client.get(self.urls[0])
+        response = self.guest_client.get(
+            self.urls[0], HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_change_renders_page(self):
+        """После изменения поста страницы отдаются заново с новым ETag."""
+        etags = [self.guest_client.get(url)['ETag'] for url in self.urls]
+        post = Post.objects.get(pk=self.post.id)
+        post.text = 'Новый текст'
+        post.save()
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, 'Новый текст')
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_validators_from_snapshot_before_view(self):
+        """ETag и Last-Modified снимаются до вызова представления."""
+        url = self.urls[0]
+        etag = self.guest_client.get(url)['ETag']
+        caching.bump('global')
+        cache.set(caching.MODIFIED_KEY.format('global'), 1000000000)
+        paginate = views.lazy_paginate
+
+        def write_during_view(*args, **kwargs):
+            caching.bump('global')
+            return paginate(*args, **kwargs)
+
+        with mock.patch.object(views, 'lazy_paginate', write_during_view):
+            response = self.guest_client.get(url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response['Last-Modified'], http_date(1000000000))
+
+    def test_authorized_pages_without_validators(self):
+        """Авторизованным посетителям страницы отдаются целиком."""
+        etag = self.guest_client.get(self.urls[0])['ETag']
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}') for i in range(5)
+        ]
+        cls.user = cls.users[0]
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        for i in range(100):
+            post = Post.objects.create(
+                text=f'Тестовый пост {i}',
+                author=cls.users[i % 5],
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=post, author=cls.users[(i + 1) % 5], text='Коммент')
+        cls.post = post
+        for author in cls.users[1:]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+        self.author_client = Client()
+        self.author_client.force_login(self.post.author)
+
+    def test_pages_within_budget(self):
+        """Страницы укладываются в бюджет при 1, 10 и 100 постах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_lists', kwargs={'slug': 'test_slug'}),
+            reverse('posts:profile', kwargs={'username': 'user1'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+            reverse('posts:post_related', kwargs={'post_id': self.post.id}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_create'),
+        )
+        for per_page in (1, 10, 100):
+            for client in (self.guest_client, self.authorized_client):
+                for url in urls:
+                    with self.subTest(per_page=per_page, url=url):
+                        cache.clear()
+                        with override_settings(LAST_POSTS=per_page):
+                            assert_query_budget(client, url)
+
+    def test_admin_changelist_queries_fixed(self):
+        """Число запросов списка постов в админке не зависит от строк."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:posts_post_changelist')
+        counts = []
+        for search in ('Тестовый пост 99', 'Тестовый пост'):
+            with record_queries() as log:
+                response = client.get(url, {'q': search})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(log.duplicates(), {})
+            counts.append(len(log))
+        self.assertEqual(counts[0], counts[1])
+
+    @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+    def test_writes_within_budget(self):
+        """Запись постов, комментариев и подписок укладывается в бюджет."""
+        self.addCleanup(shutil.rmtree, TEMP_MEDIA_ROOT, ignore_errors=True)
+        post_id = self.post.id
+        assert_query_budget(
+            self.authorized_client,
+            reverse('posts:post_create'),
+            method='post',
+            data={
+                'text': 'Новый пост достаточно длинный, чтобы его сверили '
+                        'с недавними постами на дубликаты',
+                'group': self.group.id,
+            },
+        )
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        assert_query_budget(
+            self.authorized_client,
+            reverse('posts:post_create'),
+            method='post',
+            data={
+                'text': 'Пост с картинкой',
+                'group': self.group.id,
+                'image': SimpleUploadedFile(
+                    name='small.gif',
+                    content=small_gif,
+                    content_type='image/gif',
+                ),
+            },
+        )
+        self.assertTrue(
+            Post.objects.filter(text='Пост с картинкой').exclude(
+                image='').exists())
+        assert_query_budget(
+            self.author_client,
+            reverse('posts:post_edit', kwargs={'post_id': post_id}),
+            method='post',
+            data={
+                'text': 'Изменение тоже достаточно длинное, и после правки '
+                        'текст снова проверяется на дубликаты',
+                'group': self.group.id,
+            },
+        )
+        assert_query_budget(
+            self.authorized_client,
+            reverse('posts:add_comment', kwargs={'post_id': post_id}),
+            method='post',
+            data={'text': 'Комментарий'},
+        )
+        assert_query_budget(
+            self.authorized_client,
+            reverse('posts:profile_unfollow', kwargs={'username': 'user1'}),
+        )
+        assert_query_budget(
+            self.authorized_client,
+            reverse('posts:profile_follow', kwargs={'username': 'user1'}),
+        )
+
+
+@override_settings(LAST_COMMENTS=3)
+class CommentsPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Тестовый пост', author=cls.user)
+        cls.comments = [
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+
+    def test_first_page_inline(self):
+        """На странице поста только первая страница новых комментариев."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.comments[:1:-1])
+        self.assertContains(response, 'load-comments')
+
+    def test_older_comments_fragment(self):
+        """Фрагмент по курсору отдает более старые комментарии."""
+        detail = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+        response = assert_query_budget(
+            self.guest_client,
+            url,
+            data={'after': detail.context['comments'].next_cursor},
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(
+            list(response.context['comments']), self.comments[1::-1])
+        self.assertNotContains(response, 'load-comments')
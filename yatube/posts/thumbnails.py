@@ -0,0 +1,226 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+
+from . import sorl_compat
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = '960x339'
+OPTIONS = {'padding': True, 'upscale': True}
+
+_executor = None
+# Посты, миниатюры которых создаются после отправки ответа.
+# Вне запроса список не заведен.
+_deferred = threading.local()
+
+
+def _get_executor():
+    """Вернет общий пул фоновых потоков, создав его при первом вызове."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def _load(post_id):
+    return Post.objects.on_post(post_id).filter(pk=post_id).only(
+        'id', 'image').first()
+
+
+def modern_formats():
+    """
+    Вернет форматы из THUMBNAIL_FORMATS, которые умеют сохранять
+    и установленный Pillow, и sorl-thumbnail.
+    """
+    Image.init()
+    return [
+        format_ for format_ in settings.THUMBNAIL_FORMATS
+        if format_ in Image.SAVE and format_ in EXTENSIONS
+    ]
+
+
+def variant_geometry(width):
+    """Вернет геометрию варианта шириной width с пропорциями GEOMETRY."""
+    base_width, base_height = map(int, GEOMETRY.split('x'))
+    return f'{width}x{round(width * base_height / base_width)}'
+
+
+def _variants(image):
+    """
+    Создаст миниатюру GEOMETRY и ее варианты по ширинам
+    THUMBNAIL_WIDTHS в исходном и современных форматах.
+
+    Вернет значения полей миниатюры поста и число миниатюр.
+    """
+    main = get_thumbnail(image, GEOMETRY, **OPTIONS)
+    names = {main.name}
+
+    def srcset(**options):
+        variants = [
+            get_thumbnail(image, variant_geometry(width), **OPTIONS, **options)
+            for width in settings.THUMBNAIL_WIDTHS
+        ]
+        names.update(variant.name for variant in variants)
+        return ', '.join(
+            f'{variant.url} {variant.width}w' for variant in variants
+        )
+
+    sources = [
+        {'type': Image.MIME[format_], 'srcset': srcset(format=format_)}
+        for format_ in modern_formats()
+    ]
+    fields = {
+        'thumbnail_url': main.url,
+        'thumbnail_width': main.width,
+        'thumbnail_height': main.height,
+        'thumbnail_srcset': srcset(),
+        'thumbnail_sources': json.dumps(sources) if sources else '',
+    }
+    return fields, len(names)
+
+
+def _store(post, fields):
+    """
+    Сохранит поля миниатюры, если картинку не успели заменить:
+    новую картинку обработает ее собственная задача.
+    """
+    Post.objects.on_post(post.pk).filter(
+        pk=post.pk, image=post.image.name).update(**fields)
+
+
+def generate(post_id):
+    """Создаст миниатюры картинки поста и сохранит их адреса и размеры."""
+    post = _load(post_id)
+    if post is None or not post.image:
+        return
+    fields, _ = _variants(post.image)
+    _store(post, fields)
+
+
+def warm(post_id):
+    """
+    Создаст миниатюры картинки поста, как generate, и еще
+    геометрии из THUMBNAIL_EXTRA_GEOMETRIES. Вернет число миниатюр.
+    """
+    post = _load(post_id)
+    if post is None or not post.image:
+        return 0
+    fields, count = _variants(post.image)
+    _store(post, fields)
+    for geometry in settings.THUMBNAIL_EXTRA_GEOMETRIES:
+        get_thumbnail(post.image, geometry, **OPTIONS)
+    return count + len(settings.THUMBNAIL_EXTRA_GEOMETRIES)
+
+
+def full_options(source, **options):
+    """
+    Дополнит OPTIONS и options настройками sorl-thumbnail так же,
+    как это делает get_thumbnail.
+    """
+    backend = default.backend
+    options = {**OPTIONS, **options}
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', sorl_compat.image_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def _thumbnail_file(image):
+    """
+    Вернет файл миниатюры картинки без обращения к хранилищу:
+    то же имя, которое получит get_thumbnail с GEOMETRY и OPTIONS.
+    """
+    source = ImageFile(image)
+    name = sorl_compat.thumbnail_name(
+        source, GEOMETRY, full_options(source))
+    return ImageFile(name, default.storage)
+
+
+def prefetch(posts):
+    """
+    Найдет в хранилище sorl сразу для всей страницы миниатюры постов,
+    у которых они еще не сохранены, и положит их в prefetched_thumbnail.
+
+    Шаблон выводит такую миниатюру той же разметкой, что и тег
+    {% thumbnail %}. Посты, миниатюр которых нет и в хранилище,
+    остаются как есть: шаблон создаст их этим тегом.
+    """
+    if not sorl_compat.can_lookup():
+        return
+    pending = {}
+    for post in posts:
+        if post.image and not post.thumbnail_url:
+            key = sorl_compat.key(_thumbnail_file(post.image))
+            pending.setdefault(key, []).append(post)
+    if not pending:
+        return
+    for key, value in sorl_compat.lookup(list(pending)).items():
+        thumbnail = deserialize_image_file(value)
+        for post in pending[key]:
+            post.prefetched_thumbnail = thumbnail
+
+
+def _generate_safely(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception('Не удалось создать миниатюру поста %s', post_id)
+
+
+def _generate_in_background(post_id):
+    try:
+        _generate_safely(post_id)
+    finally:
+        close_old_connections()
+
+
+def defer():
+    """Начнет откладывать миниатюры запроса до отправки ответа."""
+    _deferred.post_ids = []
+
+
+def run_deferred():
+    """Создаст миниатюры, отложенные в запросе."""
+    post_ids = getattr(_deferred, 'post_ids', None) or []
+    _deferred.post_ids = None
+    for post_id in post_ids:
+        _generate_safely(post_id)
+
+
+def schedule(post_id):
+    """
+    Поставит создание миниатюры в очередь после коммита транзакции.
+
+    При THUMBNAIL_WORKERS = 0 миниатюра создается в том же потоке:
+    в запросе — после отправки ответа, чтобы не задерживать его
+    и не попадать в бюджет запросов, вне запроса — сразу.
+    """
+    def submit():
+        if settings.THUMBNAIL_WORKERS:
+            _get_executor().submit(_generate_in_background, post_id)
+        elif getattr(_deferred, 'post_ids', None) is not None:
+            _deferred.post_ids.append(post_id)
+        else:
+            _generate_safely(post_id)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,107 @@
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (StopUpload,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+
+class LimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемые файлы сразу во временный файл, минуя память.
+
+    На POST_IMAGE_MAX_BYTES разбор запроса обрывается, и остаток
+    тела не читается. Оборванный файл остается в oversized:
+    его отклонит check_image.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.POST_IMAGE_MAX_BYTES:
+            self.oversized = UploadedFile(
+                name=self.file_name,
+                content_type=self.content_type,
+                size=self.received,
+            )
+            raise StopUpload(connection_reset=True)
+        self.file.write(raw_data)
+
+
+def limit_uploads(view):
+    """
+    Разберет загрузки view обработчиком LimitedUploadHandler,
+    не трогая остальные формы сайта.
+
+    Обработчики нельзя сменить после чтения request.POST, а его
+    читает CsrfViewMiddleware, поэтому CSRF проверяется здесь.
+    Декоратор ставится под login_required: тело запроса гостя
+    не разбирается во временные файлы.
+    """
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        handler = LimitedUploadHandler(request)
+        request.upload_handlers = [handler]
+
+        @csrf_protect
+        def limited(request):
+            # Без проверки CSRF тело разбирается только здесь.
+            files = request.FILES
+            oversized = getattr(handler, 'oversized', None)
+            if oversized is not None:
+                files.appendlist(handler.field_name, oversized)
+            return view(request, *args, **kwargs)
+        return limited(request)
+    return wrapper
+
+
+def _read_size(upload):
+    """Вернет ширину и высоту картинки, прочитав только заголовок."""
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        source = upload
+    try:
+        with Image.open(source) as image:
+            return image.size
+    finally:
+        if source is upload:
+            upload.seek(0)
+
+
+def check_image(upload):
+    """
+    Проверит размер файла и число пикселей картинки до ее декодирования.
+
+    Вернет ValidationError или None. Битые файлы пропускаются:
+    их отклонит ImageField.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_BYTES:
+        return ValidationError(
+            'Файл больше %(limit)s.',
+            code='file_too_large',
+            params={'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)},
+        )
+    too_large = ValidationError(
+        'Картинка больше %(limit)s мегапикселей.',
+        code='image_too_large',
+        params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+    )
+    try:
+        width, height = _read_size(upload)
+    except Image.DecompressionBombError:
+        return too_large
+    except Exception:
+        return None
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        return too_large
+    return None
@@ -1,28 +1,71 @@
 from django.urls import path
 
+from core.queries import query_budget
+
 from . import views
 
 app_name = 'posts'
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('group/<slug:slug>/', views.group_posts, name='group_lists'),
-    path('profile/<str:username>/', views.profile, name='profile'),
-    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
-    path('create/', views.post_create, name='post_create'),
-    path('posts/<int:post_id>/edit/',
-         views.post_edit, name='post_edit'),
-    path('posts/<int:post_id>/comment/',
-         views.add_comment, name='add_comment'),
-    path('follow/', views.follow_index, name='follow_index'),
+    path('', query_budget(views.index, 3), name='index'),
+    path(
+        'group/<slug:slug>/',
+        query_budget(views.group_posts, 4),
+        name='group_lists'
+    ),
+    path(
+        'profile/<str:username>/',
+        query_budget(views.profile, 6),
+        name='profile'
+    ),
+    path(
+        'posts/<int:post_id>/',
+        query_budget(views.post_detail, 5),
+        name='post_detail'
+    ),
+    path(
+        'posts/<int:post_id>/related/',
+        query_budget(views.post_related, 2),
+        name='post_related'
+    ),
+    path(
+        'posts/<int:post_id>/comments/',
+        query_budget(views.post_comments, 3),
+        name='post_comments'
+    ),
+    path(
+        'search/',
+        query_budget(views.post_search, 4),
+        name='search'
+    ),
+    path(
+        'create/',
+        query_budget(views.post_create, 11),
+        name='post_create'
+    ),
+    path(
+        'posts/<int:post_id>/edit/',
+        query_budget(views.post_edit, 10),
+        name='post_edit'
+    ),
+    path(
+        'posts/<int:post_id>/comment/',
+        query_budget(views.add_comment, 6),
+        name='add_comment'
+    ),
+    path(
+        'follow/',
+        query_budget(views.follow_index, 4),
+        name='follow_index'
+    ),
     path(
         'profile/<str:username>/follow/',
-        views.profile_follow,
+        query_budget(views.profile_follow, 10),
         name='profile_follow'
     ),
     path(
         'profile/<str:username>/unfollow/',
-        views.profile_unfollow,
+        query_budget(views.profile_unfollow, 8),
         name='profile_unfollow'
     ),
 ]
@@ -1,27 +1,32 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core.db import retry_on_lock
+
+from . import archive, caching, counters, feed, search, similarity
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
+from .models import Comment, Follow, Group, Post
+from .paginator import (CursorPaginator, decode_cursor, lazy_paginate,
+                        paginate)
+from .uploads import limit_uploads
 
 User = get_user_model()
 
-LAST_POSTS = 10
-
 
 def index(request):
     """
     Вернет главную страницу с десятью последними постами.
     """
-    post = Post.objects.select_related('group')
-    paginator = Paginator(post, LAST_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    post = feed.scatter(Post.objects.for_feed())
+    page_obj = lazy_paginate(request, post, settings.LAST_POSTS)
     context = {
         'page_obj': page_obj,
+        'fragment_key': caching.fragment_key(request, 'global'),
+        'fragment_timeout': caching.fragment_timeout(),
     }
+    caching.cache_page_scopes(request, 'global')
     return render(request, 'posts/index.html', context)
 
 
@@ -30,38 +35,66 @@ def group_posts(request, slug):
     Вернет страницу группы с десятью последними постами.
     """
     group = get_object_or_404(Group, slug=slug)
-    paginator = Paginator(group.posts.all(), LAST_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = lazy_paginate(
+        request,
+        feed.scatter(group.posts.for_feed()),
+        settings.LAST_POSTS,
+        count=group.posts_count,
+    )
     context = {
         'group': group,
         'page_obj': page_obj,
+        'fragment_key': caching.fragment_key(request, f'group:{group.id}'),
+        'fragment_timeout': caching.fragment_timeout(),
     }
+    caching.cache_page_scopes(request, f'group:{group.id}')
     return render(request, 'posts/group_list.html', context)
 
 
+def post_search(request):
+    """
+    Вернет посты со словами из ?q= по убыванию релевантности.
+    """
+    query = request.GET.get('q', '').strip()
+    paginator = CursorPaginator(
+        search.SearchResults(search.fts_query(query)),
+        settings.LAST_POSTS,
+        after=decode_cursor(request.GET.get('after'), search.parse_rank),
+        before=decode_cursor(request.GET.get('before'), search.parse_rank),
+        field='search_rank',
+    )
+    context = {'query': query, 'page_obj': paginator.page()}
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@limit_uploads
+@retry_on_lock
 def post_create(request):
     """
     Вернет форму создания поста.
     """
     if request.method == 'POST':
-        form = PostForm(request.POST, files=request.FILES or None)
+        form = PostForm(
+            request.POST,
+            files=request.FILES or None,
+            instance=Post(author=request.user),
+        )
         if not form.is_valid():
             return render(request, 'posts/create_post.html', {'form': form})
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
+        form.save()
         return redirect('posts:profile', request.user.username)
     form = PostForm()
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@limit_uploads
+@retry_on_lock
 def post_edit(request, post_id):
     """Позволяет редактировать пост."""
-    post = get_object_or_404(Post, id=post_id)
-    if request.user != post.author:
+    post = get_object_or_404(Post.objects.on_post(post_id), id=post_id)
+    if request.user.id != post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
@@ -79,45 +112,105 @@ def profile(request, username):
     Вернет страницу автора поста.
     """
     author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, LAST_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    stats = counters.author_stats(author.id)
+    post_list = feed.archived(author.posts.for_feed())
+    page_obj = lazy_paginate(
+        request, post_list, settings.LAST_POSTS, count=stats.posts_count
+    )
     following = request.user.is_authenticated
     if following:
         following = author.following.filter(user=request.user).exists()
     context = {
         'author': author,
+        'stats': stats,
         'page_obj': page_obj,
         'following': following,
+        'fragment_key': caching.fragment_key(request, f'author:{author.id}'),
+        'fragment_timeout': caching.fragment_timeout(),
     }
+    caching.cache_page_scopes(request, f'author:{author.id}')
     return render(request, 'posts/profile.html', context)
 
 
 def post_detail(request, post_id):
     """
     Вернет страницу поста автора.
+    Пост из архива открывается только для чтения, без формы
+    комментария.
     """
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
-    form = CommentForm()
+    post = archive.get_object_or_404(
+        Post.objects.on_post(post_id).select_related('author', 'group'),
+        pk=post_id,
+    )
+    comments = comments_page(post.comments.all())
+    form = None if archive.is_archived(post) else CommentForm()
     author = post.author
     context = {
         'author': author,
+        'stats': counters.author_stats(author.id),
         'post': post,
         'comments': comments,
         'form': form,
     }
+    caching.cache_page_scopes(
+        request,
+        f'post:{post.id}',
+        f'author:{author.id}',
+        f'group:{post.group_id}',
+    )
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_related(request, post_id):
+    """
+    Вернет HTML-фрагмент с похожими постами.
+
+    Похожие посты меняются с новыми постами других авторов, поэтому
+    страница поста подгружает их отдельно, а не хранит в своем кэше.
+    """
+    related = similarity.related_posts(post_id, settings.RELATED_POSTS)
+    return render(
+        request, 'posts/includes/related.html', {'related': related})
+
+
+def comments_page(comments, after=None):
+    """
+    Вернет страницу комментариев, от новых к старым,
+    с авторами, загруженными тем же запросом.
+    """
+    paginator = CursorPaginator(
+        comments.select_related('author'),
+        settings.LAST_COMMENTS,
+        after=after,
+        field='created',
+    )
+    return paginator.page()
+
+
+def post_comments(request, post_id):
+    """
+    Вернет HTML-фрагмент с более старыми комментариями к посту.
+    Если в горячей базе комментариев не нашлось, пост может быть
+    в архиве.
+    """
+    rows = Comment.objects.on_post(post_id).filter(post_id=post_id)
+    after = decode_cursor(request.GET.get('after'))
+    comments = comments_page(rows, after=after)
+    if not comments.object_list and archive.is_enabled():
+        comments = comments_page(rows.using(archive.alias()), after=after)
+    caching.cache_page_scopes(request, f'post:{post_id}')
+    context = {'comments': comments, 'post_id': post_id}
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
+@retry_on_lock
 def add_comment(request, post_id):
     """
     Добавит комментарий к посту.
     """
     if request.method == 'POST':
-        post = get_object_or_404(Post, id=post_id)
+        post = get_object_or_404(Post.objects.on_post(post_id), id=post_id)
         form = CommentForm(request.POST or None)
         if form.is_valid():
             comment = form.save(commit=False)
@@ -134,16 +227,14 @@ def follow_index(request):
     """
     Вернет страницу постов по подписке.
     """
-    posts = Post.objects.filter(
-        author__following__user=request.user)
-    paginator = Paginator(posts, LAST_POSTS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = feed.follow_feed(request.user)
+    page_obj = paginate(request, posts, settings.LAST_POSTS)
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@retry_on_lock
 def profile_follow(request, username):
     """
     Подписка на автора.
@@ -155,6 +246,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@retry_on_lock
 def profile_unfollow(request, username):
     """
     Отписка от автора.
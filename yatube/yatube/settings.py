@@ -46,13 +46,17 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail'
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'posts.middleware.AnonymousPageCacheMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -88,9 +92,69 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # В продакшене соединение живет между запросами: PRAGMA
+        # и кэш страниц SQLite не пропадают после каждого ответа.
+        'CONN_MAX_AGE': 0 if DEBUG else 60 * 10,
     }
 }
 
+# Реплики для чтения — псевдонимы из DATABASES, например копия
+# базы, которую обновляет команда sync_replicas:
+#     'replica': {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+#         'TEST': {'MIRROR': 'default'},
+#     }
+# Пустой список — все читается из default.
+DATABASE_REPLICAS = []
+
+# Шарды постов — псевдонимы из DATABASES, в том числе default.
+# Посты автора, их комментарии и ленты лежат в шарде
+# DATABASE_SHARDS[author_id % N]; пользователи и группы копируются
+# во все шарды. Пустой список — все посты в default.
+DATABASE_SHARDS = []
+
+# Архив старых постов — псевдоним из DATABASES. Команда archive_posts
+# переносит туда посты старше ARCHIVE_AFTER_DAYS дней вместе
+# с комментариями, а ленты читают архив, только когда страница
+# заходит за эту границу. None — архива нет. Срок можно уменьшать,
+# но не увеличивать: посты младше новой границы уже в архиве.
+ARCHIVE_DATABASE = None
+
+ARCHIVE_AFTER_DAYS = 365
+
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+
+# С реплик читают GET-запросы к страницам этих пространств имен URL.
+REPLICA_NAMESPACES = ('posts', 'api')
+
+# Сколько секунд после записи сессия читает с основной базы.
+REPLICA_STICKY_SECONDS = 30
+
+# PRAGMA для каждого нового соединения SQLite. В продакшене журнал
+# WAL: читатели не ждут писателя, а писатель ждет соседа до
+# busy_timeout миллисекунд вместо ошибки «database is locked».
+# Режим WAL сохраняется в файле базы, поэтому при разработке
+# база остается в обычном режиме.
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+SQLITE_PRAGMAS = {} if DEBUG else SQLITE_PRODUCTION_PRAGMAS
+
+# Повторы пишущих представлений, если база все же занята:
+# число повторов и первая пауза в секундах, дальше она удваивается.
+DATABASE_WRITE_RETRIES = 3
+
+DATABASE_WRITE_RETRY_DELAY = 0.05
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -147,14 +211,66 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 LAST_SYMBOLS = 15
 
+LAST_POSTS = 10
+
+LAST_COMMENTS = 20
+
+# Сколько похожих постов показывать на странице поста.
+RELATED_POSTS = 5
+
+# Почти одинаковые посты отклоняются: текст не короче
+# DUPLICATE_POST_MIN_WORDS слов сверяется с постами всех авторов
+# за DUPLICATE_POST_WINDOW секунд и с постами того же автора
+# за DUPLICATE_POST_AUTHOR_WINDOW.
+DUPLICATE_POST_MIN_WORDS = 8
+
+DUPLICATE_POST_WINDOW = 60 * 60
+
+DUPLICATE_POST_AUTHOR_WINDOW = 60 * 60 * 24 * 7
+
+# Начиная с этого числа подписчиков посты автора не разносятся
+# по лентам при записи, а подмешиваются в ленту при чтении.
+FEED_CELEBRITY_FOLLOWERS = 10000
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# Время жизни страниц в кэше для анонимных посетителей, 0 — отключено.
+PAGE_CACHE_TIMEOUT = 60 * 5
+
+# Сколько помнить области анонимной страницы, чтобы отвечать 304
+# на If-None-Match и If-Modified-Since без ее отрисовки.
+PAGE_VALIDATOR_TIMEOUT = 60 * 60 * 24
+
+# Подсчет SQL-запросов на страницу и поиск N+1 при разработке.
+QUERY_BUDGET_ENABLED = DEBUG
+
+QUERY_BUDGET_STRICT = False
+
+# Потоки для фонового создания миниатюр. При 0 миниатюра создается
+# в потоке запроса после отправки ответа и к следующей странице готова.
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+# Ширины вариантов миниатюры для srcset.
+THUMBNAIL_WIDTHS = (480, 960)
+
+# Форматы вариантов для <source> в порядке предпочтения браузером.
+# Создаются, только если их умеют сохранять и Pillow, и sorl-thumbnail.
+THUMBNAIL_FORMATS = ('WEBP',)
+
+# Дополнительные геометрии для прогрева командой warm_thumbnails,
+# например ('300x300',). Основная, 960x339, прогревается всегда.
+THUMBNAIL_EXTRA_GEOMETRIES = ()